@@ -1,4 +1,6 @@
 import json
+import os
+import sys
 import time
 import threading
 import logging
@@ -8,6 +10,9 @@ import subprocess
 
 import paho.mqtt.client as mqtt
 from datetime import datetime, timedelta
+# modules shared by the services, see middleware/common/README.md
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import payload_codec
 from ErrorLogger import initialize_error_logger, send_error_log, ERROR_TYPE_MINOR, ERROR_TYPE_MAJOR, ERROR_TYPE_CRITICAL, ERROR_TYPE_WARNING
 
 # --- Setup Logging ---
@@ -415,7 +420,8 @@ def on_message_control(client, userdata, msg):
     """Handle control messages (device data from subscribed topics)"""
     try:
         topic = msg.topic
-        payload = msg.payload.decode()
+        # device messages may be binary (payload_format msgpack/cbor), they are decoded by payload_codec
+        payload = msg.payload.decode(errors="replace")
 
         if device_topic_logging_enabled:
             log_simple(f"Control Message: {topic} - {payload}")
@@ -435,22 +441,23 @@ def on_message_control(client, userdata, msg):
 
         # Handle device data from subscribed topics
         try:
-            device_message = json.loads(payload)
+            device_message = payload_codec.loads(msg.payload)
 
             device_topic = topic
 
             # Extract numeric data from the message
-            if 'value' in device_message:
-                if isinstance(device_message['value'], str):
-                    try:
-                        device_data = json.loads(device_message['value'])
-                    except json.JSONDecodeError:
-                        if "success" in device_message['value'].lower() or "error" in device_message['value'].lower():
-                            log_simple(f"Skipping status message: {device_message['value']}", "INFO")
-                            return
-                        device_data = device_message
-                else:
-                    device_data = device_message['value']
+            if isinstance(device_message, dict) and 'value' in device_message:
+                # JSON string (legacy), object or schema array, see payload_codec
+                try:
+                    device_data = payload_codec.values(device_message)
+                except ValueError:
+                    if "success" in device_message['value'].lower() or "error" in device_message['value'].lower():
+                        log_simple(f"Skipping status message: {device_message['value']}", "INFO")
+                        return
+                    device_data = device_message
+                if device_data is None:
+                    # array frame of a schema not announced yet
+                    return
             else:
                 device_data = device_message
 
@@ -476,7 +483,7 @@ def on_message_control(client, userdata, msg):
                 'topic': topic
             })
 
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             log_simple(f"Failed to parse device message JSON: {e}", "ERROR")
         except Exception as e:
             log_simple(f"Error processing device message: {e}", "ERROR")
@@ -195,9 +195,12 @@ def load_installed_devices(config_path):
 
 # Save installed devices to file
 def save_installed_devices(config_path, devices):
+    # Written to a temporary file then renamed: the MODBUS_SNMP poller reloads installed_devices.json
+    # as soon as it changes and must never read it half written
     try:
-        with open(config_path, 'w') as file:
+        with open(config_path + '.tmp', 'w') as file:
             json.dump(devices, file, indent=4)
+        os.replace(config_path + '.tmp', config_path)
     except IOError as e:
         error_msg = f"Error saving devices: {e}"
         send_error_log("save_installed_devices", error_msg, "error", {"file_path": config_path})
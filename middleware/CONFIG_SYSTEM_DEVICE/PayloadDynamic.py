@@ -5,6 +5,10 @@ import threading
 import os
 from datetime import datetime
 from collections import OrderedDict
+import sys
+# modules shared by the services, see middleware/common/README.md
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import payload_codec
 
 # Paths to configuration and devices files
 summary_config_path = './JSON/payloadDynamicConfig.json'
@@ -231,14 +235,15 @@ def handle_device_info_message(client, payload):
 # Handle device messages
 def handle_device_message(client, userdata, msg):
     try:
-        device_data = json.loads(msg.payload.decode())
+        # any payload_format, see payload_codec
+        device_data = payload_codec.loads(msg.payload)
         if isinstance(device_data, dict):
             # print(f"Received message from {msg.topic}: {device_data}")
             process_device_message(device_data, msg.topic)
         else:
             print(f"Unexpected data format in message from {msg.topic}: {device_data}")
-    except json.JSONDecodeError:
-        print(f"Failed to decode JSON from {msg.topic}: {msg.payload.decode()}")
+    except ValueError:
+        print(f"Failed to decode JSON from {msg.topic}: {msg.payload.decode(errors='replace')}")
 
 def perform_calculation(operation, values):
     """Perform mathematical operations like sum, average, multiply, and divide."""
@@ -312,14 +317,16 @@ def filter_and_rename_device_value(device_data, value_keys):
             # print("Error: 'value' key is missing in device data")
             return filtered_value  # Return empty filtered_value if "value" is missing
 
-        # Use value_data directly if it's a dictionary; otherwise, decode it from JSON
-        value_data = device_data["value"] if isinstance(device_data["value"], dict) else json.loads(device_data["value"])
+        # JSON string (legacy), object or schema array, see payload_codec
+        value_data = payload_codec.values(device_data)
+        if value_data is None:
+            return filtered_value  # array frame of a schema not announced yet
 
         # Rename and extract specified keys
         for original_key, custom_key in value_keys.items():
             if original_key in value_data:
                 filtered_value[custom_key] = value_data[original_key]
-    except (json.JSONDecodeError, TypeError) as e:
+    except (ValueError, TypeError) as e:
         print("Error decoding value JSON:", e)
     return filtered_value
 
@@ -4,6 +4,10 @@ import time
 import logging
 import threading
 from datetime import datetime
+import sys
+# modules shared by the services, see middleware/common/README.md
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import payload_codec
 
 # Try to import paho.mqtt.client
 try:
@@ -687,7 +691,8 @@ def on_message_remap(client, userdata, msg):
     """Handle remap messages"""
     try:
         topic = msg.topic
-        payload = msg.payload.decode()
+        # device messages may be binary (payload_format msgpack/cbor), they are decoded by payload_codec
+        payload = msg.payload.decode(errors="replace")
 
         # Only log command messages, not device topic messages
         if topic == topic_command:
@@ -721,7 +726,7 @@ def on_message_remap(client, userdata, msg):
 
         else:
             # Handle device topic subscription and remapping
-            handle_device_topic_data(client, topic, payload)
+            handle_device_topic_data(client, topic, msg.payload)
 
     except Exception as e:
         log_simple(f"Error handling remap message: {e}", "ERROR")
@@ -811,8 +816,8 @@ def handle_device_topic_data(client, topic, payload):
             log_simple(f"Device Data: {topic} - {payload}")
 
         try:
-            # Parse the main device message
-            device_message = json.loads(payload)
+            # Parse the main device message, any payload_format
+            device_message = payload_codec.loads(payload)
 
             # Find matching config and device for this topic
             for remap_config in config:
@@ -826,17 +831,20 @@ def handle_device_topic_data(client, topic, payload):
                         # Use device-level key mappings
                         key_mappings = device.get('key_mappings', [])
 
-                        # Parse the nested "value" field which contains sensor data as JSON string
+                        # Parse the nested "value" field which contains the sensor data
                         remapped_data = {}
                         sensor_data = {}
 
                         if 'value' in device_message:
                             try:
-                                # The 'value' field is a JSON string, parse it to get sensor data
-                                sensor_data = json.loads(device_message['value'])
-                            except json.JSONDecodeError:
+                                # JSON string (legacy), object or schema array, see payload_codec
+                                sensor_data = payload_codec.values(device_message)
+                            except ValueError:
                                 log_simple(f"Failed to parse value field as JSON: {device_message['value']}", "ERROR")
                                 continue
+                            if sensor_data is None:
+                                # array frame of a schema not announced yet
+                                continue
 
                         # Apply key mappings from sensor data
                         for mapping in key_mappings:
@@ -860,7 +868,7 @@ def handle_device_topic_data(client, topic, payload):
 
                         break  # Assume one config per topic
 
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             log_simple(f"Failed to parse device message JSON: {e}", "ERROR")
         except Exception as e:
             log_simple(f"Error processing device message: {e}", "ERROR")
@@ -253,11 +253,16 @@ def save_json_config(filepath, config_data):
     """
     Saves a dictionary as a JSON file to the specified filepath.
     Ensures the directory exists before writing.
+    The file is written to a temporary file and renamed over the target, so the services
+    reading it (e.g. the SNMP agent reading Comm.json) never see a truncated file.
     """
     try:
         os.makedirs(os.path.dirname(filepath), exist_ok=True) # Create directory if it doesn't exist
-        with open(filepath, 'w') as file:
+        with open(filepath + '.tmp', 'w') as file:
             json.dump(config_data, file, indent=4) # Write JSON with 4-space indentation
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(filepath + '.tmp', filepath)
         logging.info(f"Configuration saved to {filepath}")
         return True
     except Exception as e:
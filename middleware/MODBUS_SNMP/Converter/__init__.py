@@ -340,4 +340,104 @@ def STRINGtoUINT16(string_val, big_endian=True):
                 uint16_val = (uint8_list[i] << 8)
             uint16_list.append(uint16_val)
         uint16_list = uint16_list[::-1]
-    return uint16_list
\ No newline at end of file
+    return uint16_list
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ BATCH DECODER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# Decodes every numeric variable of a contiguous register block at once with
+# typed numpy views instead of one struct.pack/unpack per value.
+
+# Number of registers and big endian numpy type of each batch data type
+BATCH_TYPES = {
+    "INT16": (1, ">i2"), "UINT16": (1, ">u2"), "FLOAT16": (1, ">f2"),
+    "INT32": (2, ">i4"), "UINT32": (2, ">u4"), "FLOAT32": (2, ">f4"),
+    "INT64": (4, ">i8"), "UINT64": (4, ">u8"), "FLOAT64": (4, ">f8"),
+}
+
+# Distance to .5 of a scaled value under which np.rint may round differently from round()
+HALFWAY = 1e-6
+# Magnitude from which a float64 has no fraction digits left to round
+ROUNDLIMIT = 2.0 ** 52
+
+
+class BatchLayout(object):
+    # Index arrays of one register block, compiled once and reused for every poll
+    def __init__(self, fields, big_endian=True, byte_swap=False):
+        # Arguments:
+        # fields    :   list of (name, offset, data_type, multiplier), offset in registers from the block start
+        # big_endian:   Word order of the device memory structure
+        #               True  >>  most significant register first
+        #               False >>  least significant register first
+        # byte_swap :   True  >>  the two bytes of every register are swapped by the device
+        self.big_endian = big_endian
+        self.byte_swap = byte_swap
+
+        by_type = {}
+        for position, (name, offset, data_type, multiplier) in enumerate(fields):
+            if data_type not in BATCH_TYPES:
+                raise ValueError("data type " + str(data_type) + " cannot be batch decoded")
+            by_type.setdefault(data_type, []).append((position, int(offset), multiplier))
+
+        # (index array (n, width), numpy type, start, stop, has integer results) of every data type,
+        # values of one data type are decoded into [start:stop] of a single float64 array
+        self.groups = []
+        # position in that array of every field, in the order of fields
+        order = []
+        multipliers = []
+        integer = []
+        for data_type, items in by_type.items():
+            width, np_type = BATCH_TYPES[data_type]
+            words = np.arange(width) if big_endian else np.arange(width)[::-1]
+            index = np.array([offset for _, offset, _ in items], dtype=np.intp)[:, None] + words
+            start = len(order)
+            for position, offset, multiplier in items:
+                order.append(position)
+                multipliers.append(multiplier)
+                # integer values with an integer multiplier are returned as int, like round(int * 10, n)
+                integer.append(isinstance(multiplier, (int, np.integer)) and np_type[1] != "f")
+            self.groups.append((index, np.dtype(np_type), start, len(order), any(integer[start:])))
+
+        self.names = [fields[position][0] for position in order]
+        # multipliers as given, the integer results are computed with them from the raw value
+        self.factors = [int(m) if flag else m for m, flag in zip(multipliers, integer)]
+        self.multipliers = np.array(multipliers, dtype=np.float64)
+        self.integer = np.array(integer, dtype=bool)
+        self.size = max([int(group[0].max()) + 1 for group in self.groups] or [0])
+
+
+def decode_batch(registers, layout, roundto=3):
+    # Arguments:
+    # registers :   list or array of uint16 of the whole block
+    # layout    :   BatchLayout of the block
+    # roundto   :   number of digits after decimal point
+    # Return    :   dictionary of variable name and its value
+
+    regs = np.asarray(registers, dtype=np.uint16)
+    if len(regs) < layout.size:
+        raise ValueError("block has %d registers, layout needs %d" % (len(regs), layout.size))
+    if layout.byte_swap:
+        regs = regs.byteswap()
+    # big endian bytes of every register, word order is handled by the index arrays
+    regs = regs.astype(">u2")
+
+    values = np.empty(len(layout.names), dtype=np.float64)
+    raw = None
+    scale = 10.0 ** roundto
+    with np.errstate(invalid='ignore', over='ignore'):
+        for index, np_type, start, stop, has_integer in layout.groups:
+            typed = regs[index].view(np_type).reshape(stop - start)
+            values[start:stop] = typed
+            if has_integer:
+                if raw is None:
+                    raw = [None] * len(values)
+                raw[start:stop] = typed.tolist()
+
+        values *= layout.multipliers
+        shifted = values * scale
+        result = (np.rint(shifted) / scale).tolist()
+        # np.rint matches round() except near a halfway value (and past 2**52 or inf/nan), those few
+        # values are taken from round(), the integers with an integer multiplier from the exact product
+        fixup = layout.integer | ~(np.abs(shifted - np.floor(shifted) - 0.5) > HALFWAY) \
+            | ~(np.abs(shifted) < ROUNDLIMIT)
+    for i in np.flatnonzero(fixup).tolist():
+        result[i] = raw[i] * layout.factors[i] if layout.integer[i] else round(float(values[i]), roundto)
+    return dict(zip(layout.names, result))
@@ -0,0 +1,171 @@
+from Converter import *
+from Protocols.modbus_rtu import DataTypes, HOLDINGREG, INPUTREG, INT16, INT32, INT64, UINT16, UINT32, UINT64, \
+    FLOAT16, FLOAT32, FLOAT64, STRING
+
+# Modbus limit for a single FC3/FC4 request
+MAXBLOCKSIZE = 125
+# Default number of unused registers that may be read to join two variables in one block
+GAPTOLERANCE = 0
+
+FUNCTIONCODE = {HOLDINGREG: 3, INPUTREG: 4}
+
+# Number of registers used by each data type (STRING takes its word_length from the library)
+REGISTER_WIDTH = {
+    INT16: 1, UINT16: 1, FLOAT16: 1,
+    INT32: 2, UINT32: 2, FLOAT32: 2,
+    INT64: 4, UINT64: 4, FLOAT64: 4,
+}
+
+
+class Block(object):
+    def __init__(self, functioncode, start):
+        # Arguments:
+        # functioncode      :   3 >> Holding Register, 4 >> Input Register
+        # start             :   first register address of the block
+        self.functioncode = functioncode
+        self.start = start
+        self.count = 0
+        # (var_name, offset in block, word_length, data_type, multiplier)
+        self.vars = []
+        # Converter.BatchLayout of the numeric vars by byte order, compiled on first decode
+        self.layouts = {}
+
+    @property
+    def end(self):
+        return self.start + self.count
+
+    def add(self, var_name, address, word_length, data_type, multiplier):
+        self.vars.append((var_name, address - self.start, word_length, data_type, multiplier))
+        self.count = max(self.count, address + word_length - self.start)
+
+    def layout(self, big_endian):
+        # Return            :   BatchLayout of every variable except STRING
+        if big_endian not in self.layouts:
+            self.layouts[big_endian] = BatchLayout(
+                [(var_name, offset, data_type, multiplier)
+                 for var_name, offset, word_length, data_type, multiplier in self.vars if data_type != STRING],
+                big_endian)
+        return self.layouts[big_endian]
+
+    def __repr__(self):
+        return "Block(fc=%d, start=%d, count=%d, vars=%d)" % (self.functioncode, self.start, self.count, len(self.vars))
+
+
+class ReadPlan(object):
+    def __init__(self, blocks, order):
+        # blocks    :   list of Block, in the order they are read
+        # order     :   list of variable names in the order of the old per-data-type reads,
+        #               so downstream consumers see the same key order as before
+        self.blocks = blocks
+        self.order = order
+
+    def __len__(self):
+        return len(self.blocks)
+
+
+def plan_blocks(var_list, gap_tolerance=GAPTOLERANCE, max_block_size=MAXBLOCKSIZE):
+    # Arguments:
+    # var_list          :   list of variables of the device library ("data" of devices.json)
+    # gap_tolerance     :   maximum number of unused registers allowed between two variables of one block
+    # max_block_size    :   maximum number of registers read in one request (<= 125)
+    # Return            :   ReadPlan with the minimal set of block reads for Holding and Input Registers
+    #
+    # Variables of every data type are merged as long as they share the function code, are
+    # adjacent (or within gap_tolerance) and the block stays within max_block_size.
+
+    max_block_size = max(1, min(int(max_block_size), MAXBLOCKSIZE))
+    gap_tolerance = max(0, int(gap_tolerance))
+
+    by_function = {3: [], 4: []}
+    order = {INPUTREG: {ITEM: [] for ITEM in DataTypes}, HOLDINGREG: {ITEM: [] for ITEM in DataTypes}}
+    for var in var_list:
+        register_type = var['register_type']
+        data_type = var['data_type']
+        if register_type not in FUNCTIONCODE or data_type not in DataTypes:
+            continue
+        address = int(var['relative_address'])
+        if data_type == STRING:
+            word_length = int(var['word_length'])
+            multiplier = 1
+        else:
+            word_length = REGISTER_WIDTH[data_type]
+            multiplier = var['multiplier']
+        by_function[FUNCTIONCODE[register_type]].append((address, word_length, var['var_name'], data_type, multiplier))
+        order[register_type][data_type].append((address, var['var_name']))
+
+    blocks = []
+    for functioncode in [4, 3]:
+        block = None
+        for address, word_length, var_name, data_type, multiplier in sorted(by_function[functioncode], key=lambda x: x[0]):
+            if block is not None \
+                    and address - block.end <= gap_tolerance \
+                    and max(block.end, address + word_length) - block.start <= max_block_size:
+                block.add(var_name, address, word_length, data_type, multiplier)
+            else:
+                block = Block(functioncode, address)
+                block.add(var_name, address, word_length, data_type, multiplier)
+                blocks.append(block)
+
+    # Same key order as the previous read_<DATATYPE> loops: Input then Holding, by data type, by address
+    var_order = []
+    for register_type in [INPUTREG, HOLDINGREG]:
+        for each_type in DataTypes:
+            var_order.extend([name for _, name in sorted(order[register_type][each_type], key=lambda x: x[0])])
+
+    return ReadPlan(blocks, var_order)
+
+
+def decode_value(registers, data_type, big_endian, multiplier, roundto=3):
+    # Arguments:
+    # registers         :   list of uint16 of one variable
+    # data_type         :   one of DataTypes
+    # big_endian        :   byte order of the device memory structure
+    # multiplier        :   multiplier of the variable
+    # roundto           :   number of digits after decimal point
+    # Return            :   decoded value
+
+    if data_type == STRING:
+        return UINT16toSTRING(registers, big_endian)
+    elif data_type == UINT16:
+        value = registers[0]
+    elif data_type == INT16:
+        value = UINT16toINT16(registers)[0]
+    elif data_type == UINT32:
+        value = UINT16toINT32(registers, big_endian, False)[0]
+    elif data_type == INT32:
+        value = UINT16toINT32(registers, big_endian, True)[0]
+    elif data_type == UINT64:
+        value = UINT16toINT64(registers, big_endian, False)[0]
+    elif data_type == INT64:
+        value = UINT16toINT64(registers, big_endian, True)[0]
+    elif data_type == FLOAT16:
+        value = UINT16toFLOAT16(registers)[0]
+    elif data_type == FLOAT32:
+        value = UINT16toFLOAT32(registers, big_endian)[0]
+    elif data_type == FLOAT64:
+        value = UINT16toFLOAT64(registers, big_endian)[0]
+    return round(value * multiplier, roundto)
+
+
+def decode_blocks(plan, buffers, big_endian, roundto=3, failed_value=9999):
+    # Arguments:
+    # plan              :   ReadPlan
+    # buffers           :   list of uint16 lists, one per block of the plan (None for a failed block)
+    # big_endian        :   byte order of the device memory structure
+    # roundto           :   number of digits after decimal point
+    # failed_value      :   value of every variable of a failed block
+    # Return            :   dictionary of variable name and its value
+
+    values = {}
+    for block, registers in zip(plan.blocks, buffers):
+        if registers is None:
+            for var_name, offset, word_length, data_type, multiplier in block.vars:
+                values[var_name] = failed_value
+            continue
+        # numeric variables in one vectorized pass, strings one by one
+        values.update(decode_batch(registers, block.layout(big_endian), roundto))
+        for var_name, offset, word_length, data_type, multiplier in block.vars:
+            if data_type == STRING:
+                values[var_name] = decode_value(registers[offset:offset + word_length], data_type, big_endian,
+                                                multiplier, roundto)
+    return {var_name: values[var_name] for var_name in plan.order if var_name in values}
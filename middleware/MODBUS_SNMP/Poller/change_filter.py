@@ -0,0 +1,135 @@
+import re
+import time
+
+# Report by exception between poll() and publish, enabled in mqtt_config.json:
+# "report_by_exception"     :   true to publish only what changed, default false (every poll is published)
+# "report_mode"             :   "full" (default) publishes the whole frame when a field changed,
+#                               "delta" publishes only the changed fields on <topic>/delta
+# "report_heartbeat"        :   seconds, the whole frame is published at least this often
+#
+# A variable of the device library may carry a deadband, a change smaller than it is not reported:
+# "deadband"                :   absolute deadband, in the unit of the value
+# "deadband_percent"        :   deadband in percent of the last published value
+DELTA = "delta"
+FULL = "full"
+HEARTBEAT = 300
+DELTA_TOPIC = "/delta"
+DEADBAND_FIELDS = ["deadband", "deadband_percent"]
+
+# Fields of every frame that are never compared, they change on every poll
+VOLATILE = ["Timestamp", "PollingDuration"]
+
+# "<variable name>_<row>" of a table variable
+TABLE_ROW = re.compile(r"^(.*)_\d+$")
+
+
+def strip_deadband(var):
+    # Return            :   variable of the device library without its deadband fields,
+    #                       data_mapper reads the fields by position
+    if not any(field in var for field in DEADBAND_FIELDS):
+        return var
+    return {key: value for key, value in var.items() if key not in DEADBAND_FIELDS}
+
+
+def compile_deadbands(data_lib):
+    # Return            :   dictionary of variable name and (absolute deadband, percent deadband)
+    deadbands = {}
+    for var in data_lib or []:
+        absolute = float(var.get("deadband", 0))
+        percent = float(var.get("deadband_percent", 0))
+        if absolute != 0 or percent != 0:
+            deadbands[var["var_name"]] = (absolute, percent)
+    return deadbands
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def report_config(mqtt_config):
+    # Return            :   (mode, heartbeat), mode None when every poll is published
+    if not mqtt_config.get("report_by_exception", False):
+        return None, HEARTBEAT
+    return mqtt_config.get("report_mode", FULL), float(mqtt_config.get("report_heartbeat", HEARTBEAT))
+
+
+class ChangeFilter(object):
+    def __init__(self, data_lib):
+        # Arguments:
+        # data_lib          :   list of variables of the device library, for their deadbands
+        self.deadbands = compile_deadbands(data_lib)
+        # key of the frame >> deadband, table rows "<name>_<row>" use the deadband of <name>
+        self._deadband_of = {}
+        # item index of the poll result >> {key: last published value}
+        self.last = {}
+        # item index of the poll result >> time of the last full frame
+        self.last_full = {}
+
+    def deadband(self, key):
+        deadband = self._deadband_of.get(key)
+        if deadband is None:
+            deadband = self.deadbands.get(key)
+            if deadband is None:
+                match = TABLE_ROW.match(key)
+                deadband = self.deadbands.get(match.group(1)) if match else None
+            self._deadband_of[key] = deadband = deadband or (0.0, 0.0)
+        return deadband
+
+    def crossed(self, key, old, new):
+        # Return            :   True when new has to be reported after old
+        if is_number(old) and is_number(new):
+            absolute, percent = self.deadband(key)
+            change = abs(new - old)
+            if change == 0:
+                return False
+            return change > absolute and change > abs(old) * percent / 100.0
+        return old != new
+
+    def changes(self, index, data):
+        # Return            :   dictionary of the fields of data to report
+        last = self.last.get(index, {})
+        return {key: value for key, value in data.items()
+                if key not in VOLATILE and (key not in last or self.crossed(key, last[key], value))}
+
+    def frames(self, items, mode, heartbeat=HEARTBEAT):
+        # Arguments:
+        # items             :   result of poll(), list of {"data": {...}, ...}
+        # mode              :   DELTA, FULL or None to publish every frame
+        # heartbeat         :   longest time in seconds without a full frame
+        # Return            :   list of (topic suffix, data) to publish, "" for the topic of the device
+        result = []
+        now = time.monotonic()
+        for index, item in enumerate(items):
+            data = item["data"]
+            if mode is None:
+                result.append(("", data))
+                continue
+
+            changed = self.changes(index, data)
+            if index not in self.last or now - self.last_full[index] >= heartbeat:
+                # first frame and heartbeat: everything, the deadbands restart from these values
+                self.last[index] = {key: value for key, value in data.items() if key not in VOLATILE}
+                self.last_full[index] = now
+                result.append(("", data))
+            elif len(changed) != 0:
+                self.last[index].update(changed)
+                if mode == FULL:
+                    result.append(("", data))
+                else:
+                    for key in VOLATILE:
+                        if key in data:
+                            changed[key] = data[key]
+                    result.append((DELTA_TOPIC, changed))
+        return result
+
+
+def frames(change_filter, items, mqtt_config):
+    # Arguments:
+    # change_filter     :   ChangeFilter of the device, None to publish every frame
+    # items             :   result of poll()
+    # mqtt_config       :   MQTT service config
+    # Return            :   list of (topic suffix, data) to publish
+    if change_filter is None:
+        return [("", item["data"]) for item in items]
+    mode, heartbeat = report_config(mqtt_config)
+    return change_filter.frames(items, mode, heartbeat)
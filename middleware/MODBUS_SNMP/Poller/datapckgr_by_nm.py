@@ -1784,3 +1784,12 @@ class OUTLET_LT3_SPM20(Device):
         data.append(new_data)
 
         return data
+
+
+# PACKAGER REGISTRY
+# device name >> packager class, resolved once per device instead of exec() on every poll
+PACKAGERS = {NAME: globals()[NAME] for NAME in NAME_LIST if NAME in globals()}
+
+def get_packager(name):
+    # Return    :   packager instance of the device, the general Device class if not registered
+    return PACKAGERS.get(name, Device)()
@@ -4,6 +4,7 @@ import pprint
 from re import L
 import traceback
 from unicodedata import decimal
+from Poller.packager_spec import Packager, Bits, BitText, Enum, Unit
 pp = pprint.PrettyPrinter(indent=4)
 
 ####################################### DEVICE CLASS #######################################
@@ -70,285 +71,74 @@ class STMicroelectronics_LIS3DHTR(object):
     def write(self):
         pass
 
-class Shoto_SDA10_48100(object):
-    def __init__(self, protocol):
-        self.protocol = protocol
-
-    def process_raw_data(self, raw_data):
-        data = {}
-        System_Event = {
-            "Over Voltage Protect" :0,
-            "Under Voltage Protect" :0,
-            "Charge over current Protect" :0,
-            "Discharge over current Protect" :0,
-            "Short/Reverse circuit Protect" :0,
-            "High temperature Protect" :0,
-            "SOC Low alarm" :0,
-            "Discharging" :0,
-            "Chargeing" :0,
-            "Charge Online" :0
-        }
-        System_Event["Over Voltage Protect"] = readbitval(raw_data["System Event"], 0)
-        System_Event["Under Voltage Protect"] = readbitval(raw_data["System Event"], 1)
-        System_Event["Charge over current Protect"] = readbitval(raw_data["System Event"], 2)
-        System_Event["Discharge over current Protect"] = readbitval(raw_data["System Event"], 3)
-        System_Event["Short/Reverse circuit Protect"] = readbitval(raw_data["System Event"], 4)
-        System_Event["High temperature Prtect"] = readbitval(raw_data["System Event"], 5)
-        System_Event["SOC Low alarm"] = readbitval(raw_data["System Event"], 6)
-        System_Event["Discharging"] = readbitval(raw_data["System Event"], 7)
-        System_Event["Chargeing"] = readbitval(raw_data["System Event"], 8)
-        System_Event["Charge Online"] = readbitval(raw_data["System Event"], 9)
-
-        raw_data["System Event"] = System_Event
-
-        data = dict(raw_data)
-        return data
-
-    def write(self):
-        pass
-
-class Pilot_DFPM971(object):
-    def __init__(self, protocol):
-        self.protocol = protocol
-
-    def process_raw_data(self, raw_data):
-        data = {}
-        
-        alarm_status = {
-            "Phase A voltage overvoltage" : 0, 
-            "Phase B voltage overvoltage" : 0, 
-            "Phase C voltage overvoltage" : 0, 
-            "Phase A voltage undervoltage" : 0, 
-            "Phase B voltage undervoltage" : 0, 
-            "Phase C voltage undervoltage" : 0,
-            "Voltage phase loss"           : 0, 
-            "Phase A current overcurrent"   : 0, 
-            "Phase B current overcurrent"   : 0, 
-            "Phase C current overcurrent"   : 0, 
-            "Phase A current undercurrent"  : 0, 
-            "Phase B current undercurrent"  : 0,
-            "Phase C current undercurrent"  : 0, 
-            "Overload"                      : 0,
-            "Frequency is too high"         : 0, 
-            "Frequency is too low"          : 0, 
-            "Leakage current overcurrent"   : 0, 
-            "Temperature 1 over temperature": 0, 
-            "Temperature 2 over temperature": 0,
-            "Temperature 3 over temperature": 0, 
-            "Temperature 4 over temperature": 0, 
-            "Switch value 1 off"            : 0
-            }
-        
-        alarm_status["Phase A voltage overvoltage"] = readbitval(raw_data["Alarm status"], 0)
-        alarm_status["Phase B voltage overvoltage"] = readbitval(raw_data["Alarm status"], 1)
-        alarm_status["Phase C voltage overvoltage"] = readbitval(raw_data["Alarm status"], 2)
-        alarm_status["Phase A voltage undervoltage"] = readbitval(raw_data["Alarm status"], 3)
-        alarm_status["Phase B voltage undervoltage"] = readbitval(raw_data["Alarm status"], 4)
-        alarm_status["Phase C voltage undervoltage"] = readbitval(raw_data["Alarm status"], 5)
-        alarm_status["Voltage phase loss"]           = readbitval(raw_data["Alarm status"], 6)
-        alarm_status["Phase A current overcurrent"] = readbitval(raw_data["Alarm status"], 7)
-        alarm_status["Phase B current overcurrent"] = readbitval(raw_data["Alarm status"], 8)
-        alarm_status["Phase C current overcurrent"] = readbitval(raw_data["Alarm status"], 9)
-        alarm_status["Phase A current undercurrent"] = readbitval(raw_data["Alarm status"], 10)
-        alarm_status["Phase B current undercurrent"] = readbitval(raw_data["Alarm status"], 11)
-        alarm_status["Phase C current undercurrent"] = readbitval(raw_data["Alarm status"], 12)
-        alarm_status["Overloade"]                    = readbitval(raw_data["Alarm status"], 13)
-        alarm_status["Frequency is too high"] = readbitval(raw_data["Alarm status"], 14)
-        alarm_status["Frequency is too low"] = readbitval(raw_data["Alarm status"], 15)
-        alarm_status["Leakage current overcurrent"] = readbitval(raw_data["Alarm status"], 16)
-        alarm_status["Temperature 1 over temperature"] = readbitval(raw_data["Alarm status"], 17)
-        alarm_status["Temperature 2 over temperature"] = readbitval(raw_data["Alarm status"], 18)
-        alarm_status["Temperature 3 over temperature"] = readbitval(raw_data["Alarm status"], 19)
-        alarm_status["Temperature 4 over temperature"] = readbitval(raw_data["Alarm status"], 20)
-        alarm_status["Switch value 1 off"] = readbitval(raw_data["Alarm status"], 21)
-
-        raw_data["Alarm status"] = alarm_status
-        
-        wiring_mode = ["Four-line star", ": Three-line triangle"]
-        raw_data["Wiring mode"] = wiring_mode[raw_data["Wiring mode"]]
-
-        phase = ["","Phase A", "Phase B", "Phase C"]
-        raw_data["A phase current phase sequence adjustment"] = phase[raw_data["A phase current phase sequence adjustment"]]
-        raw_data["B phase current phase sequence adjustment"] = phase[raw_data["B phase current phase sequence adjustment"]]
-        raw_data["C phase current phase sequence adjustment"] = phase[raw_data["C phase current phase sequence adjustment"]]
-
-        demand_mode = ["fixed_mode", "slip mode"]
-        raw_data["Demand mode"] = demand_mode[raw_data["Demand mode"]]
-      
-        raw_data["Demand cycle"] = str(raw_data["Demand cycle"]) + " min"
-
-        raw_data["Slip time"] = str(raw_data["Slip time"]) + " min"
-
-        Whether_the_pulse_is_on = ["closed", "open"]
-        raw_data["Whether the pulse is on"] = Whether_the_pulse_is_on[raw_data["Whether the pulse is on"]]
-
-        Pulse_output_method = ["active pulse output", "Reactive pulse output"]
-        raw_data["Pulse output method"] = Pulse_output_method[raw_data["Pulse output method"]]
-
-        data = dict(raw_data)
-        return data
-
-    def write(self):
-        pass
-
-class Pilot_DFPM20D(object):
-    def __init__(self, protocol):
-        self.protocol = protocol
-
-    def process_raw_data(self, raw_data):
-        data = {}
-
-        Voltage_Over_Limit_Alarm_Status = {
-            "Low Voltage Alarm" : 0,
-            "High Voltage Alarm" : 0
-        }
-        Voltage_Over_Limit_Alarm_Status["Low Voltage Alarm"] = readbitval(raw_data["Voltage Over Limit Alarm Status"], 0)
-        Voltage_Over_Limit_Alarm_Status["High Voltage Alarm"] = readbitval(raw_data["Voltage Over Limit Alarm Status"], 1)
-
-        raw_data["Voltage Over Limit Alarm Status"] = Voltage_Over_Limit_Alarm_Status
-
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status = {
-            "Branch Circuit 1" : 0,
-            "Branch Circuit 2" : 0,
-            "Branch Circuit 3" : 0,
-            "Branch Circuit 4" : 0,
-            "Branch Circuit 5" : 0,
-            "Branch Circuit 6" : 0,
-            "Branch Circuit 7" : 0,
-            "Branch Circuit 8" : 0,
-            "Branch Circuit 9" : 0,
-            "Branch Circuit 10" : 0,
-            "Branch Circuit 11" : 0,
-            "Branch Circuit 12" : 0,
-        }
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 1"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 0)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 2"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 1)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 3"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 2)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 4"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 3)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 5"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 4)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 6"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 5)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 7"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 6)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 8"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 7)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 9"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 8)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 10"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 9)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 11"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 10)
-        Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status["Branch Circuit 12"] = readbitval(raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"], 11)
-
-        raw_data["Branch Circuit 1~12 Current Over Limit Alarm Status"] = Branch_Circuit_1_12_Current_Over_Limit_Alarm_Status
-
-        Branch_Circuit_1_12_Communication_Failure_status = {
-            "Branch Circuit 1" : 0,
-            "Branch Circuit 2" : 0,
-            "Branch Circuit 3" : 0,
-            "Branch Circuit 4" : 0,
-            "Branch Circuit 5" : 0,
-            "Branch Circuit 6" : 0,
-            "Branch Circuit 7" : 0,
-            "Branch Circuit 8" : 0,
-            "Branch Circuit 9" : 0,
-            "Branch Circuit 10" : 0,
-            "Branch Circuit 11" : 0,
-            "Branch Circuit 12" : 0,
-        }
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 1"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 0)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 2"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 1)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 3"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 2)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 4"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 3)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 5"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 4)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 6"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 5)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 7"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 6)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 8"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 7)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 9"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 8)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 10"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 9)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 11"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 10)
-        Branch_Circuit_1_12_Communication_Failure_status["Branch Circuit 12"] = readbitval(raw_data["Branch Circuit 1~12 Communication Failure Status"], 11)
-
-        raw_data["Branch Circuit 1~12 Communication Failure Status"] = Branch_Circuit_1_12_Communication_Failure_status
-
-        baud_rate = ["4800","9600","19200"]
-        raw_data["Communication Baudrate"] = baud_rate[raw_data["Communication Baudrate"]]
-
-        data = dict(raw_data)
-        return data
-
-    def write(self):
-        pass
-
-class Pilot_PMAC770(object):
-    def __init__(self, protocol):
-        self.protocol = protocol
-
-    def process_raw_data(self, raw_data):
-        data = {}
-
-        Phase_voltage_deviation = ["Va", "Vb", "Vc"]
-
-        #for i in range(30):
-        #    print(raw_data["Phase voltage deviation " + str(i+1)])
-        #    raw_data["Phase voltage deviation " + str(i+1)] = Phase_voltage_deviation[raw_data["Phase voltage deviation " + str(i+1)]]
-        Connection_mode = ["3 phase 4 wire", "3 phase 3 wire", "single phase"]
-        raw_data["Connection mode"] = Connection_mode[raw_data["Connection mode"]]
-
-        Demand_calculation_mode = ["Fixed block", "Rolling block"]
-        raw_data["Demand calculation mode"] = Demand_calculation_mode[raw_data["Demand calculation mode"]]
-
-        Demand_interval = ["5min", "10min", "15min", "30min", "60min"] 
-        raw_data["Demand interval"] = Demand_interval[raw_data["Demand interval"]]
-
-        Subinterval = ["1min", "2min", "3min", "5min"] 
-        raw_data["Subinterval"] = Subinterval[raw_data["Subinterval"]]
-
-        Object_analog_output = ["Null", "Va", "Vb", "Vc", "Vab", "Vbc", "Vca", "Ia", "Ib", "Ic", "Ptot", "Qtot", "PFtot", "Frequency"]
-        raw_data["Object, analog output-1"] = Object_analog_output[raw_data["Object, analog output-1"]]
-        raw_data["Object, analog output-2"] = Object_analog_output[raw_data["Object, analog output-2"]]
-
-        Control_mode_relay = ["Local", "Remote"]
-        raw_data["Control mode, relay-1"] = Control_mode_relay[raw_data["Control mode, relay-1"]]
-        raw_data["Control mode, relay-2"] = Control_mode_relay[raw_data["Control mode, relay-2"]]
-        raw_data["Control mode, relay-3"] = Control_mode_relay[raw_data["Control mode, relay-3"]]
-        raw_data["Control mode, relay-4"] = Control_mode_relay[raw_data["Control mode, relay-4"]]
-
-
-        object_relay = ["Null", "Frequency", "Va", "Vb", "Vc", "Neutral voltage", "Average Vph-N", "Vab", "Vbc", "Vca", "Average Vph-ph", "Ia", "Ib", "Ic", "Neutral current", "Average current", "PFa", "PFb", 
-                        "PFc", "PFtot", "Voltage unbalance", "THD for Va", "THD for Vb", "THD for VC", "THD for Ia", "THD for Ib", "THD for Ic"]
-        raw_data["Object, relay-1"] = object_relay[raw_data["Object, relay-1"]]
-        raw_data["Object, relay-2"] = object_relay[raw_data["Object, relay-2"]]
-        raw_data["Object, relay-3"] = object_relay[raw_data["Object, relay-3"]]
-        raw_data["Object, relay-4"] = object_relay[raw_data["Object, relay-4"]]
-
-        running_mode = ["No", "Voltage", "Current", "Power"]
-        raw_data["Running Mode"] = running_mode[raw_data["Running Mode"]]
-        
-        data = dict(raw_data)
-        return data
-
-    def write(self):
-        pass
-
-class Pilot_SPM90_DFPM90(object):
-    def __init__(self, protocol):
-        self.protocol = protocol
-
-    def process_raw_data(self, raw_data):
-        data = {}
-
-        measurement_voltage_direction = ["measurement voltage is positive", "measurement voltage is reversed"]
-        raw_data["Measuring voltage direction"] =  measurement_voltage_direction[raw_data["Measuring voltage direction"]]
-
-        baud_rate = ["2400","4800","9600","19200"]
-        raw_data["Baud rate"] = baud_rate[raw_data["Baud rate"]]
-
-        wiring = ["Standart Wiring", "Non Standart Wiring"]
-        raw_data["Wiring"] = wiring[raw_data["Wiring"]]
-
-        Communication_default= ["modbus", "DLT645"]
-        raw_data["Communication default"] = Communication_default[raw_data["Communication default"]]
-
-        data = dict(raw_data)
-        return data
-
-    def write(self):
-        pass
+class Shoto_SDA10_48100(Packager):
+    FIELDS = {
+        "System Event": Bits(["Over Voltage Protect", "Under Voltage Protect", "Charge over current Protect",
+                              "Discharge over current Protect", "Short/Reverse circuit Protect", "High temperature Protect",
+                              "SOC Low alarm", "Discharging", "Chargeing", "Charge Online"]),
+    }
+
+class Pilot_DFPM971(Packager):
+    PHASE = ["", "Phase A", "Phase B", "Phase C"]
+    FIELDS = {
+        "Alarm status": Bits(["Phase A voltage overvoltage", "Phase B voltage overvoltage", "Phase C voltage overvoltage",
+                              "Phase A voltage undervoltage", "Phase B voltage undervoltage", "Phase C voltage undervoltage",
+                              "Voltage phase loss", "Phase A current overcurrent", "Phase B current overcurrent",
+                              "Phase C current overcurrent", "Phase A current undercurrent", "Phase B current undercurrent",
+                              "Phase C current undercurrent", "Overload", "Frequency is too high",
+                              "Frequency is too low", "Leakage current overcurrent", "Temperature 1 over temperature",
+                              "Temperature 2 over temperature", "Temperature 3 over temperature", "Temperature 4 over temperature",
+                              "Switch value 1 off"]),
+        "Wiring mode": Enum(["Four-line star", ": Three-line triangle"]),
+        "A phase current phase sequence adjustment": Enum(PHASE),
+        "B phase current phase sequence adjustment": Enum(PHASE),
+        "C phase current phase sequence adjustment": Enum(PHASE),
+        "Demand mode": Enum(["fixed_mode", "slip mode"]),
+        "Demand cycle": Unit(" min"),
+        "Slip time": Unit(" min"),
+        "Whether the pulse is on": Enum(["closed", "open"]),
+        "Pulse output method": Enum(["active pulse output", "Reactive pulse output"]),
+    }
+
+class Pilot_DFPM20D(Packager):
+    BRANCH_CIRCUITS = ["Branch Circuit %d" % (i + 1) for i in range(12)]
+    FIELDS = {
+        "Voltage Over Limit Alarm Status": Bits(["Low Voltage Alarm", "High Voltage Alarm"]),
+        "Branch Circuit 1~12 Current Over Limit Alarm Status": Bits(BRANCH_CIRCUITS),
+        "Branch Circuit 1~12 Communication Failure Status": Bits(BRANCH_CIRCUITS),
+        "Communication Baudrate": Enum(["4800", "9600", "19200"]),
+    }
+
+class Pilot_PMAC770(Packager):
+    OBJECT_ANALOG_OUTPUT = ["Null", "Va", "Vb", "Vc", "Vab", "Vbc", "Vca", "Ia", "Ib", "Ic", "Ptot", "Qtot", "PFtot", "Frequency"]
+    CONTROL_MODE_RELAY = ["Local", "Remote"]
+    OBJECT_RELAY = ["Null", "Frequency", "Va", "Vb", "Vc", "Neutral voltage", "Average Vph-N", "Vab", "Vbc", "Vca", "Average Vph-ph", "Ia", "Ib", "Ic", "Neutral current", "Average current", "PFa", "PFb",
+                    "PFc", "PFtot", "Voltage unbalance", "THD for Va", "THD for Vb", "THD for VC", "THD for Ia", "THD for Ib", "THD for Ic"]
+    FIELDS = {
+        "Connection mode": Enum(["3 phase 4 wire", "3 phase 3 wire", "single phase"]),
+        "Demand calculation mode": Enum(["Fixed block", "Rolling block"]),
+        "Demand interval": Enum(["5min", "10min", "15min", "30min", "60min"]),
+        "Subinterval": Enum(["1min", "2min", "3min", "5min"]),
+        "Object, analog output-1": Enum(OBJECT_ANALOG_OUTPUT),
+        "Object, analog output-2": Enum(OBJECT_ANALOG_OUTPUT),
+        "Control mode, relay-1": Enum(CONTROL_MODE_RELAY),
+        "Control mode, relay-2": Enum(CONTROL_MODE_RELAY),
+        "Control mode, relay-3": Enum(CONTROL_MODE_RELAY),
+        "Control mode, relay-4": Enum(CONTROL_MODE_RELAY),
+        "Object, relay-1": Enum(OBJECT_RELAY),
+        "Object, relay-2": Enum(OBJECT_RELAY),
+        "Object, relay-3": Enum(OBJECT_RELAY),
+        "Object, relay-4": Enum(OBJECT_RELAY),
+        "Running Mode": Enum(["No", "Voltage", "Current", "Power"]),
+    }
+
+class Pilot_SPM90_DFPM90(Packager):
+    FIELDS = {
+        "Measuring voltage direction": Enum(["measurement voltage is positive", "measurement voltage is reversed"]),
+        "Baud rate": Enum(["2400", "4800", "9600", "19200"]),
+        "Wiring": Enum(["Standart Wiring", "Non Standart Wiring"]),
+        "Communication default": Enum(["modbus", "DLT645"]),
+    }
 
 # General Device Class
 class Pilot_SPM206(object):
@@ -657,65 +447,35 @@ class Device(object):
         pass
 
 ####################################### Controller #######################################
-class ABB_CMS700(Device):
-    def process_raw_data(self, raw_data):
-        if self.protocol == "Modbus RTU":
-            data = {}
-
-            ListBranchesAlarmStatus = [ "No Alarm",
-                                    None, None, None, None, None, None, None, None, None, None,
-                                    "Over Current TRMS", "Under Current TRMS",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over Active power P", "Under Active power P"
-                                    ]
-
-            raw_data["Alarm Status Branch 1"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 1"]]
-            raw_data["Alarm Status Branch 2"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 2"]]
-            raw_data["Alarm Status Branch 3"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 3"]]
-            raw_data["Alarm Status Branch 4"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 4"]]
-            raw_data["Alarm Status Branch 5"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 5"]]
-            raw_data["Alarm Status Branch 6"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 6"]]
-            raw_data["Alarm Status Branch 7"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 7"]]
-            raw_data["Alarm Status Branch 8"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 8"]]
-            raw_data["Alarm Status Branch 9"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 9"]]
-            raw_data["Alarm Status Branch 10"] = ListBranchesAlarmStatus[raw_data["Alarm Status Branch 10"]]
-
-
-            ListMainAlarmStatus = [ "No Alarm",
-                                    None, None, None, None, None, None, None, None, None, None,
-                                    "Over Current", "Under Current",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over THD Current", "Under THD Current",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over Voltage", "Under Voltage",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over THD Voltage", "Under THD Voltage",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over Active Power", "Under Active Power",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over Apparent Power", "Under Apparent Power",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over Reactive Power", "Under Reactive Power",
-                                    None, None, None, None, None, None, None ,None,
-                                    "Over Power factor", "Under Power factor",
-                                    None, None, None, None, None, None, None ,None,
-                                    None, None, None, None, None, None, None ,None, None, None,
-                                    None, None, None, None, None, None, None ,None, None, None,
-                                    None, None, None, None, None, None, None ,None, None, None,
-                                    "Over Active Energy", "Under Active Energy"
-                                    ]
-
-            raw_data["Alarm Status Line L1"] = ListMainAlarmStatus[raw_data["Alarm Status Line L1"]]
-            raw_data["Alarm Status Line L2"] = ListMainAlarmStatus[raw_data["Alarm Status Line L2"]]
-            raw_data["Alarm Status Line L3"] = ListMainAlarmStatus[raw_data["Alarm Status Line L3"]]
-            raw_data["Alarm Status Line  L4/N"] = ListMainAlarmStatus[raw_data["Alarm Status Line  L4/N"]]
-
-            
-
-            data = raw_data
-            return data
-        else:
-            return -1
+class ABB_CMS700(Packager):
+    PROTOCOLS = ["Modbus RTU"]
+    BRANCH_ALARM_STATUS = {0: "No Alarm", 11: "Over Current TRMS", 12: "Under Current TRMS",
+                           21: "Over Active power P", 22: "Under Active power P"}
+    MAIN_ALARM_STATUS = {0: "No Alarm", 11: "Over Current", 12: "Under Current",
+                         21: "Over THD Current", 22: "Under THD Current",
+                         31: "Over Voltage", 32: "Under Voltage",
+                         41: "Over THD Voltage", 42: "Under THD Voltage",
+                         51: "Over Active Power", 52: "Under Active Power",
+                         61: "Over Apparent Power", 62: "Under Apparent Power",
+                         71: "Over Reactive Power", 72: "Under Reactive Power",
+                         81: "Over Power factor", 82: "Under Power factor",
+                         121: "Over Active Energy", 122: "Under Active Energy"}
+    FIELDS = {
+        "Alarm Status Branch 1": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 2": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 3": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 4": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 5": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 6": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 7": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 8": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 9": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Branch 10": Enum(BRANCH_ALARM_STATUS),
+        "Alarm Status Line L1": Enum(MAIN_ALARM_STATUS),
+        "Alarm Status Line L2": Enum(MAIN_ALARM_STATUS),
+        "Alarm Status Line L3": Enum(MAIN_ALARM_STATUS),
+        "Alarm Status Line  L4/N": Enum(MAIN_ALARM_STATUS),
+    }
 
 class Schneider_ATV320(object):
     def __init__(self, protocol):
@@ -3160,175 +2920,68 @@ class M4M30(Device):
             return data
         else:
             return -1
-class Socomec_DIRIS_A20(Device):
-    def process_raw_data(self, raw_data):
-        if self.protocol == "Modbus RTU":
-            data = {}
-
-            TotalPowerFactorType = ["undefined", "leading", "lagging"]
-            raw_data["Total Power Factor Type"] = TotalPowerFactorType[raw_data["Total Power Factor Type"]]
-            raw_data["Power factor type : sPF1"] = TotalPowerFactorType[raw_data["Power factor type : sPF1"]]
-            raw_data["Power factor type : sPF2"] = TotalPowerFactorType[raw_data["Power factor type : sPF2"]]
-            raw_data["Power factor type : sPF3"] = TotalPowerFactorType[raw_data["Power factor type : sPF3"]]
-             
-            alarmonthreshold =  ["No Alarm", "I1", "I2", "I3", "IN", "V L1-L2", "V L2-L3", "V L3-L4",
-                                    "?P+", "?Q+", "?S", "F", "?PFL", None, None, "thdl1", "thdl2", "thdl3", "thd V L1-L2",
-                                    "thd V L2-L3", "thd V L3-L1", "Hour", "V1", "V2", "V3", None, "thd V1", "thd V2",
-                                    "thd V3", None, None, "?PFC"]
-            raw_data["Current alarm on lower threshold cause"] = alarmonthreshold[raw_data["Current alarm on lower threshold cause"]]
-            raw_data["Current alarm on upper threshold cause"] = alarmonthreshold[raw_data["Current alarm on upper threshold cause"]]
-
-            data = raw_data
-            return data
-        else:
-            return -1
-
-class Schneider_PM5100_PM5300(Device):
-    def process_raw_data(self, raw_data):
-        if self.protocol == "Modbus RTU":
-            data = {}
-            
-            ### Total Power Factor Type
-            TotalPowerFactorType = ["1ph 2W, LN", "1ph 2W, LL", "1ph, 3w, LL with N ( 2phase)", "3ph, 3w, Delta, Ungrounded",
-                                    "3ph, 3w, Delta, Corner Grounded", "3ph, 3w, Wye, Ungrounded", "3ph, 3w, Wye Grounded", "3ph, 3w, Wye, Resistance Grounded",
-                                    "3ph, 4w, Open Delta, Center-Tapped", "3ph, 4w, Delta, Center-Tapped", "3ph, 4w, Wye, Ungrounded",
-                                    "3ph, 4w, Wye Grounded", "3ph, 4w, Wye, Resistance Grounded", "Multi-Circuit 3 circuit LN",
-                                    "Multi-Circuit 2 Circuit LN ( Not used )", "Multi-Circuit 1 Cicuit LN ( Not used )", "Multi-Circuit 3 Circuit LL ( Not used )",
-                                    "Multi-Circuit 2 Circuit LL ( Not used )", "Multi-Circuit 1 Circuit LL ( Not used )",
-                                    "Multi-Circuit 1 Circuit LL 1 Circuit LN ( Not used )", "Multi-Circuit Wye"]
-            raw_data["Power System Configuration"] = TotalPowerFactorType[raw_data["Power System Configuration"]]
-
-            ### CT Location for 1  or 2 CT Metering
-            CTLocationfor1or2CTMetering = ["Phase A", "Phase B", "Phase C"]
-            raw_data["CT Location for 1  or 2 CT Metering"] = CTLocationfor1or2CTMetering[raw_data["CT Location for 1  or 2 CT Metering"]]
-
-            ### VT Connection Type
-            VTConnectionType = ["Direct Connect", "Delata", "Wye", "L-N", "L-L", "l-l W/N"]
-            raw_data["VT Connection Type"] = VTConnectionType[raw_data["VT Connection Type"]]
-             
-            ### Energy Channel Channel 1
-            EnergyChannelChannel1 = ["Not Used", "Active Energy Delivered (Into Load)", "Active Energy Received (Out of Load)",
-                                    "Active Energy Delivered + Received", "Reactive Energy Delivered", "Reactive Energy Received", 
-                                    "Reactive Energy Delivered + Received", "Apparent Energy Delivered", "Apparent Energy Received", 
-                                    "Apparent Energy Delivered + Received", "Active Energy Delivered Phase A", "Active Energy Delivered Phase B"
-                                    "Active Energy Delivered Phase C", "Reactive Energy Delivered Phase A", "Reactive Energy Delivered Phase B",
-                                    "Reactive Energy Delivered Phase C", "Apparent Energy Delivered Phase A", "Apparent Energy Delivered Phase B",
-                                    "Apparent Energy Delivered Phase C"]
-            raw_data["Energy Channel Channel 1"] = EnergyChannelChannel1[raw_data["Energy Channel Channel 1"]]
-
-            ### Energy Channel Channel 2
-            EnergyChannelChannel2 = ["Not Used", "Active Energy Delivered (Into Load)", "Active Energy Received (Out of Load)",
-                                    "Active Energy Delivered + Received", "Reactive Energy Delivered", "Reactive Energy Received", 
-                                    "Reactive Energy Delivered + Received", "Apparent Energy Delivered", "Apparent Energy Received", 
-                                    "Apparent Energy Delivered + Received", "Active Energy Delivered Phase A", "Active Energy Delivered Phase B"
-                                    "Active Energy Delivered Phase C", "Reactive Energy Delivered Phase A", "Reactive Energy Delivered Phase B",
-                                    "Reactive Energy Delivered Phase C", "Apparent Energy Delivered Phase A", "Apparent Energy Delivered Phase B",
-                                    "Apparent Energy Delivered Phase C"]
-            raw_data["Energy Channel Channel 2"] = EnergyChannelChannel2[raw_data["Energy Channel Channel 2"]]
-
-            ### Energy Channel Channel 3
-            EnergyChannelChannel3 = ["Not Used", "Active Energy Delivered (Into Load)", "Active Energy Received (Out of Load)",
-                                    "Active Energy Delivered + Received", "Reactive Energy Delivered", "Reactive Energy Received", 
-                                    "Reactive Energy Delivered + Received", "Apparent Energy Delivered", "Apparent Energy Received", 
-                                    "Apparent Energy Delivered + Received", "Active Energy Delivered Phase A", "Active Energy Delivered Phase B"
-                                    "Active Energy Delivered Phase C", "Reactive Energy Delivered Phase A", "Reactive Energy Delivered Phase B",
-                                    "Reactive Energy Delivered Phase C", "Apparent Energy Delivered Phase A", "Apparent Energy Delivered Phase B",
-                                    "Apparent Energy Delivered Phase C"]
-            raw_data["Energy Channel Channel 3"] = EnergyChannelChannel2[raw_data["Energy Channel Channel 3"]]
-
-            data = raw_data
-            return data
-        else:
-            return -1
-
-class PM800(Device):
-    def process_raw_data(self, raw_data):
-        if self.protocol == "Modbus RTU":
-            data = {}
-
-            ### Metering System Type
-            if raw_data["Metering System Type"] == 10:
-                raw_data["Metering System Type"] = "1PH2W1CT (L-N)"
-            elif raw_data["Metering System Type"] == 11:
-                raw_data["Metering System Type"] = "1PH2W1CT (L-L)"
-            elif raw_data["Metering System Type"] == 12:
-                raw_data["Metering System Type"] = "1PH3W2CT"
-            elif raw_data["Metering System Type"] == 30:
-                raw_data["Metering System Type"] = "3PH3W2CT"
-            elif raw_data["Metering System Type"] == 31:
-                raw_data["Metering System Type"] = "3PH3W3CT"
-            elif raw_data["Metering System Type"] == 32:
-                raw_data["Metering System Type"] = "3PH3W1CT"
-            elif raw_data["Metering System Type"] == 40:
-                raw_data["Metering System Type"] = "3PH4W3CT (default)"
-            elif raw_data["Metering System Type"] == 42:
-                raw_data["Metering System Type"] = "3PH4W3CT2PT"
-            elif raw_data["Metering System Type"] == 44:
-                raw_data["Metering System Type"] = "3PH4W1CT3PT"
-
-            ### CT Phase Selection
-            CTPhaseSelection = ["Phase A", "Phase B", "Phase C"]
-            raw_data["CT Phase Selection"] = CTPhaseSelection[raw_data["CT Phase Selection"]]
-            
-            ### Operating Mode Parameters 
-            OperatingModeParameters_List0 = [None, "Reactive Energy & Demand Accumulation Fund", "IEEE Convention",
-                                            None, None, None, 
-                                            "Conditional Energy Accumulation Control Input", None, "Display Setup Enabled",
-                                            "Normal Phase Rotation ABC", "THD (Fundamental)", None]
-            OperatingModeParameters_List1 = [None, "Reactive Energy & Demand Accumulation Harmonics Included", "IEC Convention",
-                                            None, None, None,
-                                            "Conditional Energy Accumulation Control Command", None, "Display Setup Disabled",
-                                            "Normal Phase Rotation CBA", "thd (% Total RMS)", None]
-
-            OperatingModeParameters = []
-            for each_bit in range(16):
-                bit_value = readbitval(raw_data["Operating Mode Parameters"], each_bit)
-                if bit_value == 1 and OperatingModeParameters_List1[each_bit] != None:
-                    OperatingModeParameters.append(OperatingModeParameters_List1[each_bit])
-                elif bit_value == 0 and OperatingModeParameters_List0[each_bit] != None:
-                    OperatingModeParameters.append(OperatingModeParameters_List0[each_bit])
-
-            if len(OperatingModeParameters) != 0:
-                raw_data["Operating Mode Parameters"] = ', '.join(OperatingModeParameters)
-            else:
-                raw_data["Operating Mode Parameters"] = None
-            
-            ### CT Phase Selection
-            PhaseRotationDirection = ["ABC", "CBA"]
-            raw_data["Phase Rotation Direction"] = PhaseRotationDirection[raw_data["Phase Rotation Direction"]]
-            
-            ### Active Alarm Status
-            ActiveAlarmStatus_list1 = ["any priority 1-3 alarm is active", "a “High” (1) priority alarm is active",
-                                "a “Medium” (2) priority alarm is active", "a “Low” (3) priority alarm is active"]
-            ActiveAlarmStatus = []
-            for each_bit in range(16):
-                bit_value = readbitval(raw_data["Active Alarm Status"], each_bit)
-                if bit_value == 1 and ActiveAlarmStatus_list1[each_bit] != None:
-                    ActiveAlarmStatus.append(ActiveAlarmStatus_list1[each_bit])
-
-            if len(ActiveAlarmStatus) != 0:
-                raw_data["Active Alarm Status"] = ', '.join(ActiveAlarmStatus)
-            else:
-                raw_data["Active Alarm Status"] = None
-            
-            ### Latched Active Alarm Status
-            LatchedActiveAlarmStatus_list1 = ["any priority 1-3 alarm is active", "a “High” (1) priority alarm is active",
-                                "a “Medium” (2) priority alarm is active", "a “Low” (3) priority alarm is active"]
-            LatchedActiveAlarmStatus = []
-            for each_bit in range(16):
-                bit_value = readbitval(raw_data["Latched Active Alarm Status"], each_bit)
-                if bit_value == 1 and LatchedActiveAlarmStatus_list1[each_bit] != None:
-                    LatchedActiveAlarmStatus.append(LatchedActiveAlarmStatus_list1[each_bit])
-
-            if len(LatchedActiveAlarmStatus) != 0:
-                raw_data["Latched Active Alarm Statuss"] = ', '.join(LatchedActiveAlarmStatus)
-            else:
-                raw_data["Latched Active Alarm Status"] = None
-
-            data = raw_data
-            return data
-        else:
-            return -1
+class Socomec_DIRIS_A20(Packager):
+    PROTOCOLS = ["Modbus RTU"]
+    POWER_FACTOR_TYPE = ["undefined", "leading", "lagging"]
+    ALARM_ON_THRESHOLD = ["No Alarm", "I1", "I2", "I3", "IN", "V L1-L2", "V L2-L3", "V L3-L4",
+                          "?P+", "?Q+", "?S", "F", "?PFL", None, None, "thdl1", "thdl2", "thdl3", "thd V L1-L2",
+                          "thd V L2-L3", "thd V L3-L1", "Hour", "V1", "V2", "V3", None, "thd V1", "thd V2",
+                          "thd V3", None, None, "?PFC"]
+    FIELDS = {
+        "Total Power Factor Type": Enum(POWER_FACTOR_TYPE),
+        "Power factor type : sPF1": Enum(POWER_FACTOR_TYPE),
+        "Power factor type : sPF2": Enum(POWER_FACTOR_TYPE),
+        "Power factor type : sPF3": Enum(POWER_FACTOR_TYPE),
+        "Current alarm on lower threshold cause": Enum(ALARM_ON_THRESHOLD),
+        "Current alarm on upper threshold cause": Enum(ALARM_ON_THRESHOLD),
+    }
+
+class Schneider_PM5100_PM5300(Packager):
+    PROTOCOLS = ["Modbus RTU"]
+    ENERGY_CHANNEL = ["Not Used", "Active Energy Delivered (Into Load)", "Active Energy Received (Out of Load)",
+                      "Active Energy Delivered + Received", "Reactive Energy Delivered", "Reactive Energy Received",
+                      "Reactive Energy Delivered + Received", "Apparent Energy Delivered", "Apparent Energy Received",
+                      "Apparent Energy Delivered + Received", "Active Energy Delivered Phase A", "Active Energy Delivered Phase B",
+                      "Active Energy Delivered Phase C", "Reactive Energy Delivered Phase A", "Reactive Energy Delivered Phase B",
+                      "Reactive Energy Delivered Phase C", "Apparent Energy Delivered Phase A", "Apparent Energy Delivered Phase B",
+                      "Apparent Energy Delivered Phase C"]
+    FIELDS = {
+        "Power System Configuration": Enum(["1ph 2W, LN", "1ph 2W, LL", "1ph, 3w, LL with N ( 2phase)", "3ph, 3w, Delta, Ungrounded",
+                                            "3ph, 3w, Delta, Corner Grounded", "3ph, 3w, Wye, Ungrounded", "3ph, 3w, Wye Grounded", "3ph, 3w, Wye, Resistance Grounded",
+                                            "3ph, 4w, Open Delta, Center-Tapped", "3ph, 4w, Delta, Center-Tapped", "3ph, 4w, Wye, Ungrounded",
+                                            "3ph, 4w, Wye Grounded", "3ph, 4w, Wye, Resistance Grounded", "Multi-Circuit 3 circuit LN",
+                                            "Multi-Circuit 2 Circuit LN ( Not used )", "Multi-Circuit 1 Cicuit LN ( Not used )", "Multi-Circuit 3 Circuit LL ( Not used )",
+                                            "Multi-Circuit 2 Circuit LL ( Not used )", "Multi-Circuit 1 Circuit LL ( Not used )",
+                                            "Multi-Circuit 1 Circuit LL 1 Circuit LN ( Not used )", "Multi-Circuit Wye"]),
+        "CT Location for 1  or 2 CT Metering": Enum(["Phase A", "Phase B", "Phase C"]),
+        "VT Connection Type": Enum(["Direct Connect", "Delata", "Wye", "L-N", "L-L", "l-l W/N"]),
+        "Energy Channel Channel 1": Enum(ENERGY_CHANNEL),
+        "Energy Channel Channel 2": Enum(ENERGY_CHANNEL),
+        "Energy Channel Channel 3": Enum(ENERGY_CHANNEL),
+    }
+
+class PM800(Packager):
+    PROTOCOLS = ["Modbus RTU"]
+    ACTIVE_ALARM_STATUS = ["any priority 1-3 alarm is active", "a “High” (1) priority alarm is active",
+                           "a “Medium” (2) priority alarm is active", "a “Low” (3) priority alarm is active"]
+    FIELDS = {
+        "Metering System Type": Enum({10: "1PH2W1CT (L-N)", 11: "1PH2W1CT (L-L)", 12: "1PH3W2CT",
+                                      30: "3PH3W2CT", 31: "3PH3W3CT", 32: "3PH3W1CT",
+                                      40: "3PH4W3CT (default)", 42: "3PH4W3CT2PT", 44: "3PH4W1CT3PT"}),
+        "CT Phase Selection": Enum(["Phase A", "Phase B", "Phase C"]),
+        "Operating Mode Parameters": BitText(
+            [None, "Reactive Energy & Demand Accumulation Harmonics Included", "IEC Convention",
+             None, None, None,
+             "Conditional Energy Accumulation Control Command", None, "Display Setup Disabled",
+             "Normal Phase Rotation CBA", "thd (% Total RMS)", None],
+            [None, "Reactive Energy & Demand Accumulation Fund", "IEEE Convention",
+             None, None, None,
+             "Conditional Energy Accumulation Control Input", None, "Display Setup Enabled",
+             "Normal Phase Rotation ABC", "THD (Fundamental)", None]),
+        "Phase Rotation Direction": Enum(["ABC", "CBA"]),
+        "Active Alarm Status": BitText(ACTIVE_ALARM_STATUS),
+        "Latched Active Alarm Status": BitText(ACTIVE_ALARM_STATUS),
+    }
 
 ####################################### SWITCH #######################################
 class ABB_ATS022(Device):
@@ -3548,6 +3201,10 @@ class GPIO_Doorswitch(Device):
             return -1
 
 
+# PACKAGER REGISTRY
+# manufacturer_part_number >> packager class, resolved once per device instead of exec() on every poll
+PACKAGERS = {MANU_PN: globals()[MANU_PN] for MANU_PN in MANU_PN_LIST if MANU_PN in globals()}
 
-
-
+def get_packager(manufacturer, part_number, protocol):
+    # Return    :   packager instance of the device, the general Device class if not registered
+    return PACKAGERS.get(manufacturer + "_" + part_number, Device)(protocol)
@@ -1,7 +1,11 @@
 import os
 import json
+import pickle
 import pprint
+import sqlite3
 import sys
+import threading
+from contextlib import closing
 
 
 pp = pprint.PrettyPrinter(indent=4)
@@ -29,40 +33,116 @@ CANBUS = "CANBUS_SENSOR"
 
 PROTOCOLS = [MODBUS_RTU, MODBUS_TCP, SNMP, GPIO, CANBUS]
 
-# IMPORT DEVICES LIBRARY
+# Pickle protocol of the profiles in the index (4 is readable by every Python 3.4+)
+PICKLE_PROTOCOL = 4
+
+# DEVICES LIBRARY
+# devices.json (~1 MB) is only parsed when it changed: every profile is stored in an sqlite
+# side-file keyed by (device_type, manufacturer, part_number, protocol), and a poller loads
+# just the profile of its own device from there.
 
 ThisFolder = os.path.abspath('.')
 ParentFolder = os.path.abspath('..')
 
-LIB = {}
-ALL_DATA_FORMAT = {"Modbus RTU":{}, "Modbus TCP": {}, "SNMP":{}}
-with open(ThisFolder + '/JSON/Config/Library/devices.json') as json_data:
-    LIB = json.load(json_data)
-
-with open(ThisFolder + '/JSON/Config/Library/devices.json') as json_data:
-    ALL_DATA = json.load(json_data)
-for typeDevice in DEVICES:
-    ALL_DATA_FORMAT["Modbus RTU"][typeDevice] = []
-    ALL_DATA_FORMAT["Modbus TCP"][typeDevice] = []
-    ALL_DATA_FORMAT["SNMP"][typeDevice] = []
-    for nameDevice in ALL_DATA[typeDevice]:
-        nameDevice.pop("data")
-        if nameDevice["protocol"] == "Modbus RTU" :
-            ALL_DATA_FORMAT["Modbus RTU"][typeDevice].append(nameDevice)
-        elif nameDevice["protocol"] == "Modbus TCP" :
-            ALL_DATA_FORMAT["Modbus TCP"][typeDevice].append(nameDevice)
-        elif nameDevice["protocol"] == "SNMP" :
-            ALL_DATA_FORMAT["SNMP"][typeDevice].append(nameDevice)
-
-print(ALL_DATA_FORMAT)
-with open(ThisFolder + '/JSON/Config/Library/devices_summary.json', "w") as outfile:
-    outfile.write(json.dumps(ALL_DATA_FORMAT))
+LIBRARY_PATH = ThisFolder + '/JSON/Config/Library/devices.json'
+SUMMARY_PATH = ThisFolder + '/JSON/Config/Library/devices_summary.json'
+INDEX_PATH = ThisFolder + '/JSON/Config/Library/devices.index'
+
+# Bumped when the layout of the index changes, an older index is rebuilt
+INDEX_VERSION = 1
+
+_index_lock = threading.Lock()
+# In-memory index, only used when the side-file cannot be written (read-only filesystem)
+_memory_index = None
+
+
+def _library_stamp():
+    stat = os.stat(LIBRARY_PATH)
+    return "%d:%d:%d" % (INDEX_VERSION, stat.st_mtime_ns, stat.st_size)
+
+
+def _index_stamp():
+    try:
+        with closing(sqlite3.connect(INDEX_PATH)) as db:
+            return db.execute("SELECT value FROM meta WHERE key = 'stamp'").fetchone()[0]
+    except Exception:
+        return None
+
+
+def _summary(library):
+    # Same content as the previous devices_summary.json, read by CONFIG_SYSTEM_DEVICE
+    summary = {MODBUS_RTU: {}, MODBUS_TCP: {}, SNMP: {}}
+    for device_type in DEVICES:
+        for protocol in summary:
+            summary[protocol][device_type] = []
+        for item in library.get(device_type, []):
+            if item["protocol"] in summary:
+                summary[item["protocol"]][device_type].append({key: value for key, value in item.items() if key != "data"})
+    return summary
+
+
+def build_index():
+    # Parse devices.json once, write the sqlite index and devices_summary.json
+    global _memory_index
+
+    stamp = _library_stamp()
+    with open(LIBRARY_PATH) as json_data:
+        library = json.load(json_data)
+
+    # last entry wins on duplicated keys, like the previous linear search
+    rows = {}
+    for device_type, items in library.items():
+        for item in items:
+            key = (device_type, item["manufacturer"], item["part_number"], item["protocol"])
+            rows[key] = pickle.dumps(item["data"], PICKLE_PROTOCOL)
+
+    try:
+        temp_path = INDEX_PATH + ".tmp"
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        with closing(sqlite3.connect(temp_path)) as db:
+            db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE profiles (device_type TEXT, manufacturer TEXT, part_number TEXT, protocol TEXT, "
+                       "data BLOB, PRIMARY KEY (device_type, manufacturer, part_number, protocol))")
+            db.executemany("INSERT INTO profiles VALUES (?, ?, ?, ?, ?)", [key + (data,) for key, data in rows.items()])
+            db.execute("INSERT INTO meta VALUES ('stamp', ?)", (stamp,))
+            db.commit()
+        os.replace(temp_path, INDEX_PATH)
+        _memory_index = None
+    except Exception as e:
+        print("LIBS: cannot write " + INDEX_PATH + ", keeping the library index in memory: " + str(e))
+        _memory_index = (stamp, rows)
+
+    summary = json.dumps(_summary(library))
+    try:
+        with open(SUMMARY_PATH) as file:
+            unchanged = file.read() == summary
+    except Exception:
+        unchanged = False
+    if not unchanged:
+        with open(SUMMARY_PATH, "w") as outfile:
+            outfile.write(summary)
+
+
+def _ensure_index():
+    with _index_lock:
+        stamp = _library_stamp()
+        if _memory_index is not None and _memory_index[0] == stamp:
+            return
+        if _memory_index is None and _index_stamp() == stamp and os.path.exists(SUMMARY_PATH):
+            return
+        build_index()
+
 
 def get_device_data_lib(device_type, manufacturer, part_number, protocol):
-    FIND_RESULTS = LIB[device_type]
-    FOUND = None
-    for item in FIND_RESULTS:
-        if item["manufacturer"] == manufacturer and item["part_number"] == part_number \
-                and item["protocol"] == protocol:
-            FOUND = item["data"]
-    return FOUND
+    # Return    :   fresh copy of the "data" of the device profile, None if the library has no such profile
+    _ensure_index()
+    key = (device_type, manufacturer, part_number, protocol)
+    if _memory_index is not None:
+        data = _memory_index[1].get(key)
+    else:
+        with closing(sqlite3.connect(INDEX_PATH)) as db:
+            row = db.execute("SELECT data FROM profiles WHERE device_type = ? AND manufacturer = ? "
+                             "AND part_number = ? AND protocol = ?", key).fetchone()
+        data = row[0] if row is not None else None
+    return pickle.loads(data) if data is not None else None
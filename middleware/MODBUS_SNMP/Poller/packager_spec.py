@@ -0,0 +1,114 @@
+# Declarative packagers: the post-processing of a device (bitfields, enum lookup tables,
+# unit suffixes) is described as data in FIELDS and compiled once per class into one
+# expansion function per raw data key.
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ FIELD SPECS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class Bits(object):
+    # int >> {flag name: 0/1}
+    def __init__(self, flags):
+        # Arguments:
+        # flags             :   flag name of every bit, index = bit number, None for an unused bit
+        self.flags = flags
+
+    def compile(self):
+        masks = [(name, bit) for bit, name in enumerate(self.flags) if name is not None]
+        return lambda value: {name: (value >> bit) & 1 for name, bit in masks}
+
+
+class BitText(object):
+    # int >> text of the bits that are set (and of the cleared bits that have a name in names0)
+    def __init__(self, names1, names0=None, empty=None, separator=", "):
+        # Arguments:
+        # names1            :   text of every bit when set, index = bit number, None for no text
+        # names0            :   text of every bit when cleared, None for no text
+        # empty             :   result when no bit has a text
+        # separator         :   separator of the texts
+        self.names1 = names1
+        self.names0 = names0 or []
+        self.empty = empty
+        self.separator = separator
+
+    def compile(self):
+        width = max(len(self.names1), len(self.names0))
+        names1 = list(self.names1) + [None] * (width - len(self.names1))
+        names0 = list(self.names0) + [None] * (width - len(self.names0))
+        bits = [(bit, names1[bit], names0[bit]) for bit in range(width)
+                if names1[bit] is not None or names0[bit] is not None]
+        empty = self.empty
+        separator = self.separator
+
+        def expand(value):
+            texts = [name1 if (value >> bit) & 1 else name0 for bit, name1, name0 in bits]
+            texts = [text for text in texts if text is not None]
+            return separator.join(texts) if texts else empty
+        return expand
+
+
+class Enum(object):
+    # int >> text of a lookup table, values out of the table are kept unchanged
+    def __init__(self, table):
+        # Arguments:
+        # table             :   list (index = value) or dict (value >> text)
+        self.table = table
+
+    def compile(self):
+        table = dict(enumerate(self.table)) if isinstance(self.table, (list, tuple)) else dict(self.table)
+        return lambda value: table.get(value, value) if isinstance(value, int) else value
+
+
+class Unit(object):
+    # value >> "<value><suffix>"
+    def __init__(self, suffix):
+        self.suffix = suffix
+
+    def compile(self):
+        suffix = self.suffix
+        return lambda value: str(value) + suffix
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ PACKAGER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# class >> [(raw data key, expansion function)], compiled on the first instance of the class
+_compiled = {}
+
+
+def compile_fields(cls):
+    if cls not in _compiled:
+        _compiled[cls] = [(key, spec.compile()) for key, spec in cls.FIELDS.items()]
+    return _compiled[cls]
+
+
+class Packager(object):
+    # Subclasses only declare their fields:
+    # FIELDS        :   {raw data key: Bits / BitText / Enum / Unit}
+    # PROTOCOLS     :   protocols the packager applies to, process_raw_data() returns -1 for the others
+    FIELDS = {}
+    PROTOCOLS = None
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.expanders = compile_fields(type(self))
+        # raw data key >> (last raw value, its expansion), a key is only expanded again when its raw value changed
+        self.last = {}
+
+    def process_raw_data(self, raw_data):
+        if self.PROTOCOLS is not None and self.protocol not in self.PROTOCOLS:
+            return -1
+
+        last = self.last
+        for key, expand in self.expanders:
+            if key not in raw_data:
+                continue
+            value = raw_data[key]
+            cached = last.get(key)
+            if cached is not None and cached[0] == value and type(cached[0]) is type(value):
+                raw_data[key] = cached[1]
+            else:
+                expanded = expand(value)
+                last[key] = (value, expanded)
+                raw_data[key] = expanded
+
+        data = dict(raw_data)
+        return data
+
+    def write(self):
+        pass
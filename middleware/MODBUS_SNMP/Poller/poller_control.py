@@ -3,6 +3,7 @@ from pickle import FALSE
 from socket import timeout
 import Protocols.snmp as MySNMP
 import Protocols.modbus_rtu as MyModbusRTU
+import Protocols.rtu_bus as MyRTUBus
 import Protocols.modbus_tcp as MyModbusTCP
 from time import strftime, localtime
 import time, os, traceback, pprint, psutil
@@ -25,7 +26,9 @@ def ModbusRTU_Control(data):
 		function	= data["function"]
 
 	
-		device = MyModbusRTU.Device(port, addres, baudrate, parity, stop_bit, bytesize, endianness, timeout)
+		# Queued on the already open bus of the port, ahead of any pending poll
+		device = MyModbusRTU.Device(port, addres, baudrate, parity, stop_bit, bytesize, endianness, timeout,
+									priority=MyRTUBus.PRIORITY_CONTROL)
 		if data_type == "Coil":
 			device.write_bit(value["address"], value["value"], function)	
 		else:
@@ -68,7 +71,10 @@ def SNMP(data):
 		value			= data["value"]
 		
 		device = MySNMP.Device(ip_address, port, read_community, snmp_version, 	timeout)
-		device.write(value["OID"], value["value"], data_type)
+		try:
+			device.write(value["OID"], value["value"], data_type)
+		finally:
+			device.close()
 		return True
 	except Exception as e:
 		print(e)
@@ -3,8 +3,13 @@ import Protocols.modbus_rtu as MyModbusRTU
 import Protocols.modbus_tcp as MyModbusTCP
 from time import strftime, localtime
 import time, os, traceback, pprint, psutil
+from functools import partial
+from operator import methodcaller
 import Poller.libs as libs
 import Poller.data_mapper as data_mapper
+import Poller.block_planner as block_planner
+import Poller.scheduler as scheduler
+import Poller.change_filter as change_filter
 from Poller import datapckgr_by_pn, datapckgr_by_nm
 
 
@@ -16,6 +21,110 @@ def get_process_memory():
     process = psutil.Process(os.getpid())
     return [process.memory_info().rss,process.memory_full_info().rss]
 
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ READ PLANS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# A read plan is compiled once per device in __init__ and is an ordered list of
+# (reader, decoder) steps:
+# reader    :   callable(device) >> raw result of one Device.read_* method
+# decoder   :   callable(raw result, big_endian) >> dictionary of variable name and its value,
+#               None when the reader already returns that dictionary
+
+def compile_snmp_read_plan(data_map):
+    steps = []
+
+    ### Read Numeric and String Variable in Table OID, every table column of the group in one table walk
+    table = []
+    for dtype in MySNMP.NUMERIC:
+        _data_map = data_map[0][dtype]
+        if len(_data_map) != 0:
+            table += MySNMP.compile_table(_data_map[0], _data_map[1], _data_map[2], _data_map[3])
+    for dtype in MySNMP.STRING:
+        _data_map = data_map[1][dtype]
+        if len(_data_map) != 0:
+            table += MySNMP.compile_table(_data_map[0], _data_map[1], _data_map[2])
+    if len(table) != 0:
+        steps.append((methodcaller('read_table', table), None))
+
+    ### Read Numeric Variable in regular OID
+    for dtype in MySNMP.NUMERIC:
+        _data_map = data_map[2][dtype]
+        if len(_data_map) != 0:
+            steps.append((methodcaller('read_num', _data_map[0], _data_map[1], _data_map[2]), None))
+
+    ### Read String Variable in regular OID
+    for dtype in MySNMP.STRING:
+        _data_map = data_map[3][dtype]
+        if len(_data_map) != 0:
+            steps.append((methodcaller('read_string', _data_map[0], _data_map[1]), None))
+
+    ### Read Special Function ALARM
+    for dtype in MySNMP.ALARM_SNMP:
+        _data_map = data_map[4][dtype]
+        if len(_data_map) != 0:
+            steps.append((methodcaller('read_alarm', _data_map[0], _data_map[1], _data_map[5]), None))
+
+    return steps
+
+def compile_modbus_read_plan(data_map, block_plan, alarm=False):
+    steps = []
+
+    ### Read Discrete Input Registers
+    _data_map = data_map[0]
+    if len(_data_map) != 0:
+        steps.append((methodcaller('read_bits', _data_map[0], _data_map[1], functioncode=2), None))
+
+    ### Read Discrete Output Registers
+    _data_map = data_map[1]
+    if len(_data_map) != 0:
+        steps.append((methodcaller('read_bits', _data_map[0], _data_map[1], functioncode=1), None))
+
+    ### Read Input and Holding Registers, coalesced into block reads
+    if len(block_plan) != 0:
+        steps.append((methodcaller('read_blocks', block_plan.blocks), partial(block_planner.decode_blocks, block_plan)))
+
+    ### Read Alarm Registers
+    if alarm:
+        for _DataType in MyModbusRTU.DataTypes:
+            _data_map = data_map[4][_DataType]
+            if len(_data_map) != 0:
+                steps.append((methodcaller('read_ALARM', _data_map[0], _data_map[1], _data_map[2], _data_map[3],
+                                           _data_map[4], _data_map[5], _DataType), None))
+
+    return steps
+
+def run_read_plan(device, steps, raw_data, big_endian=True):
+    for reader, decoder in steps:
+        RegData = reader(device)
+        if decoder is not None:
+            RegData = decoder(RegData, big_endian)
+        raw_data.update(RegData)
+    return raw_data
+
+async def run_read_plan_async(device, steps, raw_data, big_endian=True):
+    # Same as run_read_plan for a device whose read methods are coroutines
+    for reader, decoder in steps:
+        RegData = await reader(device)
+        if decoder is not None:
+            RegData = decoder(RegData, big_endian)
+        raw_data.update(RegData)
+    return raw_data
+
+def compile_read_groups(data_lib, compile_group):
+    # Arguments:
+    # data_lib          :   list of variables of the device library
+    # compile_group     :   callable(list of variables) >> read plan steps
+    # Return            :   dictionary of interval and its read plan steps,
+    #                       None is the group polled at the device interval
+    data_lib = [change_filter.strip_deadband(var) for var in data_lib]
+    return {interval: compile_group(var_list)
+            for interval, var_list in scheduler.group_by_interval(data_lib).items()}
+
+def selected_groups(read_groups, groups, last_raw):
+    # groups            :   list of intervals of read_groups to read, None for every group
+    # last_raw          :   every group is read until a first complete frame exists
+    if groups is None or len(last_raw) == 0:
+        return list(read_groups.values())
+    return [read_groups[group] for group in groups if group in read_groups]
+
 # Class for SNMP polling
 class SNMP(object):
     def __init__(self, profile, protocol_setting):
@@ -34,74 +143,40 @@ class SNMP(object):
 
         self.data_lib = libs.get_device_data_lib(self.device_type, self.manufacturer, self.part_number, self.protocol)
 
-        # DATA REGISTER MAPPING
-        self.data_map = data_mapper.snmp_map(self.data_lib)
+        # READ PLAN per register group (variables with the same polling interval)
+        self.read_groups = compile_read_groups(
+            self.data_lib, lambda var_list: compile_snmp_read_plan(data_mapper.snmp_map(var_list)))
+        # Last raw value of every variable, groups polled less often keep their previous value
+        self.last_raw = {}
+        # Last published value of every field, for report by exception (deadbands of the library)
+        self.changes = change_filter.ChangeFilter(self.data_lib)
+
+        # DATA PACKAGERS (resolved once from the registries)
+        self.packager_pn = datapckgr_by_pn.get_packager(self.manufacturer, self.part_number, self.protocol)
+        self.packager_nm = datapckgr_by_nm.get_packager(self.name)
 
 
-    def poll(self):
+    def poll(self, groups=None):
+        # Arguments:
+        # groups            :   list of register group intervals to read, None for every group
         try:
             tPoll0 = time.time()  # end polling time
 
-            try:
-                self.device = MySNMP.Device(self.ip_address, self.port, self.read_community, self.snmp_version, Timeout = 3)
-                # print("Connected to ", self.name)
-            except:
-                tb = traceback.format_exc()
-                print(tb)
-                print("FAILED Connection to", self.name)
-
-            self.raw_data = {}
-
-            ### Read Numeric Variable in Table OID
-            # print("NumVarTabData")
-            for dtype in MySNMP.NUMERIC:
-                # print(self.data_map[0][dtype])
-                _data_map = self.data_map[0][dtype]
-                if len(_data_map) != 0:
-                    NumVarTabData = self.device.read_num_tab(_data_map[0], _data_map[1], _data_map[2], _data_map[3])
-                    self.raw_data.update(NumVarTabData)
-                    # print(NumVarTabData)
-
-            ### Read String Variable in Table OID
-            # print("StrVarTabData")
-            for dtype in MySNMP.STRING:
-                # print(self.data_map[1][dtype])
-                _data_map = self.data_map[1][dtype]
-                if len(_data_map) != 0:
-                    StrVarTabData = self.device.read_string_tab(_data_map[0], _data_map[1], _data_map[2])
-                    self.raw_data.update(StrVarTabData)
-                    #print(StrVarTabData)
-
-            ### Read Numeric Variable in regular OID
-            # print("NumVarData")
-            for dtype in MySNMP.NUMERIC:
-                # print(self.data_map[2][dtype])
-                _data_map = self.data_map[2][dtype]
-                if len(_data_map) != 0:
-                    NumVarData = self.device.read_num(_data_map[0], _data_map[1], _data_map[2])
-                    self.raw_data.update(NumVarData)
-                    #print(NumVarData)
-
-            ### Read String Variable in regular OID
-            # print("StrVarData")
-            for dtype in MySNMP.STRING:
-                # print(self.data_map[3][dtype])
-                _data_map = self.data_map[3][dtype]
-                if len(_data_map) != 0:
-                    StrVarData = self.device.read_string(_data_map[0], _data_map[1])
-                    self.raw_data.update(StrVarData)
-                    #print(StrVarData)
-            
-            ### Read Special Function ALARM
-            # print("AlarmData")
-            for dtype in MySNMP.ALARM_SNMP:
-            #    #print(self.data_map[4][dtype])
-                _data_map = self.data_map[4][dtype]
-                if len(_data_map) != 0:
-                    AlarmData = self.device.read_alarm(_data_map[0], _data_map[1], _data_map[5])
-                    self.raw_data.update(AlarmData)
-                    #print(StrVarData)
+            # session leased from the cached pool of the agent, handed back after the read plan
+            self.device = MySNMP.Device(self.ip_address, self.port, self.read_community, self.snmp_version, Timeout = 3)
 
+            raw_data = {}
+            error = None
+            try:
+                for steps in selected_groups(self.read_groups, groups, self.last_raw):
+                    run_read_plan(self.device, steps, raw_data)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                self.device.close(error)
+            self.last_raw.update(raw_data)
+            self.raw_data = dict(self.last_raw)
 
             tPoll1 = time.time()  # end polling time
 
@@ -111,24 +186,10 @@ class SNMP(object):
             self.raw_data['Timestamp'] = Timestamp
 
             # Process Data manufacturer-part_number data
-            if self.manufacturer + "_" + self.part_number in datapckgr_by_pn.MANU_PN_LIST:
-                self.command = """global _device_pck_pn
-_device_pck_pn = datapckgr_by_pn.%s_%s('%s')""" % (self.manufacturer, self.part_number, self.protocol)
-                exec(self.command)
-                self.data = _device_pck_pn.process_raw_data(self.raw_data)
-            else:
-                device_pck_pn = datapckgr_by_pn.Device(self.protocol)
-                self.data = device_pck_pn.process_raw_data(self.raw_data)
+            self.data = self.packager_pn.process_raw_data(self.raw_data)
 
             # Process Data by name data
-            if self.name in datapckgr_by_nm.NAME_LIST:
-                self.command = """global _device_pck_nm
-_device_pck_nm = datapckgr_by_nm.%s()""" % (self.name)
-                exec(self.command)
-                self.data = _device_pck_nm.process_raw_data(self.data)
-            else:
-                device_pck_nm = datapckgr_by_nm.Device()
-                self.data = device_pck_nm.process_raw_data(self.data)
+            self.data = self.packager_nm.process_raw_data(self.data)
 
             #pp.pprint(self.data)
             return self.data
@@ -155,10 +216,27 @@ class ModbusTCP(object):
 
         self.data_lib = libs.get_device_data_lib(self.device_type, self.manufacturer, self.part_number, self.protocol)
 
-        # DATA REGISTER MAPPING
-        self.data_map = data_mapper.modbus_map(self.data_lib)
-
-    def poll(self):
+        # REGISTER BLOCK PLANNING
+        # Input and Holding Registers of every data type are merged into as few reads as possible
+        gap_tolerance = protocol_setting.get('gap_tolerance', block_planner.GAPTOLERANCE)
+        max_block_size = protocol_setting.get('max_block_size', block_planner.MAXBLOCKSIZE)
+
+        # READ PLAN per register group (variables with the same polling interval)
+        self.read_groups = compile_read_groups(
+            self.data_lib, lambda var_list: compile_modbus_read_plan(
+                data_mapper.modbus_map(var_list), block_planner.plan_blocks(var_list, gap_tolerance, max_block_size)))
+        # Last raw value of every variable, groups polled less often keep their previous value
+        self.last_raw = {}
+        # Last published value of every field, for report by exception (deadbands of the library)
+        self.changes = change_filter.ChangeFilter(self.data_lib)
+
+        # DATA PACKAGERS (resolved once from the registries)
+        self.packager_pn = datapckgr_by_pn.get_packager(self.manufacturer, self.part_number, self.protocol)
+        self.packager_nm = datapckgr_by_nm.get_packager(self.name)
+
+    def poll(self, groups=None):
+        # Arguments:
+        # groups            :   list of register group intervals to read, None for every group
         try:
             tPoll0 = time.time()  # end polling time
 
@@ -170,94 +248,11 @@ class ModbusTCP(object):
                 # print(tb)
                 # print("FAILED Connection to", self.name)
 
-            self.raw_data = {}
-
-            ### Read Discrete Input Registers
-            _data_map = self.data_map[0]
-            if len(_data_map) != 0:
-                DiscInData = self.device.read_bits(_data_map[0], _data_map[1], functioncode=2)
-                # print(DiscInData)
-                self.raw_data.update(DiscInData)
-
-            ### Read Discrete Output Registers
-            _data_map = self.data_map[1]
-            if len(_data_map) != 0:
-                DiscOutData = self.device.read_bits(_data_map[0], _data_map[1], functioncode=1)
-                # print(DiscOutData)
-                self.raw_data.update(DiscOutData)
-
-            ### Read Input Registers
-            for _DataType in MyModbusTCP.DataTypes:
-                _data_map = self.data_map[2][_DataType]
-                if _DataType in [MyModbusTCP.INT16, MyModbusTCP.INT32, MyModbusTCP.INT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=True, functioncode=4)
-self.raw_data.update(RegData)
-                        """ %(_DataType)
-                        exec(self.command)
-                        #print(RegData)
-
-                elif _DataType in [MyModbusTCP.UINT16, MyModbusTCP.UINT32, MyModbusTCP.UINT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=False, functioncode=4)
-self.raw_data.update(RegData)
-                        """ %(_DataType[1:])
-                        exec(self.command)
-                        #print(RegData)
-                elif _DataType in [MyModbusTCP.FLOAT16, MyModbusTCP.FLOAT32, MyModbusTCP.FLOAT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], functioncode=4)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        # print(RegData)
-                elif _DataType == MyModbusTCP.STRING:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], functioncode=4)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        #print(RegData)
-
-            ### Read Holding Registers
-            for _DataType in MyModbusTCP.DataTypes:
-                _data_map = self.data_map[3][_DataType]
-                if _DataType in [MyModbusTCP.INT16, MyModbusTCP.INT32, MyModbusTCP.INT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=True, functioncode=3)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        # print(RegData)
-                elif _DataType in [MyModbusTCP.UINT16, MyModbusTCP.UINT32, MyModbusTCP.UINT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=False, functioncode=3)
-self.raw_data.update(RegData)
-                        """ % (_DataType[1:])
-                        exec(self.command)
-                        # print(RegData)
-                elif _DataType in [MyModbusTCP.FLOAT16, MyModbusTCP.FLOAT32, MyModbusTCP.FLOAT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], functioncode=3)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        # print(RegData)
-                elif _DataType == MyModbusTCP.STRING:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], functioncode=3)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        # print(RegData)
+            raw_data = {}
+            for steps in selected_groups(self.read_groups, groups, self.last_raw):
+                run_read_plan(self.device, steps, raw_data, self.device.big_endian)
+            self.last_raw.update(raw_data)
+            self.raw_data = dict(self.last_raw)
 
             tPoll1 = time.time()  # end polling time
 
@@ -269,24 +264,42 @@ self.raw_data.update(RegData)
             #pp.pprint(self.raw_data)
 
             # Process Data manufacturer-part_number data
-            if self.manufacturer + "_" + self.part_number in datapckgr_by_pn.MANU_PN_LIST:
-                self.command = """global _device_pck_pn
-_device_pck_pn = datapckgr_by_pn.%s_%s('%s')""" % (self.manufacturer, self.part_number, self.protocol)
-                exec(self.command)
-                self.data = _device_pck_pn.process_raw_data(self.raw_data)
-            else:
-                device_pck_pn = datapckgr_by_pn.Device(self.protocol)
-                self.data = device_pck_pn.process_raw_data(self.raw_data)
+            self.data = self.packager_pn.process_raw_data(self.raw_data)
 
             # Process Data by name data
-            if self.name in datapckgr_by_nm.NAME_LIST:
-                self.command = """global _device_pck_nm
-_device_pck_nm = datapckgr_by_nm.%s()""" % (self.name)
-                exec(self.command)
-                self.data = _device_pck_nm.process_raw_data(self.data)
-            else:
-                device_pck_nm = datapckgr_by_nm.Device()
-                self.data = device_pck_nm.process_raw_data(self.data)
+            self.data = self.packager_nm.process_raw_data(self.data)
+
+            return self.data
+        except:
+            # tb = traceback.format_exc()
+            # print(tb)
+            return -1
+
+    async def poll_async(self, device, groups=None):
+        # Arguments:
+        # device            :   Protocols.modbus_tcp_async.Device, kept by the asyncio engine
+        # groups            :   list of register group intervals to read, None for every group
+        try:
+            tPoll0 = time.time()  # end polling time
+
+            raw_data = {}
+            for steps in selected_groups(self.read_groups, groups, self.last_raw):
+                await run_read_plan_async(device, steps, raw_data, device.big_endian)
+            self.last_raw.update(raw_data)
+            self.raw_data = dict(self.last_raw)
+
+            tPoll1 = time.time()  # end polling time
+
+            PollingDuration = tPoll1 - tPoll0
+            self.raw_data['PollingDuration'] = PollingDuration
+            Timestamp = strftime("%Y-%m-%d %H:%M:%S", localtime())
+            self.raw_data['Timestamp'] = Timestamp
+
+            # Process Data manufacturer-part_number data
+            self.data = self.packager_pn.process_raw_data(self.raw_data)
+
+            # Process Data by name data
+            self.data = self.packager_nm.process_raw_data(self.data)
 
             return self.data
         except:
@@ -316,121 +329,48 @@ class ModbusRTU(object):
 
         self.data_lib = libs.get_device_data_lib(self.device_type, self.manufacturer, self.part_number, self.protocol)
 
-        # DATA REGISTER MAPPING
-        self.data_map = data_mapper.modbus_map(self.data_lib)
-
-    def poll(self):
+        # REGISTER BLOCK PLANNING
+        # Input and Holding Registers of every data type are merged into as few reads as possible
+        gap_tolerance = protocol_setting.get('gap_tolerance', block_planner.GAPTOLERANCE)
+        max_block_size = protocol_setting.get('max_block_size', block_planner.MAXBLOCKSIZE)
+
+        # READ PLAN per register group (variables with the same polling interval)
+        self.read_groups = compile_read_groups(
+            self.data_lib, lambda var_list: compile_modbus_read_plan(
+                data_mapper.modbus_map(var_list), block_planner.plan_blocks(var_list, gap_tolerance, max_block_size), alarm=True))
+        # Last raw value of every variable, groups polled less often keep their previous value
+        self.last_raw = {}
+        # Last published value of every field, for report by exception (deadbands of the library)
+        self.changes = change_filter.ChangeFilter(self.data_lib)
+
+        # DATA PACKAGERS (resolved once from the registries)
+        self.packager_pn = datapckgr_by_pn.get_packager(self.manufacturer, self.part_number, self.protocol)
+        self.packager_nm = datapckgr_by_nm.get_packager(self.name)
+
+        # DEVICE (the serial port is kept open by the bus of self.com and shared with the other devices)
+        self.device = None
+
+    def poll(self, groups=None):
+        # Arguments:
+        # groups            :   list of register group intervals to read, None for every group
         try:
             tPoll0 = time.time()  # end polling time
-            try:
-                self.device = MyModbusRTU.Device(self.com, self.address, self.baudrate, self.parity, self.stop_bit,
-                                                 self.byte_size, self.endianness, self.timeout)
-                print("Connected to ", self.name)
-            except:
-                tb = traceback.format_exc()
-                print(tb)
-                print("FAILED Connection to", self.name)
-            
-            self.raw_data = {}
+            if self.device is None:
+                try:
+                    self.device = MyModbusRTU.Device(self.com, self.address, self.baudrate, self.parity, self.stop_bit,
+                                                     self.byte_size, self.endianness, self.timeout)
+                    print("Connected to ", self.name)
+                except:
+                    tb = traceback.format_exc()
+                    print(tb)
+                    print("FAILED Connection to", self.name)
+
+            raw_data = {}
+            for steps in selected_groups(self.read_groups, groups, self.last_raw):
+                run_read_plan(self.device, steps, raw_data, self.device.big_endian)
+            self.last_raw.update(raw_data)
+            self.raw_data = dict(self.last_raw)
 
-            ### Read Discrete Input Registers
-            _data_map = self.data_map[0]
-            if len(_data_map) != 0:
-                DiscInData = self.device.read_bits(_data_map[0], _data_map[1], functioncode=2)
-                # print(DiscInData)
-                self.raw_data.update(DiscInData)
-
-            ### Read Discrete Output Registers
-            _data_map = self.data_map[1]
-            if len(_data_map) != 0:
-                DiscOutData = self.device.read_bits(_data_map[0], _data_map[1], functioncode=1)
-                # print(DiscOutData)
-                self.raw_data.update(DiscOutData)
-
-            ### Read Input Registers
-            for _DataType in MyModbusRTU.DataTypes:
-                _data_map = self.data_map[2][_DataType]
-                if _DataType in [MyModbusRTU.INT16, MyModbusRTU.INT32, MyModbusRTU.INT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=True, functioncode=4)
-self.raw_data.update(RegData)
-                        """ %(_DataType)
-                        exec(self.command)
-                        #print(RegData)
-
-                elif _DataType in [MyModbusRTU.UINT16, MyModbusRTU.UINT32, MyModbusRTU.UINT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=False, functioncode=4)
-self.raw_data.update(RegData)
-                        """ %(_DataType[1:])
-                        exec(self.command)
-                        #print(RegData)
-                elif _DataType in [MyModbusRTU.FLOAT16, MyModbusRTU.FLOAT32, MyModbusRTU.FLOAT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], functioncode=4)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        # print(RegData)
-                elif _DataType == MyModbusRTU.STRING:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], functioncode=4)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        #print(RegData)
-
-            ### Read Holding Registers
-            for _DataType in MyModbusRTU.DataTypes:
-                _data_map = self.data_map[3][_DataType]
-                if _DataType in [MyModbusRTU.INT16, MyModbusRTU.INT32, MyModbusRTU.INT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=True, functioncode=3)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        #print(self.command)
-                        exec(self.command)
-                        #time.sleep(0.1)
-                        #print(RegData)
-                elif _DataType in [MyModbusRTU.UINT16, MyModbusRTU.UINT32, MyModbusRTU.UINT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], signed=False, functioncode=3)
-self.raw_data.update(RegData)
-                        """  % (_DataType[1:]) 
-                        #print(self.command)
-                        exec(self.command)
-                        #time.sleep(0.1)
-                        #print(RegData)
-                elif _DataType in [MyModbusRTU.FLOAT16, MyModbusRTU.FLOAT32, MyModbusRTU.FLOAT64]:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], _data_map[2], functioncode=3)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        # print(RegData)
-                elif _DataType == MyModbusRTU.STRING:
-                    if len(_data_map) != 0:
-                        self.command = """
-RegData = self.device.read_%s(_data_map[0], _data_map[1], functioncode=3)
-self.raw_data.update(RegData)
-                        """ % (_DataType)
-                        exec(self.command)
-                        # print(RegData)
-
-            ### Read Holding Registers
-            for _DataType in MyModbusRTU.DataTypes:
-                _data_map = self.data_map[4][_DataType]
-                if len(_data_map) != 0:
-                    RegData = self.device.read_ALARM( _data_map[0], _data_map[1], _data_map[2], _data_map[3], _data_map[4], _data_map[5], _DataType )
-                    self.raw_data.update(RegData)
-                    
             tPoll1 = time.time()  # end polling time
 
             PollingDuration = tPoll1 - tPoll0
@@ -441,24 +381,10 @@ self.raw_data.update(RegData)
             #pp.pprint(self.raw_data)
 
             # Process Data manufacturer-part_number data
-            if self.manufacturer + "_" + self.part_number in datapckgr_by_pn.MANU_PN_LIST:
-                self.command = """global _device_pck_pn
-_device_pck_pn = datapckgr_by_pn.%s_%s('%s')""" % (self.manufacturer, self.part_number, self.protocol)
-                exec(self.command)
-                self.data = _device_pck_pn.process_raw_data(self.raw_data)
-            else:
-                device_pck_pn = datapckgr_by_pn.Device(self.protocol)
-                self.data = device_pck_pn.process_raw_data(self.raw_data)
+            self.data = self.packager_pn.process_raw_data(self.raw_data)
 
             # Process Data by name data
-            if self.name in datapckgr_by_nm.NAME_LIST:
-                self.command = """global _device_pck_nm
-_device_pck_nm = datapckgr_by_nm.%s()""" % (self.name)
-                exec(self.command)
-                self.data = _device_pck_nm.process_raw_data(self.data)
-            else:
-                device_pck_nm = datapckgr_by_nm.Device()
-                self.data = device_pck_nm.process_raw_data(self.data)
+            self.data = self.packager_nm.process_raw_data(self.data)
 
             #pp.pprint(self.data)
             return self.data
@@ -0,0 +1,175 @@
+import heapq
+import itertools
+import threading
+import time
+
+# Longest single sleep of Schedule.wait_next(), bounds how late a stop request is noticed
+MAXSLEEP = 1.0
+
+# Every schedule of the process, for the stats report of main.py
+_schedules = []
+_schedules_lock = threading.Lock()
+
+
+class Job(object):
+    def __init__(self, name, interval, payload, due):
+        # Arguments:
+        # name              :   label used in the stats, e.g. "<device name>" or "<device name>/<interval>"
+        # interval          :   period in seconds (float, sub-second allowed)
+        # payload           :   anything the owner needs to run the job (device index, register group, ...)
+        # due               :   first deadline, time.monotonic() based
+        self.name = name
+        self.interval = float(interval)
+        self.payload = payload
+        self.due = due
+        self.running = False
+        self.removed = False
+        self.t_started = 0.0
+
+        self.runs = 0
+        self.failed = 0
+        self.skipped = 0
+        self.lateness_last = 0.0
+        self.lateness_max = 0.0
+        self.lateness_avg = 0.0
+        self.duration_last = 0.0
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "runs": self.runs,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "lateness_last": self.lateness_last,
+            "lateness_max": self.lateness_max,
+            "lateness_avg": self.lateness_avg,
+            "duration_last": self.duration_last,
+        }
+
+
+class Schedule(object):
+    # Heap of next-due times with fixed-rate semantics:
+    # - the deadlines of a job are first_due + k * interval, the poll duration never shifts them
+    # - a job is out of the heap while it runs, so it can never overlap itself
+    # - deadlines already passed when a run ends are skipped (and counted) instead of run back to back
+
+    def __init__(self, name):
+        self.name = name
+        self._heap = []
+        self._sequence = itertools.count()
+        self.jobs = []
+        with _schedules_lock:
+            _schedules.append(self)
+
+    def add(self, name, interval, payload=None, offset=0.0):
+        # Arguments:
+        # name              :   label of the job
+        # interval          :   period in seconds
+        # payload           :   returned with the job when it is due
+        # offset            :   delay of the first run in seconds, to spread jobs with the same interval
+        # Return            :   Job
+        job = Job(name, interval, payload, time.monotonic() + offset)
+        self.jobs.append(job)
+        self._push(job)
+        return job
+
+    def _push(self, job):
+        heapq.heappush(self._heap, (job.due, next(self._sequence), job))
+
+    def remove(self, job):
+        # Take a job out of the schedule, a running job is not put back by done()
+        job.removed = True
+        if job in self.jobs:
+            self.jobs.remove(job)
+        if not job.running:
+            self._heap = [entry for entry in self._heap if entry[2] is not job]
+            heapq.heapify(self._heap)
+
+    def next_due(self):
+        # Return            :   deadline of the earliest job, None if every job is running
+        if len(self._heap) == 0:
+            return None
+        return self._heap[0][0]
+
+    def pop(self):
+        # Return            :   the earliest job, marked as started; call done() when it has run
+        due, _, job = heapq.heappop(self._heap)
+        now = time.monotonic()
+        job.running = True
+        job.t_started = now
+        job.lateness_last = max(0.0, now - due)
+        job.lateness_max = max(job.lateness_max, job.lateness_last)
+        job.lateness_avg += (job.lateness_last - job.lateness_avg) / (job.runs + 1)
+        return job
+
+    def wait_next(self, stop=None, idle=None):
+        # Arguments:
+        # stop              :   callable returning True when the caller has to quit, checked at least
+        #                       every MAXSLEEP seconds while waiting
+        # idle              :   callable(seconds) used instead of time.sleep while waiting, e.g. to run
+        #                       control commands as soon as they arrive; it may return early
+        # Return            :   the next due job, None if stop() became True
+        while stop is None or not stop():
+            due = self.next_due()
+            delay = MAXSLEEP if due is None else due - time.monotonic()
+            if due is not None and delay <= 0:
+                return self.pop()
+            if idle is None:
+                time.sleep(min(delay, MAXSLEEP))
+            else:
+                idle(min(delay, MAXSLEEP))
+        return None
+
+    def done(self, job, failed=False):
+        # Arguments:
+        # job               :   job returned by pop() or wait_next()
+        # failed            :   True if the run did not produce data
+        now = time.monotonic()
+        job.running = False
+        job.runs += 1
+        job.duration_last = now - job.t_started
+        if failed:
+            job.failed += 1
+
+        job.due += job.interval
+        if job.due <= now:
+            missed = int((now - job.due) // job.interval) + 1
+            job.due += missed * job.interval
+            job.skipped += missed
+        if not job.removed:
+            self._push(job)
+
+    def stats(self):
+        return {"schedule": self.name, "jobs": [job.stats() for job in self.jobs]}
+
+    def close(self):
+        with _schedules_lock:
+            if self in _schedules:
+                _schedules.remove(self)
+
+
+def all_stats():
+    with _schedules_lock:
+        schedules = list(_schedules)
+    return [schedule.stats() for schedule in schedules]
+
+
+def group_by_interval(data_lib, default_interval=None):
+    # Arguments:
+    # data_lib          :   list of variables of the device library ("data" of devices.json)
+    # default_interval  :   interval of the variables without an "interval" field
+    # Return            :   dictionary of interval and the list of its variables, in library order
+    #
+    # A variable may carry "interval" (seconds) in the library, e.g. 0.5 for power values
+    # and 3600 for nameplate strings; every other variable follows the device interval.
+    #
+    # "interval" is removed from the returned variables, data_mapper reads the fields by position.
+    groups = {}
+    for var in data_lib:
+        var = dict(var)
+        interval = var.pop('interval', default_interval)
+        if interval is not None:
+            interval = float(interval)
+        groups.setdefault(interval, []).append(var)
+    return groups
@@ -1 +1,7 @@
-from Protocols import modbus_rtu, modbus_tcp, snmp, mqtt
\ No newline at end of file
+import os
+import sys
+
+# modules shared by the services, see middleware/common/README.md
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+
+from Protocols import modbus_rtu, modbus_tcp, snmp, mqtt, publisher, rtu_bus, snmp_session, spool
@@ -3,55 +3,55 @@ from colorama import Fore, Style
 from Converter import *
 ListofAlarm = ["Tripplite_SNMP", "APC_SNMP", "KEHUA_SNMP", "ENVICOOL_RTU"]
 
-def Tripplite_SNMP(snmp_dev, oid_alarm):
-
-    oid_time_alarm      = ".1.3.6.1.4.1.850.1.3.2.1.3"
-    oid_detail_alarm    = ".1.3.6.1.4.1.850.1.3.2.1.6"
-    oid_type_alarm      = ".1.3.6.1.4.1.850.1.3.2.1.7"
-    oid_state_alarm     = ".1.3.6.1.4.1.850.1.3.2.1.8"
-    oid_id_alarm        = ".1.3.6.1.4.1.850.1.3.2.1.1"
-
-    VarNameList         = []
-    values              = []
-
-    Number_of_alarm = snmp_dev.get(oid_alarm[0]).value
-    walk_alarm_id = snmp_dev.walk(oid_id_alarm)
-    
-    count_critical = 0
-    count_major    = 0
-    count_minor    = 0
-
-    if Number_of_alarm != "0":
-        for item in walk_alarm_id:
-            id_alarm = str(item.value)
-            VarNameList.append(snmp_dev.get(oid_detail_alarm + "." + id_alarm).value)
-            state = int(snmp_dev.get(oid_type_alarm + "." + id_alarm).value)
-            if state == 1:
-                count_critical += 1
-                values.append("Critical")
-            elif state == 2:
-                count_major += 1
-                values.append("Major")
-            elif state == 3:
-                count_minor += 1
-                values.append("Minor")
-            elif state == 4:
-                values.append("Status")
-            elif state == 5:
-                values.append("Offline")
-            elif state == 6:
-                values.append("Custom")
-    
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ALARM STATE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# snmp_type of a varbind without value
+MISSING = ["NOSUCHOBJECT", "NOSUCHINSTANCE", "ENDOFMIBVIEW", "NOSUCHNAME"]
+
+class AlarmTable(object):
+    # Active alarms of one device kept between two polls, only new alarms are fetched and
+    # the result is rebuilt only when an alarm is raised or cleared
+    def __init__(self):
+        self.active = {}    # alarm key >> (alarm name, severity)
+        self.order = []
+        self.result = None
+
+    def update(self, keys, fetch):
+        # Arguments:
+        # keys              :   keys of the alarms active now, in display order
+        # fetch             :   callable(list of new keys) >> dictionary of key and (alarm name, severity)
+        # Return            :   True when an alarm was raised or cleared
+        present = set(keys)
+        new = [key for key in keys if key not in self.active]
+        cleared = [key for key in self.active if key not in present]
+        for key in cleared:
+            del self.active[key]
+        if len(new) != 0:
+            # new keys the device could not describe are fetched again on the next poll
+            self.active.update(fetch(new))
+        order = [key for key in keys if key in self.active]
+        changed = len(new) != 0 or len(cleared) != 0 or order != self.order
+        self.order = order
+        return changed
+
+def alarm_state(device, name):
+    # Return            :   AlarmTable of the alarm handler name for the agent of device
+    table = device.pool.cache.get(name)
+    if table is None:
+        table = AlarmTable()
+        device.pool.cache[name] = table
+    return table
+
+def alarm_result(total, alarms, count_critical, count_major, count_minor):
+    # alarms            :   list of (alarm name, severity)
     data = str()
-    for i in range(len(VarNameList)):
-        data += VarNameList[i] + ": " + values[i] +" \n"
+    for name, severity in alarms:
+        data += name + ": " + severity + " \n"
 
     VarNameList         = []
     values              = []
 
-
     VarNameList.append("Number_of_alarm")
-    values.append(Number_of_alarm)
+    values.append(total)
     VarNameList.append("List_of_Alarm")
     values.append(data)
 
@@ -62,95 +62,128 @@ def Tripplite_SNMP(snmp_dev, oid_alarm):
     VarNameList.append("Count of Minor")
     values.append(count_minor)
 
-    #Special Function of Triplite AIRCON
-    if snmp_dev.get(".1.3.6.1.4.1.850.1.1.1.2.1.5.1").value == "SR(X)COOL":
-        Tripplite_srxcool.getSpecialData(snmp_dev, VarNameList, values)
-
-    Result = dict(zip(VarNameList, values))    
-    return Result
-
-def APC_SNMP(snmp_dev, oid_alarm):
-    VarNameList         = []
-    values              = []
-
-    count_critical = 0
-    count_major    = 0
-    count_minor    = 0
-
-    Load_State_Alarm = [None, "No Alarm", "Minor", "Major", "Critical"]
+    return dict(zip(VarNameList, values))
 
-    VarNameList.append("Load_State_Alarm")
-    values.append(Load_State_Alarm[int(snmp_dev.get(".1.3.6.1.4.1.318.1.1.12.2.2.1.1.5.1").value)])
-    VarNameList.append("Load_Bank_1_Alarm")
-    values.append(Load_State_Alarm[int(snmp_dev.get(".1.3.6.1.4.1.318.1.1.12.2.4.1.1.5.1").value)])
-    VarNameList.append("Load_Bank_2_Alarm")
-    values.append(Load_State_Alarm[int(snmp_dev.get(".1.3.6.1.4.1.318.1.1.12.2.4.1.1.5.2").value)])
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ SNMP ALARMS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# Tripplite alarm type >> severity
+TRIPPLITE_SEVERITY = {1: "Critical", 2: "Major", 3: "Minor", 4: "Status", 5: "Offline", 6: "Custom"}
+TRIPPLITE_MODEL_OID = ".1.3.6.1.4.1.850.1.1.1.2.1.5.1"
 
-    count_minor = values.count("Minor")
-    count_major = values.count("Major")
-    count_critical = values.count("Critical")
-    total_alarm = count_critical + count_major + count_minor
+def Tripplite_SNMP(device, oid_alarm):
+    # Arguments:
+    # device            :   Protocols.snmp.Device
+    # oid_alarm         :   list of alarm OID, oid_alarm[0] is the number of alarms
 
-    data = str()
-    for i in range(len(VarNameList)):
-        data += VarNameList[i] + ": " + values[i] +" \n"
-
-    VarNameList         = []
-    values              = []
-
-    VarNameList.append("Number_of_alarm")
-    values.append(total_alarm)
-    VarNameList.append("List_of_Alarm")
-    values.append(data)
+    oid_time_alarm      = ".1.3.6.1.4.1.850.1.3.2.1.3"
+    oid_detail_alarm    = ".1.3.6.1.4.1.850.1.3.2.1.6"
+    oid_type_alarm      = ".1.3.6.1.4.1.850.1.3.2.1.7"
+    oid_state_alarm     = ".1.3.6.1.4.1.850.1.3.2.1.8"
+    oid_id_alarm        = ".1.3.6.1.4.1.850.1.3.2.1.1"
 
+    # number of alarms and, on the first poll of the agent, its model in one GET
+    cache = device.pool.cache
+    oids = [oid_alarm[0]]
+    if "Tripplite_model" not in cache:
+        oids.append(TRIPPLITE_MODEL_OID)
+    data = device.pool.get(oids, device.dev)
+    Number_of_alarm = data[0].value
+    if len(data) > 1:
+        cache["Tripplite_model"] = data[1].value
+
+    # ids of the active alarms, the detail and type of an alarm are read once when it is raised
+    table = alarm_state(device, "Tripplite_SNMP")
+    ids = []
+    if Number_of_alarm != "0":
+        ids = [str(value) for value in device.walk_columns([oid_id_alarm])[0].values()]
+
+    def fetch(new_ids):
+        oids = []
+        for id_alarm in new_ids:
+            oids += [oid_detail_alarm + "." + id_alarm, oid_type_alarm + "." + id_alarm]
+        data = device.pool.get(oids, device.dev)
+        alarms = {}
+        for i, id_alarm in enumerate(new_ids):
+            detail, state = data[2 * i], data[2 * i + 1]
+            if detail.snmp_type in MISSING or state.snmp_type in MISSING:
+                continue
+            severity = TRIPPLITE_SEVERITY.get(int(state.value))
+            if severity is not None:
+                alarms[id_alarm] = (detail.value, severity)
+        return alarms
+
+    if table.update(ids, fetch) or table.result is None or table.result["Number_of_alarm"] != Number_of_alarm:
+        alarms = [table.active[id_alarm] for id_alarm in table.order]
+        severities = [severity for name, severity in alarms]
+        table.result = alarm_result(Number_of_alarm, alarms, severities.count("Critical"),
+                                    severities.count("Major"), severities.count("Minor"))
+    Result = dict(table.result)
 
-    VarNameList.append("Count of Critical")
-    values.append(count_critical)
-    VarNameList.append("Count of Major")
-    values.append(count_major)
-    VarNameList.append("Count of Minor")
-    values.append(count_minor)
+    #Special Function of Triplite AIRCON
+    if cache["Tripplite_model"] == "SR(X)COOL":
+        VarNameList = list(Result.keys())
+        values = list(Result.values())
+        Tripplite_srxcool.getSpecialData(device.dev, VarNameList, values)
+        Result = dict(zip(VarNameList, values))
 
-    Result = dict(zip(VarNameList, values))    
     return Result
 
-def KEHUA_SNMP(snmp_dev, varname_alarm, oid_alarm):
+APC_LOAD_STATE_ALARM = [None, "No Alarm", "Minor", "Major", "Critical"]
+APC_ALARM_OIDS = [
+    ("Load_State_Alarm", ".1.3.6.1.4.1.318.1.1.12.2.2.1.1.5.1"),
+    ("Load_Bank_1_Alarm", ".1.3.6.1.4.1.318.1.1.12.2.4.1.1.5.1"),
+    ("Load_Bank_2_Alarm", ".1.3.6.1.4.1.318.1.1.12.2.4.1.1.5.2"),
+]
+
+def APC_SNMP(device, oid_alarm):
+    # Arguments:
+    # device            :   Protocols.snmp.Device
+    # oid_alarm         :   list of alarm OID (unused, the APC alarm OIDs are fixed)
+
+    # every load state in one GET
+    data = device.pool.get([oid for name, oid in APC_ALARM_OIDS], device.dev)
+    states = tuple(int(item.value) for item in data)
+
+    # the result only changes with the load states
+    table = alarm_state(device, "APC_SNMP")
+    if table.result is None or table.active.get("states") != states:
+        table.active = {"states": states}
+        alarms = [(name, APC_LOAD_STATE_ALARM[state]) for (name, oid), state in zip(APC_ALARM_OIDS, states)]
+        severities = [severity for name, severity in alarms]
+        count_minor = severities.count("Minor")
+        count_major = severities.count("Major")
+        count_critical = severities.count("Critical")
+        total_alarm = count_critical + count_major + count_minor
+        table.result = alarm_result(total_alarm, alarms, count_critical, count_major, count_minor)
+
+    return dict(table.result)
+
+def KEHUA_SNMP(device, varname_alarm, oid_alarm):
+    # Arguments:
+    # device            :   Protocols.snmp.Device
+    # varname_alarm     :   list of alarm name
+    # oid_alarm         :   list of alarm OID (upsAlarmDescr value) of every alarm name
     upsAlarmPresent = ".1.3.6.1.2.1.33.1.6.1.0"
     upsAlarmDescr   = ".1.3.6.1.2.1.33.1.6.2.1.2"
 
-    total_of_alarm = snmp_dev.get(upsAlarmPresent).value
-    alarmActive = []
-    VarNameList = []
-    values      = []
-    for i in range (int(total_of_alarm)):
-        alarmActive.append(snmp_dev.get(upsAlarmDescr + "." + str(i+1)).value)
+    total_of_alarm = device.dev.get(upsAlarmPresent).value
 
-    for j in range(len(alarmActive)):  
-        VarNameList.append(varname_alarm[oid_alarm.index(alarmActive[j])])
-        values.append("Critical")
-    data = str()
-    for i in range(len(VarNameList)):
-        data += VarNameList[i] + ": " + values[i] +" \n"
-
-
-    VarNameList         = []
-    values              = []
+    # alarm OID >> alarm name, built once per agent
+    cache = device.pool.cache
+    if "KEHUA_names" not in cache:
+        cache["KEHUA_names"] = dict(zip(reversed(oid_alarm), reversed(varname_alarm)))
+    names = cache["KEHUA_names"]
 
+    # descriptions of every active alarm in one GET
+    data = device.pool.get([upsAlarmDescr + "." + str(i+1) for i in range(int(total_of_alarm))], device.dev)
+    alarmActive = [item.value for item in data]
 
-    VarNameList.append("Number_of_alarm")
-    values.append(total_of_alarm)
-    VarNameList.append("List_of_Alarm")
-    values.append(data)
+    table = alarm_state(device, "KEHUA_SNMP")
+    if table.update(alarmActive, lambda new: {descr: (names[descr], "Critical") for descr in new}) \
+            or table.result is None:
+        alarms = [table.active[descr] for descr in table.order]
+        table.result = alarm_result(total_of_alarm, alarms, total_of_alarm, 0, 0)
 
-    VarNameList.append("Count of Critical")
-    values.append(total_of_alarm)
-    VarNameList.append("Count of Major")
-    values.append(0)
-    VarNameList.append("Count of Minor")
-    values.append(0)
-
-    Result = dict(zip(VarNameList, values))    
-    return Result
+    return dict(table.result)
     
 
 
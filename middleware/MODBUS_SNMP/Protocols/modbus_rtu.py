@@ -3,6 +3,7 @@ import serial
 import time
 from colorama import Fore, Style
 import Protocols.alarm as _alarm
+import Protocols.rtu_bus as _bus
 
 # Byte Order
 BE = "Big Endian"
@@ -38,15 +39,12 @@ debug = False
 publish_failed_data = False
 
 class Device():
-    def __init__(self, port, deviceAddress, baudrate, parity, stopbit, bytesize, byteorder, timeout):
-        import minimalmodbus as mm
+    def __init__(self, port, deviceAddress, baudrate, parity, stopbit, bytesize, byteorder, timeout,
+                 priority=_bus.PRIORITY_POLL):
+        # priority          :   queue priority of this device on the serial bus
+        #                       _bus.PRIORITY_POLL    >> cyclic polling
+        #                       _bus.PRIORITY_CONTROL >> control writes, served before pending polls
         self.devAddress = deviceAddress
-        mm.BAUDRATE = baudrate
-        exec("""mm.PARITY = serial.PARITY_%s""" % parity)
-        mm.BYTESIZE = bytesize
-        mm.STOPBITS = stopbit
-        mm.TIMEOUT = timeout
-        mm.CLOSE_PORT_AFTER_EACH_CALL = True
 
         # big_endian        :   Byte order of the device memory structure
         #                       True  >>  big endian
@@ -57,12 +55,10 @@ class Device():
         else:
             self.big_endian = False
 
-        self.dev = mm.Instrument(port, deviceAddress)
-        self.dev.serial.baudrate = baudrate
-        self.dev.serial.timeout = timeout
-        self.dev.serial.bytesize = bytesize
-        self.dev.serial.parity   = serial.PARITY_NONE
-        self.dev.serial.stopbits = stopbit 
+        # The serial port stays open and is shared by every device on the same port,
+        # each read/write is one transaction queued on the port's bus
+        self.bus = _bus.get_bus(port, baudrate, parity, stopbit, bytesize, timeout)
+        self.dev = self.bus.instrument(deviceAddress, priority)
         # self.dev.debug = True
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ READ METHODS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
@@ -340,6 +336,31 @@ class Device():
 
         self.Result = dict(zip(VarNameList, self.values))
         return self.Result
+    # Method to read coalesced register blocks (see Poller.block_planner)
+    def read_blocks(self, BlockList):
+        # Arguments:
+        # BlockList         :   list of register blocks, each with start, count and functioncode
+        #                       3 >> for Holding Register
+        #                       4 >> for Input Register
+        # Return            :   list of uint16 lists, one per block
+        #                       (None for a failed block if publish_failed_data is enabled)
+
+        buffers = []
+        for block in BlockList:
+            if debug:
+                print("reading...")
+                print(block)
+            if publish_failed_data:
+                try:
+                    buffers.append(self.dev.read_registers(block.start, block.count, block.functioncode))
+                except Exception as e:
+                        print(e)
+                        print("reading failed")
+                        buffers.append(None)
+            else:
+                buffers.append(self.dev.read_registers(block.start, block.count, block.functioncode))
+        return buffers
+
     def read_ALARM(self, VarNameList, AddressList, MultiplierList, roundto, alarm_type, functioncode, data_type):
         
         if alarm_type[0] == "Envicool":
@@ -352,12 +373,18 @@ class Device():
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WRITE METHODS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
     # Method to write binary value on discrete output register (Coil)
-    def write_bit(self, registerAddress, value):
+    def write_bit(self, registerAddress, value, function="single"):
         # Arguments:
         # registerAddress   :   register address in decimal (relative address)
         # value             :   0 or 1
+        # function          :   "single" >> functioncode 5, "multiple" >> functioncode 15
+
+        if function == "multiple":
+            decimal_function = 15
+        else:
+            decimal_function = 5
 
-        self.dev.write_bit(registerAddress, value)
+        self.dev.write_bit(registerAddress, value, decimal_function)
 
     # Method to write numeric value on holding register
     def write_num(self, registerAddress, value, valueType, function):
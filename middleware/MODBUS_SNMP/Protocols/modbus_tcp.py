@@ -279,6 +279,25 @@ class Device():
         self.Result = dict(zip(VarNameList, self.values))
         return self.Result
 
+    # Method to read coalesced register blocks (see Poller.block_planner)
+    def read_blocks(self, BlockList):
+        # Arguments:
+        # BlockList         :   list of register blocks, each with start, count and functioncode
+        #                       3 >> for Holding Register
+        #                       4 >> for Input Register
+        # Return            :   list of uint16 lists, one per block
+
+        buffers = []
+        for block in BlockList:
+            if block.functioncode == 3:
+                registers = self.dev.read_holding_registers(block.start, block.count)
+            else:
+                registers = self.dev.read_input_registers(block.start, block.count)
+            if registers is None:
+                raise Exception("failed to read %d registers from address %d" % (block.count, block.start))
+            buffers.append(registers)
+        return buffers
+
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WRITE METHODS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
     # Method to write binary value on discrete output register (Coil)
     def write_bit(self, registerAddress, value):
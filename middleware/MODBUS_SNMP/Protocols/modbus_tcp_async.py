@@ -0,0 +1,179 @@
+import asyncio
+import struct
+from Protocols.modbus_tcp import BE
+
+# Maximum number of requests sent to one target (host, port) before the first answer comes back.
+# Most gateways handle one transaction at a time, so pipelining is opt-in.
+MAXINFLIGHT = 1
+
+# One connection per target, shared by every device behind the same host and port
+_connections = {}
+
+
+class ModbusTCPError(Exception):
+    pass
+
+
+class Connection(object):
+    def __init__(self, host, port, timeout, max_inflight=MAXINFLIGHT):
+        # Arguments:
+        # host              :   ip address or hostname of the Modbus TCP server
+        # port              :   tcp port of the server
+        # timeout           :   seconds to wait for one response
+        # max_inflight      :   maximum number of outstanding requests on this connection
+
+        self.host = host
+        self.port = int(port)
+        self.timeout = float(timeout)
+        self.inflight = asyncio.Semaphore(max(1, int(max_inflight)))
+        self._connect_lock = asyncio.Lock()
+        self._reader = None
+        self._writer = None
+        self._receiver = None
+        self._pending = {}
+        self._transaction_id = 0
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ CONNECTION ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    @property
+    def is_open(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def open(self):
+        async with self._connect_lock:
+            if self.is_open:
+                return
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+            self._receiver = asyncio.ensure_future(self._receive())
+
+    def close(self, error=None):
+        if self._writer is not None:
+            self._writer.close()
+        self._writer = None
+        self._reader = None
+        if self._receiver is not None and self._receiver is not asyncio.current_task():
+            self._receiver.cancel()
+        self._receiver = None
+        # fail every request still waiting for an answer
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error or ModbusTCPError("connection to %s:%d closed" % (self.host, self.port)))
+        self._pending.clear()
+
+    async def _receive(self):
+        try:
+            while True:
+                header = await self._reader.readexactly(7)
+                transaction_id, protocol_id, length, unit_id = struct.unpack(">HHHB", header)
+                pdu = await self._reader.readexactly(length - 1)
+                future = self._pending.pop(transaction_id, None)
+                if future is not None and not future.done():
+                    future.set_result(pdu)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.close(e)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ TRANSACTIONS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    async def request(self, unit_id, pdu):
+        # Arguments:
+        # unit_id           :   Modbus unit identifier
+        # pdu               :   request PDU (function code and data)
+        # Return            :   response PDU, ModbusTCPError on exception response or timeout
+
+        async with self.inflight:
+            if not self.is_open:
+                await self.open()
+            self._transaction_id = (self._transaction_id + 1) & 0xFFFF
+            transaction_id = self._transaction_id
+            future = asyncio.get_running_loop().create_future()
+            self._pending[transaction_id] = future
+            self._writer.write(struct.pack(">HHHB", transaction_id, 0, len(pdu) + 1, unit_id) + pdu)
+            try:
+                await self._writer.drain()
+                response = await asyncio.wait_for(future, self.timeout)
+            except asyncio.TimeoutError:
+                # a late answer would desynchronise the stream, start over with a new connection
+                self._pending.pop(transaction_id, None)
+                self.close()
+                raise ModbusTCPError("timeout from %s:%d" % (self.host, self.port))
+
+        if response[0] & 0x80:
+            raise ModbusTCPError("exception code %d from %s:%d" % (response[1], self.host, self.port))
+        return response
+
+
+def get_connection(host, port, timeout, max_inflight=MAXINFLIGHT):
+    # Return            :   the shared Connection of (host, port), created on first use
+    key = (host, int(port))
+    connection = _connections.get(key)
+    if connection is None:
+        connection = Connection(host, port, timeout, max_inflight)
+        _connections[key] = connection
+    return connection
+
+
+def close_connection(host, port):
+    # Close the shared Connection of (host, port), once its last device is removed
+    connection = _connections.pop((host, int(port)), None)
+    if connection is not None:
+        connection.close()
+
+
+def close_all():
+    for connection in _connections.values():
+        connection.close()
+    _connections.clear()
+
+
+class Device(object):
+    # asyncio counterpart of Protocols.modbus_tcp.Device for the read methods used by the read plans
+    def __init__(self, host, port, timeout, byteorder=BE, unit_id=1, max_inflight=MAXINFLIGHT):
+        # big_endian        :   Byte order of the device memory structure
+        #                       True  >>  big endian
+        #                       False >>  little endian
+        if byteorder == BE:
+            self.big_endian = True
+        else:
+            self.big_endian = False
+
+        self.unit_id = unit_id
+        self.dev = get_connection(host, port, timeout, max_inflight)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ READ METHODS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    async def read_registers(self, start, count, functioncode=3):
+        # Return            :   list of uint16
+        response = await self.dev.request(self.unit_id, struct.pack(">BHH", functioncode, start, count))
+        if len(response) != 2 + 2 * count:
+            raise ModbusTCPError("failed to read %d registers from address %d" % (count, start))
+        return list(struct.unpack(">%dH" % count, response[2:]))
+
+    async def read_bit_list(self, start, count, functioncode=2):
+        # Return            :   list of bool
+        response = await self.dev.request(self.unit_id, struct.pack(">BHH", functioncode, start, count))
+        data = response[2:]
+        return [bool(data[i // 8] >> (i % 8) & 1) for i in range(count)]
+
+    # Method to read binary variable
+    async def read_bits(self, VarNameList, AddressList, functioncode=2):
+        # Arguments:
+        # VarNameList       :   list of variable name
+        # AddressList       :   list of variable register address in decimal (relative address)
+        # functioncode      :   1 >> for Discrete Output (Coils), 2 >> for Discrete Input
+        # Return            :   dictionary of variable name and its value
+
+        values = []
+        for address in AddressList:
+            values.append(await self.read_bit_list(address[0], len(address), functioncode))
+        return dict(zip(VarNameList, values))
+
+    # Method to read coalesced register blocks (see Poller.block_planner)
+    async def read_blocks(self, BlockList):
+        # Arguments:
+        # BlockList         :   list of register blocks, each with start, count and functioncode
+        # Return            :   list of uint16 lists, one per block
+        #
+        # The blocks are requested together, the connection limits how many are in flight
+
+        return list(await asyncio.gather(*[self.read_registers(block.start, block.count, block.functioncode)
+                                           for block in BlockList]))
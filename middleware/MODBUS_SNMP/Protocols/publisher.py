@@ -0,0 +1,403 @@
+import paho.mqtt.client as mqtt
+import Protocols.spool as MySpool
+import json
+import os
+import queue
+import threading
+from time import strftime, localtime
+import time, traceback
+
+# Maximum encoded size of a message before the frame in its "value" is split into topic/1, topic/2, ...
+MAXMESSAGEBYTES = 16 * 1024
+# Token bucket of the worker: at most PUBLISHRATE bytes per second on average, PUBLISHBURST at once
+PUBLISHRATE = 64 * 1024
+PUBLISHBURST = 256 * 1024
+# Maximum number of messages waiting in the outbound queue of one broker
+MAXQUEUESIZE = 10000
+# Messages published while the broker is unreachable are spooled to SPOOLFOLDER/<broker>_<port>
+# and replayed in order once the connection is back, at most REPLAYRATE messages per second between
+# the live messages (which are sent directly and no longer spooled, so the backlog only shrinks)
+SPOOLFOLDER = "spool"
+REPLAYRATE = 200
+# Broker of the local status, summary and error log messages
+LOCALBROKER = "localhost"
+LOCALPORT = 1883
+
+# One long-lived publisher per broker endpoint (address, port), shared by every polling thread.
+# The endpoint also names the spool folder, so one spool never has two writers
+_publishers = {}
+_publishers_lock = threading.Lock()
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst):
+        # Arguments:
+        # rate              :   tokens added per second, 0 to disable the bucket
+        # burst             :   maximum number of tokens
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+
+    def take(self, tokens, running=None):
+        # Arguments:
+        # tokens            :   tokens needed, a request above burst waits for a full bucket and leaves it in debt
+        # running           :   threading.Event, the wait stops when it is cleared
+        # Return            :   seconds waited
+        if self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            needed = min(tokens, self.burst)
+            if self.tokens >= needed or (running is not None and not running.is_set()):
+                self.tokens -= tokens
+                return waited
+            wait = (needed - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+class Publisher(object):
+    def __init__(self, broker_address, broker_port, username="", password=None, keepalive=60, max_queue=MAXQUEUESIZE,
+                 spool_folder=SPOOLFOLDER, replay_rate=REPLAYRATE, max_bytes=MAXMESSAGEBYTES,
+                 rate=PUBLISHRATE, burst=PUBLISHBURST):
+        # Arguments:
+        # broker_address    :   hostname or ip address of the MQTT broker
+        # broker_port       :   port of the MQTT broker
+        # username          :   broker username, empty string to disable
+        # password          :   broker password
+        # keepalive         :   MQTT keepalive in seconds
+        # max_queue         :   maximum number of messages waiting to be sent,
+        #                       the oldest message is dropped when the queue is full
+        # spool_folder      :   folder of the on-disk spools, None to drop the messages while offline
+        # replay_rate       :   messages per second replayed from the spool
+        # max_bytes         :   encoded size of a message above which its frame is split in chunks
+        # rate, burst       :   token bucket of the worker thread in bytes, rate 0 to send as fast as possible
+
+        self.broker_address = broker_address
+        self.broker_port = int(broker_port)
+        self.username = username
+        self.password = password
+        self.keepalive = keepalive
+
+        self.client = mqtt.Client()
+        if username:
+            self.client.username_pw_set(username, password)
+        elif password:
+            self.client.username_pw_set(password)
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+
+        self.queue = queue.Queue(max_queue)
+        self.max_bytes = max_bytes
+        self.bucket = TokenBucket(rate, burst)
+        self.replay_rate = float(replay_rate)
+        self.spool = None
+        if spool_folder is not None:
+            try:
+                self.spool = MySpool.Spool(os.path.join(os.getcwd(), spool_folder, "%s_%s" % (broker_address, broker_port)))
+            except Exception:
+                print("PUBLISHER: spool disabled for %s:%s" % (broker_address, broker_port))
+                print(traceback.format_exc())
+        self.connected = threading.Event()
+        self.running = threading.Event()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "queued": 0,
+            "published": 0,
+            "dropped": 0,
+            "failed": 0,
+            "reconnects": 0,
+            "chunked": 0,
+            "throttled": 0.0,
+            "latency_last": 0.0,
+            "latency_avg": 0.0,
+            "latency_max": 0.0,
+        }
+        self._worker = threading.Thread(target=self._run, name="publisher-%s:%s" % (broker_address, broker_port))
+        self._worker.setDaemon(True)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ CONNECTION ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def start(self):
+        # connect_async + loop_start lets paho's network thread handle the
+        # first connection and every reconnect in the background
+        self.running.set()
+        self.client.connect_async(self.broker_address, self.broker_port, self.keepalive)
+        self.client.loop_start()
+        self._worker.start()
+
+    def stop(self, timeout=5):
+        # flush what is still in the queue before closing the connection,
+        # what could not be sent is kept in the spool for the next start
+        deadline = time.time() + timeout
+        while not self.queue.empty() and self.connected.is_set() and time.time() < deadline:
+            time.sleep(0.1)
+        self.running.clear()
+        self._worker.join(timeout)
+        if self.spool is not None and not self._worker.is_alive():
+            while True:
+                try:
+                    self.spool.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self.spool.close()
+        self.client.disconnect()
+        self.client.loop_stop()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print("PUBLISHER: connected to %s:%s" % (self.broker_address, self.broker_port))
+            self.connected.set()
+        else:
+            print("PUBLISHER: connection to %s:%s refused, rc=%s" % (self.broker_address, self.broker_port, rc))
+
+    def _on_disconnect(self, client, userdata, rc):
+        if self.connected.is_set():
+            print("PUBLISHER: disconnected from %s:%s, rc=%s" % (self.broker_address, self.broker_port, rc))
+        self.connected.clear()
+        if rc != 0:
+            with self._stats_lock:
+                self._stats["reconnects"] += 1
+
+    def _on_publish(self, client, userdata, mid):
+        with self._inflight_lock:
+            t_queued = self._inflight.pop(mid, None)
+        if t_queued is None:
+            return
+        latency = time.time() - t_queued
+        with self._stats_lock:
+            self._stats["published"] += 1
+            n = self._stats["published"]
+            self._stats["latency_last"] = latency
+            self._stats["latency_avg"] += (latency - self._stats["latency_avg"]) / n
+            if latency > self._stats["latency_max"]:
+                self._stats["latency_max"] = latency
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ PUBLISH ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def chunks(self, data, dumps):
+        # Arguments:
+        # data      :   device message above max_bytes once encoded
+        # dumps     :   serializer of the payload
+        # Return    :   encoded messages of at most max_bytes, each one with the fields of data (device_name,
+        #               Timestamp, ...) and a part of the frame in "value", in the form of data ("value" as a
+        #               JSON string or as a dictionary). A single point above max_bytes gets its own message.
+        #               None when "value" is not a frame that can be split (text, "array" format)
+        frame = data.get("value")
+        text = isinstance(frame, str)
+        if text:
+            try:
+                frame = json.loads(frame)
+            except ValueError:
+                return None
+        if not isinstance(frame, dict) or len(frame) < 2:
+            return None
+
+        def message(part):
+            result = dict(data)
+            result["value"] = json.dumps(part) if text else part
+            return result
+
+        base = len(dumps(message({})))
+        chunks = []
+        part = {}
+        size = base
+        for key, value in frame.items():
+            # size the point adds to a message, its separator included
+            item_size = len(dumps(message({key: value}))) - base + 2
+            if len(part) != 0 and size + item_size > self.max_bytes:
+                chunks.append(dumps(message(part)))
+                part = {}
+                size = base
+            part[key] = value
+            size += item_size
+        chunks.append(dumps(message(part)))
+        return chunks
+
+    def publish(self, topic, data, qos=0, retain=False, encoder=None):
+        # Arguments:
+        # topic     :   MQTT topic
+        # data      :   dictionary or string, a dictionary gets a "Timestamp" key.
+        #               Above max_bytes once encoded, the frame in "value" of a device message is split into
+        #               topic/1, topic/2, ... (the topics of a device with split_publish), every part carrying
+        #               the other fields of the message
+        # qos       :   MQTT quality of service
+        # retain    :   MQTT retain flag
+        # encoder   :   payload_codec.Encoder serializing the message, None for JSON
+        # Return    :   False if a message had to be dropped, True otherwise
+        #
+        # The message is only queued here, the worker thread does the network I/O
+        # at the pace of the token bucket
+
+        dumps = json.dumps if encoder is None else encoder.dumps
+        if type(data) == dict:
+            data["Timestamp"] = strftime("%Y-%m-%d %H:%M:%S", localtime())
+        payload = dumps(data)
+        if type(data) == dict and len(payload) > self.max_bytes:
+            chunks = self.chunks(data, dumps)
+            if chunks is not None and len(chunks) > 1:
+                with self._stats_lock:
+                    self._stats["chunked"] += 1
+                ok = True
+                for i, chunk in enumerate(chunks, start=1):
+                    ok = self._enqueue(topic + "/" + str(i), chunk, qos, retain) and ok
+                return ok
+        return self._enqueue(topic, payload, qos, retain)
+
+    def _enqueue(self, topic, payload, qos, retain):
+        item = (time.time(), topic, payload, qos, retain)
+        dropped = False
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                break
+            except queue.Full:
+                # keep the newest samples, throw away the oldest one
+                try:
+                    self.queue.get_nowait()
+                    dropped = True
+                    with self._stats_lock:
+                        self._stats["dropped"] += 1
+                except queue.Empty:
+                    pass
+        with self._stats_lock:
+            self._stats["queued"] += 1
+        return not dropped
+
+    def _run(self):
+        next_replay = 0.0
+        while self.running.is_set():
+            # the backlog of the spool drains in the background at replay_rate, live messages are sent
+            # directly in between: nothing is added to the spool while connected, so it always empties
+            timeout = 1
+            if self.spool is not None and self.connected.is_set() and self.spool.pending():
+                wait = next_replay - time.time()
+                if wait <= 0:
+                    next_replay = time.time() + 1.0 / self.replay_rate
+                    self._replay()
+                    continue
+                timeout = wait
+
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if self.spool is not None and not self.connected.is_set():
+                self._to_spool(item)
+                continue
+
+            while self.running.is_set():
+                if not self.connected.wait(timeout=1):
+                    if self.spool is not None:
+                        self._to_spool(item)
+                        break
+                    continue
+                rc = self._send(item)
+                if rc == mqtt.MQTT_ERR_NO_CONN:
+                    # lost the connection between the check and the publish, retry
+                    self.connected.clear()
+                    continue
+                break
+
+    def _send(self, item):
+        # Return    :   paho return code of the publish
+        t_queued, topic, payload, qos, retain = item
+        waited = self.bucket.take(len(payload), self.running)
+        if waited:
+            with self._stats_lock:
+                self._stats["throttled"] += waited
+        try:
+            # the ack can arrive on paho's thread before publish() returns,
+            # so the mid is registered while holding the inflight lock
+            with self._inflight_lock:
+                info = self.client.publish(topic, payload, qos, retain)
+                if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                    self._inflight[info.mid] = t_queued
+        except Exception:
+            print(traceback.format_exc())
+            with self._stats_lock:
+                self._stats["failed"] += 1
+            return None
+        if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            with self._stats_lock:
+                self._stats["failed"] += 1
+        return info.rc
+
+    def _to_spool(self, item):
+        try:
+            self.spool.append(item)
+        except Exception:
+            print(traceback.format_exc())
+            with self._stats_lock:
+                self._stats["dropped"] += 1
+
+    def _replay(self):
+        # send the oldest spooled message, it stays in the spool if the connection is lost again
+        try:
+            item = self.spool.peek()
+            if item is None:
+                return
+            rc = self._send(tuple(item))
+            if rc == mqtt.MQTT_ERR_NO_CONN:
+                self.connected.clear()
+                return
+            self.spool.commit()
+        except Exception:
+            print(traceback.format_exc())
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ METRICS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def stats(self):
+        # Return    :   dictionary of counters, publish latency in seconds and current queue depth
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["broker"] = "%s:%s" % (self.broker_address, self.broker_port)
+        result["connected"] = self.connected.is_set()
+        result["queue_depth"] = self.queue.qsize()
+        result["inflight"] = len(self._inflight)
+        if self.spool is not None:
+            result["spool"] = dict(self.spool.stats)
+        return result
+
+
+def get_publisher(broker_address, broker_port, username="", password=None):
+    # Arguments:
+    # broker_address    :   hostname or ip address of the MQTT broker
+    # broker_port       :   port of the MQTT broker
+    # username          :   broker username
+    # password          :   broker password
+    # Return            :   the shared, already started Publisher for this endpoint, created with the
+    #                       credentials of the first call
+
+    key = (broker_address, int(broker_port))
+    with _publishers_lock:
+        publisher = _publishers.get(key)
+        if publisher is None:
+            publisher = Publisher(broker_address, broker_port, username, password)
+            publisher.start()
+            _publishers[key] = publisher
+    return publisher
+
+
+def get_local_publisher():
+    # Return            :   the shared Publisher of the local broker (status, summary and error log messages)
+    return get_publisher(LOCALBROKER, LOCALPORT)
+
+
+def all_stats():
+    with _publishers_lock:
+        publishers = list(_publishers.values())
+    return [publisher.stats() for publisher in publishers]
+
+
+def stop_all(timeout=5):
+    with _publishers_lock:
+        publishers = list(_publishers.values())
+        _publishers.clear()
+    for publisher in publishers:
+        publisher.stop(timeout)
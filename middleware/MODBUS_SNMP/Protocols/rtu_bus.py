@@ -0,0 +1,253 @@
+import minimalmodbus as mm
+import serial
+import queue
+import threading
+import itertools
+import time
+
+# Priority of a bus transaction, lower value is served first
+PRIORITY_CONTROL = 0
+PRIORITY_POLL = 10
+
+# Modbus RTU inter-frame silence: 3.5 character times (11 bits per character),
+# fixed at 1.75 ms above 19200 baud (Modbus over serial line spec, 2.5.1.1)
+SILENT_CHARACTERS = 3.5
+BITS_PER_CHARACTER = 11
+MINIMUM_SILENT_PERIOD = 0.00175
+
+# One bus per serial port, shared by every polling and control thread
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def silent_period(baudrate):
+    # Arguments:
+    # baudrate          :   baudrate of the serial line
+    # Return            :   minimum idle time in seconds between two frames
+    if baudrate > 19200:
+        return MINIMUM_SILENT_PERIOD
+    return SILENT_CHARACTERS * BITS_PER_CHARACTER / float(baudrate)
+
+
+class _Job(object):
+    def __init__(self, slaveaddress, function, args, kwargs):
+        self.slaveaddress = slaveaddress
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.t_queued = time.time()
+
+
+class Bus(object):
+    def __init__(self, port, baudrate, parity, stopbit, bytesize, timeout):
+        # Arguments:
+        # port              :   serial port name, e.g. /dev/ttyUSB0
+        # baudrate          :   baudrate of the serial line
+        # parity            :   NONE, EVEN, ODD, MARK or SPACE of installed_devices.json, not applied:
+        #                       the line runs without parity like the Device before the bus
+        # stopbit           :   number of stop bits
+        # bytesize          :   number of data bits
+        # timeout           :   read timeout in seconds
+        #
+        # The serial port is opened once and kept open. Every Modbus transaction on the
+        # port is executed by the bus worker thread, ordered by priority then arrival.
+
+        self.port = port
+        self.baudrate = int(baudrate)
+        self.parity = serial.PARITY_NONE
+        self.stopbit = stopbit
+        self.bytesize = bytesize
+        self.timeout = timeout
+        # serial.Serial of the port, set when the port is opened
+        self.serial = None
+
+        self.queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._instruments = {}
+        self._last_frame = 0.0
+        self.running = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "transactions": 0,
+            "failed": 0,
+            "reopened": 0,
+            "wait_max": 0.0,
+        }
+        self._worker = threading.Thread(target=self._run, name="rtu-bus-%s" % port)
+        self._worker.setDaemon(True)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ CONNECTION ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def start(self):
+        self.running.set()
+        self._worker.start()
+
+    def stop(self, timeout=5):
+        self.running.clear()
+        self._worker.join(timeout)
+        # release callers still waiting on the closed bus
+        while True:
+            try:
+                _, _, job = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            job.error = serial.SerialException("bus %s closed" % self.port)
+            job.done.set()
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except Exception:
+                pass
+
+    def _open(self):
+        if self.serial is None or not self.serial.is_open:
+            # minimalmodbus keeps one serial.Serial per port name, opened (or opened again) by the
+            # Instrument constructor: every slave of the port shares it, the settings are set on it here
+            self.serial = mm.Instrument(self.port, 1, close_port_after_each_call=False).serial
+            self.serial.baudrate = self.baudrate
+            self.serial.parity = self.parity
+            self.serial.stopbits = self.stopbit
+            self.serial.bytesize = self.bytesize
+            self.serial.timeout = self.timeout
+            print("MODBUS_RTU: opened %s" % self.port)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ TRANSACTIONS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def instrument(self, slaveaddress, priority=PRIORITY_POLL):
+        # Arguments:
+        # slaveaddress      :   Modbus slave address
+        # priority          :   PRIORITY_CONTROL for writes issued by control commands,
+        #                       PRIORITY_POLL for cyclic reads
+        # Return            :   proxy with the minimalmodbus.Instrument methods, every call
+        #                       is queued on this bus
+        return BusInstrument(self, slaveaddress, priority)
+
+    def _get_instrument(self, slaveaddress):
+        instrument = self._instruments.get(slaveaddress)
+        if instrument is None:
+            # created after _open, the Instrument takes the open serial.Serial of the port
+            instrument = mm.Instrument(self.port, slaveaddress, close_port_after_each_call=False)
+            self._instruments[slaveaddress] = instrument
+        return instrument
+
+    def call(self, slaveaddress, method, args=(), kwargs=None, priority=PRIORITY_POLL):
+        # Arguments:
+        # slaveaddress      :   Modbus slave address
+        # method            :   name of the minimalmodbus.Instrument method
+        # args, kwargs      :   arguments of the method
+        # priority          :   lower value is served first
+        # Return            :   result of the method, its exception is raised in the caller
+
+        job = _Job(slaveaddress, method, args, kwargs or {})
+        self.queue.put((priority, next(self._sequence), job))
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _run(self):
+        while self.running.is_set():
+            try:
+                priority, _, job = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            # Inter-frame silence since the end of the previous transaction
+            idle = time.time() - self._last_frame
+            gap = silent_period(self.baudrate)
+            if idle < gap:
+                time.sleep(gap - idle)
+
+            wait = time.time() - job.t_queued
+            try:
+                self._open()
+                instrument = self._get_instrument(job.slaveaddress)
+                job.result = getattr(instrument, job.function)(*job.args, **job.kwargs)
+            except serial.SerialException as e:
+                # USB adapter unplugged or port lost, reopen on the next transaction
+                job.error = e
+                try:
+                    self.serial.close()
+                except Exception:
+                    pass
+                with self._stats_lock:
+                    self._stats["failed"] += 1
+                    self._stats["reopened"] += 1
+            except Exception as e:
+                job.error = e
+                with self._stats_lock:
+                    self._stats["failed"] += 1
+            finally:
+                self._last_frame = time.time()
+                with self._stats_lock:
+                    self._stats["transactions"] += 1
+                    if wait > self._stats["wait_max"]:
+                        self._stats["wait_max"] = wait
+                job.done.set()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ METRICS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def stats(self):
+        # Return    :   dictionary of counters, longest queue wait in seconds and current queue depth
+        with self._stats_lock:
+            result = dict(self._stats)
+        result["port"] = self.port
+        result["open"] = self.serial is not None and self.serial.is_open
+        result["queue_depth"] = self.queue.qsize()
+        return result
+
+
+class BusInstrument(object):
+    # Stand-in for minimalmodbus.Instrument, every method call becomes one bus transaction
+    def __init__(self, bus, slaveaddress, priority=PRIORITY_POLL):
+        self.bus = bus
+        self.address = slaveaddress
+        self.priority = priority
+
+    def __getattr__(self, name):
+        if not callable(getattr(mm.Instrument, name, None)) or name.startswith("_"):
+            raise AttributeError(name)
+
+        def method(*args, **kwargs):
+            return self.bus.call(self.address, name, args, kwargs, self.priority)
+        return method
+
+
+def get_bus(port, baudrate, parity, stopbit, bytesize, timeout):
+    # Arguments:
+    # port              :   serial port name
+    # baudrate, parity, stopbit, bytesize, timeout  :   serial settings, used when the bus is created
+    # Return            :   the shared, already started Bus for this port, kept until close_bus(port)
+
+    with _buses_lock:
+        bus = _buses.get(port)
+        if bus is None:
+            bus = Bus(port, baudrate, parity, stopbit, bytesize, timeout)
+            bus.start()
+            _buses[port] = bus
+    return bus
+
+
+def close_bus(port, timeout=5):
+    # Stop and drop the bus of a port, the next get_bus opens it again with its new serial settings
+    # Arguments:
+    # port              :   serial port name
+    with _buses_lock:
+        bus = _buses.pop(port, None)
+    if bus is not None:
+        bus.stop(timeout)
+        print("MODBUS_RTU: closed %s" % port)
+
+
+def all_stats():
+    with _buses_lock:
+        buses = list(_buses.values())
+    return [bus.stats() for bus in buses]
+
+
+def close_all(timeout=5):
+    with _buses_lock:
+        buses = list(_buses.values())
+        _buses.clear()
+    for bus in buses:
+        bus.stop(timeout)
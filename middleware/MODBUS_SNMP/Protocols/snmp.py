@@ -1,6 +1,6 @@
-import math
-from easysnmp import Session
+import re
 import Protocols.alarm as _alarm
+import Protocols.snmp_session as MySNMPSession
 import colorama
 from colorama import Fore, Style
 
@@ -22,9 +22,107 @@ ALARM_SNMP = [ALARMTYPE]
 dataPerAccess = 22
 debug = False
 
+# GETBULK table walk: rows per column and columns per PDU
+MAXBULKREPETITIONS = 32
+MAXBULKCOLUMNS = 10
+# Rows of a column walked to its end (walk_columns)
+MAXWALKROWS = 10000
+# snmp_type of a varbind without value
+MISSING = ["NOSUCHOBJECT", "NOSUCHINSTANCE", "ENDOFMIBVIEW", "NOSUCHNAME"]
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ TABLE TEMPLATES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+# Row arc of an OID template: "x", "N+x" or "x+N" (row number added), or "Nx" (row number appended to N,
+# ".490x.0" is ".4901.0", ".4902.0", ... like the library templates of the DPC rectifiers)
+ROW_ARC = re.compile(r"^(?:(\d+)\+)?x(?:\+(\d+))?$")
+GLUED_ROW_ARC = re.compile(r"^(\d+)x$")
+
+def oid_key(oid):
+    # OID >> tuple of int, for the ordering of OIDs
+    return tuple(int(arc) for arc in oid.strip(".").split(".") if arc != "")
+
+class TableColumn(object):
+    # One table variable of the device library, compiled once at map time
+    def __init__(self, var_name, template, rows, multiplier=None):
+        # Arguments:
+        # var_name          :   variable name, the result keys are "<var_name>_<row>"
+        # template          :   OID template, "x" is the row number (row 1 is the first row), see ROW_ARC
+        # rows              :   total row, number or OID of the row count
+        # multiplier        :   multiplier of a numeric variable, None for a string variable
+        self.var_name = var_name
+        self.rows = rows
+        self.multiplier = multiplier
+
+        arcs = template.split(".")
+        position = None
+        # digits the row number is appended to, None for an added row number
+        self.glued = None
+        for i, arc in enumerate(arcs):
+            match = ROW_ARC.match(arc.strip())
+            glued = GLUED_ROW_ARC.match(arc.strip())
+            if match:
+                position = i
+                self.offset = int(match.group(1) or 0) + int(match.group(2) or 0)
+            elif glued:
+                position = i
+                self.offset = 0
+                self.glued = glued.group(1)
+        if position is None:
+            # no row arc, every row reads the same OID
+            self.prefix, self.suffix, self.offset = template, None, 0
+        else:
+            self.prefix = ".".join(arcs[:position])
+            self.suffix = "".join("." + arc for arc in arcs[position + 1:])
+        # a column ("prefix.x") is walked, other templates are read row by row
+        self.is_column = self.suffix == "" and self.glued is None
+        self.prefix_key = oid_key(self.prefix)
+
+    def oid(self, k):
+        if self.suffix is None:
+            return self.prefix
+        if self.glued is not None:
+            return self.prefix + "." + self.glued + str(k) + self.suffix
+        return self.prefix + "." + str(self.offset + k) + self.suffix
+
+    def start_oid(self):
+        # the next OID after it is the first row
+        return self.prefix + "." + str(self.offset)
+
+    def row_of(self, oid):
+        # walked OID >> row number, None when the OID is not a row of the column
+        key = oid_key(oid)
+        if len(key) != len(self.prefix_key) + 1 or key[:-1] != self.prefix_key:
+            return None
+        return key[-1] - self.offset
+
+    def convert(self, value):
+        if self.multiplier is None:
+            return str(value)
+        return round(int(value) * self.multiplier, 3)
+
+def compile_table(VarNameList, OIDList, rowList, MultiplierList=None):
+    # Arguments:
+    # VarNameList       :   list of variable name
+    # OIDList           :   list of variable OID template
+    # rowList           :   list of total row (number or OID of the row count)
+    # MultiplierList    :   list of multiplier, None for string variables
+    # Return            :   list of TableColumn for Device.read_table()
+    if MultiplierList is None:
+        MultiplierList = [None] * len(VarNameList)
+    return [TableColumn(*item) for item in zip(VarNameList, OIDList, rowList, MultiplierList)]
+
 class Device():
     def __init__(self, IPaddress, Port, Community, Version, Timeout):
-        self.dev = Session(hostname=IPaddress, remote_port=Port, community=Community, version=Version, timeout=Timeout)
+        # The session is leased from the pool of the agent until close()
+        self.pool = MySNMPSession.get_pool(IPaddress, Port, Community, Version, Timeout)
+        self.dev = self.pool.acquire()
+        self.version = Version
+
+    def close(self, error=None):
+        # Arguments:
+        # error             :   exception that ended the use of the device, None when it succeeded
+        if self.dev is not None:
+            self.pool.release(self.dev, error)
+            self.dev = None
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ READ METHODS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
     # Method to numeric variable from regular OID
@@ -36,19 +134,10 @@ class Device():
         # Return            :   dictionary of variable name and its value
 
         self.values = []
-        
-        self.operation = math.ceil(len(OIDList) / dataPerAccess)
-        i = 0
-        for opr in range(self.operation):
-            try:
-                data = self.dev.get(OIDList[i:i + dataPerAccess])
-            except:
-                data = self.dev.get(OIDList[i:])
 
-            for item in data:
-                self.values.append(int(item.value))
-
-            i += dataPerAccess
+        # chunks of the learned max OIDs per GET, sent concurrently
+        for item in self.pool.get(OIDList, self.dev):
+            self.values.append(int(item.value))
 
         for i in range(0, len(self.values)):
             self.values[i] = round(self.values[i] * MultiplierList[i], 3)
@@ -65,18 +154,8 @@ class Device():
 
         self.values = []
 
-        self.operation = math.ceil(len(OIDList) / dataPerAccess)
-        i = 0
-        for opr in range(self.operation):
-            try:
-                data = self.dev.get(OIDList[i:i + dataPerAccess])
-            except:
-                data = self.dev.get(OIDList[i:])
-
-            for item in data:
-                self.values.append(str(item.value))
-
-            i += dataPerAccess
+        for item in self.pool.get(OIDList, self.dev):
+            self.values.append(str(item.value))
 
         self.Result = dict(zip(VarNameList, self.values))
         return self.Result
@@ -87,12 +166,13 @@ class Device():
         # OIDList           :   list of variable OID address
         # Return            :   dictionary of variable name and its value
         
+        # the alarm handlers keep their state (device model, last alarm table) in the pool cache of the agent
         if typeAlarm[0] == "Tripplite":
-            data = _alarm.Tripplite_SNMP(self.dev, OIDList)
+            data = _alarm.Tripplite_SNMP(self, OIDList)
         elif typeAlarm[0] == "APC":
-            data = _alarm.APC_SNMP(self.dev, OIDList)
+            data = _alarm.APC_SNMP(self, OIDList)
         elif typeAlarm[0] == "KEHUA":
-            data = _alarm.KEHUA_SNMP(self.dev, VarNameList, OIDList)
+            data = _alarm.KEHUA_SNMP(self, VarNameList, OIDList)
         else:
             print(Fore.RED + "\n=============================== Alarm Not Registered =================================="+ Fore.WHITE)
                 
@@ -100,104 +180,153 @@ class Device():
         self.Result = data
         return self.Result
 
-    # Method to string variable from Table OID
+    # Method to numeric variable from Table OID
     def read_num_tab(self, VarNameList, OIDList, rowList, MultiplierList):
         # Arguments:
         # VarNameList       :   list of variable name
-        # OIDList           :   list of variable OID address
-        # rowList           :   list of total row that we want to get from table column (max repetition in getBulk operation)
+        # OIDList           :   list of variable OID template, "x" is the row number
+        # rowList           :   list of total row (number or OID of the row count) of every table column
         # MultiplierList    :   list of multiplier
-        # Return            :   dictionary of variable name and its value
-
-        self.values = []
-        self.Result = {}
-        i = 0
+        # Return            :   dictionary of "<variable name>_<row>" and its value
 
-        for oid in OIDList:
-            if debug:
-                print(oid)
-            if isinstance(rowList[i], str):
-                if debug:
-                    print(rowList[i])
-                number_of_tables = self.dev.get(rowList[i])
-                for k in range(int(number_of_tables.value)):
-                    if "+" in oid:
-                        split_char = oid.split(".")
-                        split_char[len(split_char)-2] = str(eval(split_char[len(split_char)-2].replace("x", str(k+1))))
-                        new_oid = '.'.join(split_char)
-                        if debug:
-                            print(new_oid)
-                        data = self.dev.get(new_oid)
-                        if debug:
-                            print(data)
-                        self.Result[VarNameList[i] + "_" + str(k+1)] = round(int(data.value) * MultiplierList[i], 3)
-                    else:    
-                        if debug:
-                            print(oid.replace("x", str(k+1)))
-                        data = self.dev.get(oid.replace("x", str(k+1)))
-                        if debug:
-                            print(data)
-                        self.Result[VarNameList[i] + "_" + str(k+1)] = round(int(data.value) * MultiplierList[i], 3)
-                i += 1
-            else:
-                for k in range(rowList[i]):
-                    if "+" in oid:
-                        split_char = oid.split(".")
-                        split_char[len(split_char)-2] = str(eval(split_char[len(split_char)-2].replace("x", str(k+1))))
-                        new_oid = '.'.join(split_char)
-                        if debug:
-                            print(new_oid)
-                        data = self.dev.get(new_oid)
-                        if debug:
-                            print(data)
-                        self.Result[VarNameList[i] + "_" + str(k+1)] = round(int(data.value) * MultiplierList[i], 3)
-                    else:    
-                        if debug:
-                            print(oid.replace("x", str(k+1)))
-                        data = self.dev.get(oid.replace("x", str(k+1)))
-                        if debug:
-                            print(data)
-                        self.Result[VarNameList[i] + "_" + str(k+1)] = round(int(data.value) * MultiplierList[i], 3)
-                i += 1
-
-        return self.Result
+        return self.read_table(compile_table(VarNameList, OIDList, rowList, MultiplierList))
 
     # Method to string variable from Table OID
     def read_string_tab(self, VarNameList, OIDList, rowList):
         # Arguments:
         # VarNameList       :   list of variable name
-        # OIDList           :   list of variable OID address
-        # rowList           :   list of total row that we want to get from table column (max repetition in getBulk operation)
-        # Return            :   dictionary of variable name and its value
+        # OIDList           :   list of variable OID template, "x" is the row number
+        # rowList           :   list of total row (number or OID of the row count) of every table column
+        # Return            :   dictionary of "<variable name>_<row>" and its value
+
+        return self.read_table(compile_table(VarNameList, OIDList, rowList))
+
+    # Method to read table columns compiled by compile_table()
+    def read_table(self, columns):
+        # Arguments:
+        # columns           :   list of TableColumn
+        # Return            :   dictionary of "<variable name>_<row>" and its value
+        #
+        # Columns ("prefix.x") are walked with GETBULK (GETNEXT in SNMP v1), several columns per PDU,
+        # other templates ("prefix.x.0", "prefix.N+x.0") are read with multi-OID GETs of the session pool
+
+        rows = self.read_row_counts(columns)
+        values = {id(column): {} for column in columns}
+
+        self.walk([column for column in columns if column.is_column and rows[id(column)] > 0], rows, values)
+
+        fixed = [(column, k) for column in columns if not column.is_column for k in range(1, rows[id(column)] + 1)]
+        data = self.pool.get([column.oid(k) for column, k in fixed], self.dev)
+        for (column, k), item in zip(fixed, data):
+            if item.snmp_type not in MISSING:
+                values[id(column)][k] = column.convert(item.value)
 
-        self.values = []
         self.Result = {}
-        i = 0
-        for oid in OIDList:
-            if isinstance(rowList[i], str):
+        for column in columns:
+            column_values = values[id(column)]
+            for k in sorted(column_values):
+                self.Result[column.var_name + "_" + str(k)] = column_values[k]
+        return self.Result
+
+    def read_row_counts(self, columns):
+        # Return            :   dictionary of id(column) and its number of rows,
+        #                       every row count OID is read once in one multi-OID GET
+        count_oids = []
+        for column in columns:
+            if isinstance(column.rows, str) and column.rows not in count_oids:
+                count_oids.append(column.rows)
+
+        counts = {}
+        for oid, item in zip(count_oids, self.pool.get(count_oids, self.dev)):
+            counts[oid] = int(item.value) if item.snmp_type not in MISSING else 0
+        if debug:
+            print(counts)
+
+        return {id(column): counts[column.rows] if isinstance(column.rows, str) else int(column.rows)
+                for column in columns}
+
+    # Method to walk whole table columns, e.g. an alarm table indexed by alarm id
+    def walk_columns(self, OIDList):
+        # Arguments:
+        # OIDList           :   list of table column OID
+        # Return            :   list of dictionary of row index and its string value, one per column
+
+        columns = [TableColumn(oid, oid + ".x", MAXWALKROWS) for oid in OIDList]
+        rows = {id(column): MAXWALKROWS for column in columns}
+        values = {id(column): {} for column in columns}
+        self.walk(columns, rows, values)
+        return [values[id(column)] for column in columns]
+
+    def walk(self, columns, rows, values):
+        if str(self.version) == "1":
+            self.walk_next(columns, rows, values)
+        else:
+            self.walk_bulk(columns, rows, values)
+
+    def walk_bulk(self, columns, rows, values):
+        # GETBULK of up to MAXBULKCOLUMNS columns per PDU, the agent answers row by row:
+        # varbind j of the response belongs to the column j % number of columns
+        cursor = {id(column): column.start_oid() for column in columns}
+        active = list(columns)
+        use_numeric = self.dev.use_numeric
+        self.dev.use_numeric = True
+        try:
+            while len(active) != 0:
+                batch = active[:MAXBULKCOLUMNS]
+                remaining = max(rows[id(column)] - len(values[id(column)]) for column in batch)
+                repetitions = min(MAXBULKREPETITIONS, remaining)
+                data = self.dev.get_bulk([cursor[id(column)] for column in batch], 0, repetitions)
                 if debug:
-                    print(rowList[i])
-                number_of_tables = self.dev.get(rowList[i])
-                for k in range(int(number_of_tables.value)):
-                    if debug:
-                        print(oid.replace("x", str(k+1)))
-                    data = self.dev.get(oid.replace("x", str(k+1)))
-                    if debug:
-                        print(data)
-                    self.Result[VarNameList[i] + "_" + str(k+1)] = round(int(data.value) * MultiplierList[i], 3)
-                i += 1
-            else:
-                for k in range(rowList[i]):
-                    if debug:
-                        print(oid.replace("x", str(k+1)))
-                    data = self.dev.get(oid.replace("x", str(k+1)))
-                    if debug:
-                        print(data)
-                    self.Result[VarNameList[i] + "_" + str(k+1)] = round(int(data.value) * MultiplierList[i], 3)
-                i += 1
+                    print(data)
 
-        return self.Result
+                done = set()
+                for j, item in enumerate(data):
+                    column = batch[j % len(batch)]
+                    if id(column) in done:
+                        continue
+                    if not self.collect(column, item, rows, values, cursor):
+                        done.add(id(column))
+                # a column without any varbind in the response cannot progress either
+                done.update(id(column) for column in batch[len(data):])
+                active = [column for column in active if id(column) not in done]
+        finally:
+            self.dev.use_numeric = use_numeric
+
+    def walk_next(self, columns, rows, values):
+        # GETNEXT of up to dataPerAccess columns per PDU, one row of every column per request
+        cursor = {id(column): column.start_oid() for column in columns}
+        active = list(columns)
+        use_numeric = self.dev.use_numeric
+        self.dev.use_numeric = True
+        try:
+            while len(active) != 0:
+                batch = active[:dataPerAccess]
+                data = self.dev.get_next([cursor[id(column)] for column in batch])
+                if debug:
+                    print(data)
+
+                done = set(id(column) for column in batch[len(data):])
+                for column, item in zip(batch, data):
+                    if not self.collect(column, item, rows, values, cursor):
+                        done.add(id(column))
+                active = [column for column in active if id(column) not in done]
+        finally:
+            self.dev.use_numeric = use_numeric
 
+    def collect(self, column, item, rows, values, cursor):
+        # Store one walked varbind of a column
+        # Return            :   False when the walk of the column is finished
+        if item.snmp_type in MISSING:
+            return False
+        oid = item.oid if item.oid_index in (None, "") else item.oid + "." + item.oid_index
+        k = column.row_of(oid)
+        if k is None or oid_key(oid) <= oid_key(cursor[id(column)]):
+            return False
+        cursor[id(column)] = oid
+        if k > rows[id(column)]:
+            return False
+        values[id(column)][k] = column.convert(item.value)
+        return k < rows[id(column)]
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WRITE METHODS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
     # Method to write a value in single OID
@@ -0,0 +1,225 @@
+from easysnmp import Session, EasySNMPError, EasySNMPConnectionError, EasySNMPTimeoutError
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+# Largest GET of a new device, halved on every tooBig answer down to what the agent accepts
+MAXOIDS = 48
+# Concurrent GET chunks of one device, and idle sessions kept per device
+MAXCONCURRENT = 4
+MAXIDLE = 4
+# Consecutive failed requests before the device is unhealthy: its chunks are then sent one by one
+# so a dead agent costs one timeout per poll instead of one per chunk
+UNHEALTHY_FAILURES = 3
+# netsnmp error status of a tooBig response
+SNMP_ERR_TOOBIG = 1
+
+# One pool per (host, port, community, version), shared by the polling and control threads
+_pools = {}
+_pools_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def is_too_big(session, error):
+    return session.error_number == SNMP_ERR_TOOBIG or "tooBig" in str(error)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAXCONCURRENT * 4, thread_name_prefix="snmp-chunk")
+    return _executor
+
+
+class SessionPool(object):
+    def __init__(self, host, port, community, version, timeout):
+        # Arguments:
+        # host, port, community, version    :   key of the pool
+        # timeout                           :   timeout in seconds of the sessions created by the pool
+        #
+        # An easysnmp Session is not safe for concurrent requests, every session is leased to
+        # one thread at a time with acquire() and handed back with release().
+
+        self.host = host
+        self.port = port
+        self.community = community
+        self.version = version
+        self.timeout = timeout
+        self.max_oids = MAXOIDS
+        # Values read once per agent (device model, last alarm table), cleared when a session fails
+        self.cache = {}
+
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "failed": 0,
+            "too_big": 0,
+            "sessions_created": 0,
+            "consecutive_failures": 0,
+            "last_error": None,
+            "last_success": None,
+        }
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ SESSIONS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def acquire(self):
+        with self._lock:
+            if len(self._idle) != 0:
+                return self._idle.pop()
+            self._stats["sessions_created"] += 1
+        return Session(hostname=self.host, remote_port=self.port, community=self.community,
+                       version=self.version, timeout=self.timeout)
+
+    def release(self, session, error=None):
+        # Arguments:
+        # session           :   session leased by acquire()
+        # error             :   exception of the last request of the lease, None when it succeeded
+        #
+        # A session that timed out or lost its transport is dropped, the next lease opens a new one
+        with self._lock:
+            # EasySNMPTimeoutError is not an EasySNMPConnectionError in easysnmp
+            if isinstance(error, (EasySNMPConnectionError, EasySNMPTimeoutError)):
+                # the agent may have been restarted or replaced
+                self.cache.clear()
+                return
+            if len(self._idle) < MAXIDLE:
+                self._idle.append(session)
+
+    def close(self):
+        with self._lock:
+            self._idle = []
+            self.cache.clear()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ HEALTH ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def record(self, error=None):
+        with self._lock:
+            self._stats["requests"] += 1
+            if error is None:
+                self._stats["consecutive_failures"] = 0
+                self._stats["last_success"] = time.time()
+            elif isinstance(error, EasySNMPError):
+                self._stats["failed"] += 1
+                self._stats["consecutive_failures"] += 1
+                self._stats["last_error"] = str(error)
+
+    def healthy(self):
+        with self._lock:
+            return self._stats["consecutive_failures"] < UNHEALTHY_FAILURES
+
+    def shrink(self, size):
+        # Remember a GET of size OIDs was too big for the agent
+        with self._lock:
+            self._stats["too_big"] += 1
+            self.max_oids = max(1, min(self.max_oids, size // 2))
+            return self.max_oids
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ REQUESTS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def get(self, oids, session):
+        # Arguments:
+        # oids              :   list of OID
+        # session           :   session leased by the caller, it sends the first chunk
+        # Return            :   list of SNMPVariable, in the order of oids
+        #
+        # The OIDs are packed in chunks of max_oids. The chunks are sent concurrently on sessions
+        # of the pool while the device is healthy, else one after the other.
+
+        if len(oids) == 0:
+            return []
+        size = self.max_oids
+        chunks = [oids[i:i + size] for i in range(0, len(oids), size)]
+        if len(chunks) == 1 or not self.healthy():
+            data = []
+            for chunk in chunks:
+                data += self.get_chunk(chunk, session)
+            return data
+
+        concurrent = chunks[1:MAXCONCURRENT]
+        sequential = chunks[MAXCONCURRENT:]
+        futures = [get_executor().submit(self.get_leased, chunk) for chunk in concurrent]
+        try:
+            data = self.get_chunk(chunks[0], session)
+        finally:
+            # every leased session is back in the pool before an error is raised
+            results = [future.exception() or future.result() for future in futures]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+            data += result
+        for chunk in sequential:
+            data += self.get_chunk(chunk, session)
+        return data
+
+    def get_leased(self, oids):
+        session = self.acquire()
+        error = None
+        try:
+            return self.get_chunk(oids, session)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self.release(session, error)
+
+    def get_chunk(self, oids, session):
+        # One GET, split again when the agent answers tooBig
+        try:
+            data = session.get(oids)
+            self.record()
+        except EasySNMPError as e:
+            if len(oids) == 1 or not is_too_big(session, e):
+                self.record(e)
+                raise
+            size = self.shrink(len(oids))
+            print("SNMP: %s:%s tooBig for %d OIDs, max OIDs per GET is now %d" % (self.host, self.port, len(oids), size))
+            data = []
+            for i in range(0, len(oids), size):
+                data += self.get_chunk(oids[i:i + size], session)
+        return data
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ METRICS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def stats(self):
+        with self._lock:
+            result = dict(self._stats)
+            result["idle_sessions"] = len(self._idle)
+        result["host"] = self.host
+        result["port"] = self.port
+        result["version"] = self.version
+        result["max_oids"] = self.max_oids
+        result["healthy"] = result["consecutive_failures"] < UNHEALTHY_FAILURES
+        return result
+
+
+def get_pool(host, port, community, version, timeout):
+    # Arguments:
+    # host, port, community, version    :   SNMP agent and credentials
+    # timeout                           :   session timeout in seconds, used when the pool is created
+    # Return                            :   the shared SessionPool of the agent
+
+    key = (host, port, community, version)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SessionPool(host, port, community, version, timeout)
+            _pools[key] = pool
+    return pool
+
+
+def all_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return [pool.stats() for pool in pools]
+
+
+def close_all():
+    global _executor
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+            _executor = None
@@ -0,0 +1,254 @@
+import base64
+import json
+import os
+import struct
+import time
+import zlib
+
+# Store-and-forward of a Publisher while its broker is unreachable.
+# The spool is a folder of append-only segment files "<sequence>.seg", every record is
+#   length (4 bytes) | crc32 (4 bytes) | json [time queued, topic, payload, qos, retain]
+# A binary payload (MessagePack, CBOR) is stored as {"b64": <base64 of the payload>}
+# Records are replayed oldest first, the replay position is kept in the "cursor" file.
+# The cursor is saved every CURSORRECORDS replayed records or FSYNCINTERVAL seconds, when a segment
+# is finished and on close: replay is at-least-once, a crash can send again the records replayed
+# since the last save, a restart never loses one.
+
+SEGMENTBYTES = 1024 * 1024
+# Oldest segments are deleted above MAXSPOOLBYTES, records older than MAXAGE seconds are not replayed
+MAXSPOOLBYTES = 64 * 1024 * 1024
+MAXAGE = 7 * 24 * 3600
+# fsync of the segment at most every FSYNCINTERVAL seconds (batched, flushed on close)
+FSYNCINTERVAL = 1.0
+# replayed records between two saves of the cursor (batched like the fsync, saved on close)
+CURSORRECORDS = 100
+
+HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+
+def segment_name(sequence):
+    return "%016d%s" % (sequence, SEGMENT_SUFFIX)
+
+
+class Spool(object):
+    def __init__(self, folder, max_bytes=MAXSPOOLBYTES, max_age=MAXAGE, segment_bytes=SEGMENTBYTES):
+        # Arguments:
+        # folder            :   folder of the segment files, created if missing
+        # max_bytes         :   byte cap of the spool
+        # max_age           :   age cap of a record in seconds
+        # segment_bytes     :   size of a segment before a new one is started
+        #
+        # Not thread safe, a spool belongs to the worker thread of one Publisher
+
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.segment_bytes = segment_bytes
+        os.makedirs(folder, exist_ok=True)
+
+        self.segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(folder)
+                               if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+        self.read_segment, self.read_offset = self._load_cursor()
+        self._writer = None
+        self._reader = None
+        self._last_fsync = 0.0
+        self._last_cursor = time.time()
+        # records replayed since the last save of the cursor
+        self._unsaved = 0
+        self.stats = {"spooled": 0, "replayed": 0, "expired": 0, "discarded": 0}
+
+        if len(self.segments) != 0:
+            self._repair(self.segments[-1])
+        # segments before the cursor were already replayed
+        while len(self.segments) != 0 and self.segments[0] < self.read_segment:
+            self._delete(self.segments[0])
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ FILES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def _path(self, sequence):
+        return os.path.join(self.folder, segment_name(sequence))
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.folder, CURSOR_FILE)) as cursor:
+                segment, offset = json.load(cursor)
+                return int(segment), int(offset)
+        except (OSError, ValueError, TypeError):
+            return 0, 0
+
+    def _save_cursor(self):
+        path = os.path.join(self.folder, CURSOR_FILE)
+        with open(path + ".tmp", "w") as cursor:
+            json.dump([self.read_segment, self.read_offset], cursor)
+        os.replace(path + ".tmp", path)
+        self._last_cursor = time.time()
+        self._unsaved = 0
+
+    def _repair(self, sequence):
+        # A power cut can leave a half written record at the end of the last segment, cut it off
+        path = self._path(sequence)
+        valid = 0
+        with open(path, "rb") as segment:
+            while True:
+                record = self._read_record(segment)
+                if record is None:
+                    break
+                valid = segment.tell()
+        if valid != os.path.getsize(path):
+            print("SPOOL: truncating %s at %d bytes" % (path, valid))
+            with open(path, "r+b") as segment:
+                segment.truncate(valid)
+
+    def _delete(self, sequence):
+        if self._reader is not None and self._reader[0] == sequence:
+            self._reader[1].close()
+            self._reader = None
+        if self._writer is not None and self._writer[0] == sequence:
+            self._writer[1].close()
+            self._writer = None
+        try:
+            os.remove(self._path(sequence))
+        except OSError:
+            pass
+        self.segments.remove(sequence)
+
+    @staticmethod
+    def _read_record(segment):
+        header = segment.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+        length, crc = HEADER.unpack(header)
+        body = segment.read(length)
+        if len(body) < length or zlib.crc32(body) != crc:
+            return None
+        return body
+
+    def size(self):
+        total = 0
+        for sequence in self.segments:
+            try:
+                total += os.path.getsize(self._path(sequence))
+            except OSError:
+                pass
+        return total
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WRITE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def append(self, item):
+        # Arguments:
+        # item              :   (time queued, topic, payload, qos, retain) of the Publisher queue
+        item = list(item)
+        if isinstance(item[2], (bytes, bytearray)):
+            item[2] = {"b64": base64.b64encode(item[2]).decode()}
+        body = json.dumps(item).encode()
+        if self._writer is None or self._writer[1].tell() >= self.segment_bytes:
+            self._roll()
+        segment = self._writer[1]
+        segment.write(HEADER.pack(len(body), zlib.crc32(body)) + body)
+        segment.flush()
+        self.stats["spooled"] += 1
+
+        now = time.time()
+        if now - self._last_fsync >= FSYNCINTERVAL:
+            os.fsync(segment.fileno())
+            self._last_fsync = now
+
+    def _roll(self):
+        if self._writer is None and len(self.segments) != 0 and \
+                os.path.getsize(self._path(self.segments[-1])) < self.segment_bytes:
+            # restart: keep appending to the last segment
+            sequence = self.segments[-1]
+        else:
+            if self._writer is not None:
+                os.fsync(self._writer[1].fileno())
+                self._writer[1].close()
+            sequence = self.segments[-1] + 1 if len(self.segments) != 0 else max(self.read_segment, 1)
+            self.segments.append(sequence)
+        self._writer = (sequence, open(self._path(sequence), "ab"))
+        self._enforce_size()
+
+    def _enforce_size(self):
+        # byte cap: the oldest segments are dropped, never the one being written
+        while len(self.segments) > 1 and self.size() > self.max_bytes:
+            oldest = self.segments[0]
+            print("SPOOL: %s over %d bytes, dropping %s" % (self.folder, self.max_bytes, segment_name(oldest)))
+            self.stats["discarded"] += 1
+            self._delete(oldest)
+            if oldest == self.read_segment:
+                self.read_segment, self.read_offset = (self.segments[0] if len(self.segments) else 0), 0
+                self._save_cursor()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ REPLAY ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def pending(self):
+        # Return            :   True when records are waiting to be replayed
+        if len(self.segments) == 0:
+            return False
+        if self.read_segment < self.segments[0]:
+            self.read_segment, self.read_offset = self.segments[0], 0
+        if self.read_segment != self.segments[-1]:
+            return True
+        if self._writer is not None:
+            self._writer[1].flush()
+        return os.path.getsize(self._path(self.read_segment)) > self.read_offset
+
+    def peek(self):
+        # Return            :   oldest record not replayed yet, None when the spool is empty.
+        #                       It stays the oldest until commit().
+        while self.pending():
+            if self._reader is None or self._reader[0] != self.read_segment:
+                if self._reader is not None:
+                    self._reader[1].close()
+                self._reader = (self.read_segment, open(self._path(self.read_segment), "rb"))
+            segment = self._reader[1]
+            segment.seek(self.read_offset)
+            body = self._read_record(segment)
+            if body is not None:
+                self._next_offset = segment.tell()
+                item = json.loads(body.decode())
+                if isinstance(item[2], dict):
+                    item[2] = base64.b64decode(item[2]["b64"])
+                if time.time() - item[0] > self.max_age:
+                    self.stats["expired"] += 1
+                    self._advance()
+                    continue
+                return item
+            # end of a finished segment (or a damaged record), continue with the next one
+            if self.read_segment == self.segments[-1]:
+                return None
+            self._delete(self.read_segment)
+            self.read_segment, self.read_offset = self.segments[0], 0
+            self._save_cursor()
+        return None
+
+    def commit(self):
+        # The record returned by peek() was sent
+        self.stats["replayed"] += 1
+        self._advance()
+
+    def _advance(self):
+        self.read_offset = self._next_offset
+        if self.read_offset >= os.path.getsize(self._path(self.read_segment)):
+            # segment fully replayed, the last one too: the next record starts a new segment
+            finished = self.read_segment
+            self._delete(finished)
+            if len(self.segments) != 0:
+                self.read_segment, self.read_offset = self.segments[0], 0
+            else:
+                self.read_segment, self.read_offset = finished + 1, 0
+            self._save_cursor()
+            return
+        self._unsaved += 1
+        if self._unsaved >= CURSORRECORDS or time.time() - self._last_cursor >= FSYNCINTERVAL:
+            self._save_cursor()
+
+    def close(self):
+        if self._unsaved != 0:
+            self._save_cursor()
+        if self._writer is not None:
+            self._writer[1].flush()
+            os.fsync(self._writer[1].fileno())
+            self._writer[1].close()
+            self._writer = None
+        if self._reader is not None:
+            self._reader[1].close()
+            self._reader = None
@@ -1 +1 @@
-from Tasks import modbus_rtu, modbus_tcp, snmp
\ No newline at end of file
+from Tasks import modbus_rtu, modbus_tcp, snmp, ip_engine, control_plane
\ No newline at end of file
@@ -0,0 +1,75 @@
+import os
+import threading
+import Protocols.publisher as MyPublisher
+# queue and router of the control commands, shared with MODULAR_I2C
+from command_queue import MAXCOMMANDS, CommandQueue, CommandRouter
+from time import strftime, localtime
+
+# Set by main.py on SIGTERM/SIGINT, replaces the FINISH flag of stat.temp
+SHUTDOWN = threading.Event()
+
+
+def stop_requested(stop_event=None):
+    # Arguments:
+    # stop_event        :   threading.Event of one worker, set by the supervisor when its device is removed
+    # Return            :   callable returning True once the process or the worker has to stop
+    if stop_event is None:
+        return SHUTDOWN.is_set
+    return lambda: SHUTDOWN.is_set() or stop_event.is_set()
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ SUBSCRIBER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+
+
+def report_connect_failure(name, task):
+    # Arguments:
+    # name              :   prefix of the log lines and of the error message, e.g. "SNMP"
+    # task              :   task name written in errlog.txt
+    print(name + ": Failed to connect broker mqtt")
+    MyPublisher.get_local_publisher().publish(
+        "subrack/error/log", {"data": name + " cannot connect to server broker mqtt", "type" : "critical"}, 1, True
+        )
+
+    errlog = open(os.getcwd() + "/errlog.txt", "a")
+    errlog.write("{0} {1} Error 5: {2}\n".format(
+        strftime("%Y-%m-%d %H:%M:%S", localtime()), task, "Failed to connect broker mqtt"))
+    errlog.close()
+
+
+def start_subscriber(client, broker_address, broker_port, topic, on_message, name, task):
+    # Arguments:
+    # client            :   paho client of the control topic
+    # broker_address    :   hostname or ip address of the MQTT broker
+    # broker_port       :   port of the MQTT broker
+    # topic             :   control topic, subscribed again on every reconnect
+    # on_message        :   paho on_message callback
+    # name, task        :   names of the log lines, see report_connect_failure()
+    # Return            :   False if the client was already started by another thread
+    #
+    # connect_async + loop_start: paho connects and reconnects in its network thread, so the
+    # polling starts at once instead of blocking until the broker answers
+
+    with _subscribers_lock:
+        if id(client) in _subscribers:
+            return False
+        _subscribers.add(id(client))
+
+    def connected(client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe(topic)
+            print(name + ": Succes Connecting to broker for Subscriber")
+        else:
+            report_connect_failure(name, task)
+
+    def connect_failed(client, userdata):
+        report_connect_failure(name, task)
+
+    client.on_message = on_message
+    client.on_connect = connected
+    client.on_connect_fail = connect_failed
+    client.reconnect_delay_set(min_delay=1, max_delay=30)
+    client.connect_async(broker_address, broker_port)
+    client.loop_start()
+    return True
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from time import strftime, localtime
+
+import paho.mqtt.client as mqtt
+import Poller.poller_task as poller
+import Poller.poller_control as control
+import Poller.scheduler as scheduler
+import Protocols.modbus_tcp_async as MyModbusTCPAsync
+import Protocols.publisher as MyPublisher
+from Poller.libs import SNMP, MODBUS_TCP
+from Tasks.modbus_tcp import publish_result as publish_modbustcp_result
+from Tasks.snmp import publish_result as publish_snmp_result
+
+# Maximum number of device polls running at the same time over all targets
+MAXCONCURRENCY = 64
+# Number of threads running the blocking SNMP sessions and control writes
+MAXBLOCKINGWORKERS = 16
+# Maximum number of polls or control writes at the same time on one target (ip address, port)
+MAXPERTARGET = 1
+
+
+def device_key(each_device):
+    # Return            :   identity of an installed device, any change of its profile or settings gives a new key
+    return json.dumps(each_device, sort_keys=True)
+
+
+class Worker(object):
+    # One Modbus TCP or SNMP device of the engine
+    def __init__(self, profile, protocol_setting):
+        self.key = device_key({"profile": profile, "protocol_setting": protocol_setting})
+        self.jobs = []
+        self.profile = profile
+        self.protocol_setting = protocol_setting
+        self.protocol = protocol_setting['protocol']
+        self.name = profile['name']
+        self.target = (protocol_setting['ip_address'], int(protocol_setting['port']))
+        if self.protocol == SNMP:
+            self.poller = poller.SNMP(profile, protocol_setting)
+            self.device = None
+        else:
+            self.poller = poller.ModbusTCP(profile, protocol_setting)
+            self.device = MyModbusTCPAsync.Device(protocol_setting['ip_address'], protocol_setting['port'],
+                                                  protocol_setting['timeout'], protocol_setting['endianness'],
+                                                  protocol_setting.get('unit_id', 1),
+                                                  protocol_setting.get('max_inflight', MyModbusTCPAsync.MAXINFLIGHT))
+
+
+class Engine(object):
+    def __init__(self, devices, interval, mqtt_config, stop_event,
+                 max_concurrency=MAXCONCURRENCY, max_blocking_workers=MAXBLOCKINGWORKERS, max_per_target=MAXPERTARGET):
+        # Arguments:
+        # devices               :   list of installed devices ({"profile", "protocol_setting"}) using SNMP or Modbus TCP
+        # interval              :   polling interval in seconds
+        # mqtt_config           :   MQTT service config
+        # stop_event            :   threading.Event set by main.py on shutdown
+        # max_concurrency       :   maximum number of device polls in progress
+        # max_blocking_workers  :   size of the thread pool for SNMP and control writes
+        # max_per_target        :   maximum number of polls or control writes in progress on one target
+
+        self.devices = devices
+        self.interval = float(interval)
+        self.mqtt_config = mqtt_config
+        self.stop_event = stop_event
+        self.max_concurrency = max_concurrency
+        self.max_blocking_workers = max_blocking_workers
+        self.max_per_target = max_per_target
+        self.workers = []
+        # device list handed over by update(), applied by the engine loop
+        self._update = None
+        self._update_lock = threading.Lock()
+
+    def run(self):
+        # Entry point of the engine thread
+        asyncio.run(self._main())
+
+    async def _main(self):
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_blocking_workers)
+        self.concurrency = asyncio.Semaphore(self.max_concurrency)
+        self.targets = {}
+        self.commands = asyncio.Queue()
+
+        # One deadline schedule for every device and register group of the engine
+        self.schedule = scheduler.Schedule("IP_ENGINE")
+        self._add_workers(self.devices)
+
+        subscriber = self._subscribe()
+
+        control_task = asyncio.ensure_future(self._control_loop())
+        self.running = set()
+        self.wakeup = asyncio.Event()
+        while not self.stop_event.is_set():
+            with self._update_lock:
+                devices, self._update = self._update, None
+            if devices is not None:
+                self._apply(devices)
+            due = self.schedule.next_due()
+            delay = scheduler.MAXSLEEP if due is None else due - time.monotonic()
+            if delay > 0:
+                # a job finishing puts its next deadline in the heap, it may be earlier than the current head
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), min(delay, scheduler.MAXSLEEP))
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            # the job leaves the heap until its poll is done, an overrunning poll skips its next deadlines
+            task = asyncio.ensure_future(self._run_job(self.schedule.pop()))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+        control_task.cancel()
+        for task in list(self.running):
+            task.cancel()
+        await asyncio.gather(control_task, *self.running, return_exceptions=True)
+        self.schedule.close()
+        subscriber.loop_stop()
+        subscriber.disconnect()
+        MyModbusTCPAsync.close_all()
+        self.executor.shutdown(wait=False)
+        print("IP_ENGINE: stopped")
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ DEVICES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def update(self, devices):
+        # Arguments:
+        # devices           :   new list of installed SNMP and Modbus TCP devices
+        #
+        # Called from another thread, the engine loop applies it within scheduler.MAXSLEEP seconds:
+        # new devices start, removed ones stop, the others keep polling untouched
+        with self._update_lock:
+            self._update = devices
+
+    def _apply(self, devices):
+        keys = set(device_key(each_device) for each_device in devices)
+        for worker in [worker for worker in self.workers if worker.key not in keys]:
+            self._remove_worker(worker)
+        running = set(worker.key for worker in self.workers)
+        self._add_workers([each_device for each_device in devices if device_key(each_device) not in running])
+        self.devices = devices
+
+    def _add_workers(self, devices):
+        # the first polls are spread over one interval so the devices do not all fire together
+        for i, each_device in enumerate(devices):
+            try:
+                worker = Worker(each_device['profile'], each_device['protocol_setting'])
+            except Exception as e:
+                print("IP_ENGINE: " + each_device['profile']['name'] + " cannot be started: " + str(e))
+                continue
+            print("IP_ENGINE: " + worker.name + " is running")
+            self.workers.append(worker)
+            if worker.target not in self.targets:
+                self.targets[worker.target] = asyncio.Semaphore(self.max_per_target)
+
+            device_interval = float(worker.protocol_setting.get('interval', self.interval))
+            for group in worker.poller.read_groups:
+                job_name = worker.name if group is None else worker.name + "/" + str(group)
+                worker.jobs.append(self.schedule.add(job_name, device_interval if group is None else group,
+                                                     (worker, group), offset=self.interval * i / len(devices)))
+
+    def _remove_worker(self, worker):
+        # a poll in progress finishes, its job is not scheduled again
+        for job in worker.jobs:
+            self.schedule.remove(job)
+        self.workers.remove(worker)
+        if worker.protocol == MODBUS_TCP and not any(other.target == worker.target for other in self.workers
+                                                     if other.protocol == MODBUS_TCP):
+            MyModbusTCPAsync.close_connection(*worker.target)
+        print("IP_ENGINE: " + worker.name + " stopped")
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ POLLING ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    async def _run_job(self, job):
+        worker, group = job.payload
+        data = -1
+        try:
+            async with self.concurrency:
+                async with self.targets[worker.target]:
+                    data = await self._poll(worker, group)
+            if worker.protocol == SNMP:
+                publish_snmp_result(worker.profile, worker.protocol_setting, data, self.mqtt_config,
+                                    worker.poller.changes)
+            else:
+                publish_modbustcp_result(worker.profile, data, self.mqtt_config, worker.poller.changes)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            print(traceback.format_exc())
+        finally:
+            self.schedule.done(job, data == -1)
+            self.wakeup.set()
+
+    async def _poll(self, worker, group):
+        if worker.protocol == SNMP:
+            # easysnmp is blocking, the session runs in the thread pool
+            return await self.loop.run_in_executor(self.executor, worker.poller.poll, [group])
+        return await worker.poller.poll_async(worker.device, [group])
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ CONTROL ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def _subscribe(self):
+        # One subscriber for the control topics of every SNMP and Modbus TCP device,
+        # connect_async lets paho retry in the background while the polls keep running
+        client = mqtt.Client()
+        if self.mqtt_config['username']:
+            client.username_pw_set(self.mqtt_config['username'], self.mqtt_config['password'])
+        client.on_connect = self._on_connect
+        client.on_message = self._on_message
+        client.connect_async(self.mqtt_config['broker_address'], self.mqtt_config['broker_port'])
+        client.loop_start()
+        return client
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            client.subscribe([(self.mqtt_config['sub_topic_modbusTCP'], 0), (self.mqtt_config['sub_topic_snmp'], 0)])
+            print("IP_ENGINE: Succes Connecting to broker for Subscriber")
+        else:
+            print("IP_ENGINE: Failed to connect broker mqtt, rc=%s" % rc)
+            errlog = open(os.getcwd() + "/errlog.txt", "a")
+            errlog.write("{0} {1} Error 5: {2}\n".format(
+                strftime("%Y-%m-%d %H:%M:%S", localtime()), "ip engine", "Failed to connect broker mqtt"))
+            errlog.close()
+
+    def _on_message(self, client, userdata, message):
+        # paho network thread >> engine loop
+        self.loop.call_soon_threadsafe(self.commands.put_nowait, (message.topic, message.payload))
+
+    async def _control_loop(self):
+        while True:
+            topic, payload = await self.commands.get()
+            try:
+                sub_data = json.loads(payload)
+                if topic == self.mqtt_config['sub_topic_snmp']:
+                    protocol, function = SNMP, control.SNMP
+                else:
+                    protocol, function = MODBUS_TCP, control.ModbusTCP_Control
+                ip_address = sub_data.get("ip_address", sub_data.get("host"))
+                worker = next((w for w in self.workers if w.protocol == protocol and w.target[0] == ip_address), None)
+                if worker is None:
+                    sub_data["status"] = "failed control with IP not same with data recorded"
+                else:
+                    # waits for the poll in progress on the same target, then runs before its next one
+                    async with self.targets[worker.target]:
+                        ok = await self.loop.run_in_executor(self.executor, function, sub_data)
+                    sub_data["status"] = "succes control" if ok else "failed control"
+                print("IP_ENGINE: " + topic + " " + sub_data["status"])
+                MyPublisher.get_publisher(self.mqtt_config['broker_address'], self.mqtt_config['broker_port'],
+                                          self.mqtt_config['username'], self.mqtt_config['password']).publish(
+                    topic + "_status", sub_data)
+            except Exception as e:
+                print("IP_ENGINE: " + str(e))
+                MyPublisher.get_local_publisher().publish(
+                    "subrack/error/log", {"data": "MODBUS TCP/SNMP failed to control", "type" : "minor"}, 1, True
+                    )
+
+
+def ip_polling_task(engine):
+    # Thread target started by the supervisor next to the Modbus RTU threads
+    print("IP_ENGINE: starting asyncio polling engine for %d SNMP/Modbus TCP devices..." % len(engine.devices))
+    try:
+        engine.run()
+    except Exception:
+        tb = traceback.format_exc()
+        print(tb)
+        errlog = open(os.getcwd() + "/errlog.txt", "a")
+        errlog.write("{0} {1} Error: {2}\n".format(strftime("%Y-%m-%d %H:%M:%S", localtime()), "ip engine", tb))
+        errlog.close()
@@ -1,29 +1,28 @@
-import getmac
 import Poller.poller_task as poller
+import Poller.scheduler as scheduler
+import Poller.change_filter as change_filter
 import pprint
 import traceback
 import time
 import psutil
 import os
-import ast
 import sys
-import Protocols.mqtt as MyMQTT
+import Protocols.publisher as MyPublisher
+import payload_codec as MyPayload
 from Poller import datapckgr_by_pn
 from time import strftime, localtime
 import json
 
 import paho.mqtt.client as mqtt
 import Poller.poller_control as control
+import Tasks.control_plane as control_plane
 
 pp = pprint.PrettyPrinter(indent=2)
 ParentFolder = os.path.abspath('..')
 
-list_comport = []
-comport = "" 
 Subsclient = mqtt.Client()
-
-sub_data = []
-sub_topic = ""
+# Control commands are routed by their "port" to the polling thread of that comport
+router = control_plane.CommandRouter("port")
 
 debug = True
 # Function to get current memory usage (only for development stage)
@@ -32,43 +31,33 @@ def get_process_memory():
     process = psutil.Process(os.getpid())
     return [process.memory_info().rss, process.memory_full_info().rss]
 
-def process_data_subscribe_in_loop():
-    global Subsclient, sub_data, sub_topic, list_comport
+def process_command(sub_topic, sub_data):
+    # Runs in the polling thread of sub_data["port"], between two scheduled polls of a device or register group
     try:
-        if sub_data["port"] in list_comport:
-            print("MODBUS_RTU: Get Subscribe data with topic: "+ sub_topic + " in port: " + sub_data["port"])
-            if control.ModbusRTU_Control(sub_data):
-                print("MODBUS_RTU: succes control modbus")
-                sub_data["status"] = "succes control modbus"
-                Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
-            else:
-                print("MODBUS_RTU: failed control modbus")
-                sub_data["status"] = "failed control modbus"
-                Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
+        print("MODBUS_RTU: Get Subscribe data with topic: "+ sub_topic + " in port: " + sub_data["port"])
+        if control.ModbusRTU_Control(sub_data):
+            print("MODBUS_RTU: succes control modbus")
+            sub_data["status"] = "succes control modbus"
+            Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
+        else:
+            print("MODBUS_RTU: failed control modbus")
+            sub_data["status"] = "failed control modbus"
+            Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
     except Exception as e:
         print("MODBUS_RTU: " + str(e))
-        mqtt_client = MyMQTT.Client("localhost", 1883, True, 1, "",
-                                "")
-        mqtt_client.set_usr_pw("", "")
-        mqtt_client.connect()
-        mqtt_client.publish(
-            "subrack/error/log", {"data": "MODBUS RTU failed to control", "type" : "minor"}
+        MyPublisher.get_local_publisher().publish(
+            "subrack/error/log", {"data": "MODBUS RTU failed to control", "type" : "minor"}, 1, True
             )
         pass
 
-def process_data_subscribe(client, userdata, message):
-    global sub_data, sub_topic
-    sub_data = json.loads(message.payload)
-    sub_topic = message.topic
-    with open(os.getcwd() + '/stat_subscribe_rtu.temp', 'w') as file:
-            file.write(str(True))
-
 
-def modbusrtu_polling_task(profile_list, protocol_setting_list, interval, mqtt_config, comm_port):
-    global comport, Subsclient, list_comport
+def modbusrtu_polling_task(profile_list, protocol_setting_list, interval, mqtt_config, comm_port, stop_event=None):
+    global Subsclient
+    # stop_event        :   set by the supervisor when a device of the comport changed in installed_devices.json
+    stopped = control_plane.stop_requested(stop_event)
 
     comport = comm_port
-    list_comport.append(comport)
+    commands = router.register(comport)
     dev_num = len(profile_list)
     
     print("MODBUS_RTU: starting modbus RTU polling task...")
@@ -86,9 +75,6 @@ def modbusrtu_polling_task(profile_list, protocol_setting_list, interval, mqtt_c
         #print(poller.ModbusRTU(profile_list[i], protocol_setting_list[i]))
         # print(str(dev_poller))
     print("MODBUS_RTU: poller success")
-    # Read Polling Service Status
-    with open(os.getcwd() + '/stat.temp') as file:
-        FINISH = ast.literal_eval(file.read())
 
     # MQTT config
     mqtt_enable = mqtt_config['enable']
@@ -100,148 +86,122 @@ def modbusrtu_polling_task(profile_list, protocol_setting_list, interval, mqtt_c
 
     username = mqtt_config['username']
     password = mqtt_config['password']
+
+    # Shared publishers, one persistent connection per broker for the whole process
+    remote_publisher = MyPublisher.get_publisher(broker_address, broker_port, username, password)
+    local_publisher = MyPublisher.get_local_publisher()
+    # Encoding of the "value" of the device messages, "payload_format" of mqtt_config.json
+    encoder = MyPayload.get_encoder(mqtt_config)
     
     #config to Subscribe data
-    while True:
-        try:
-            Subsclient.on_message=process_data_subscribe 
-            Subsclient.connect(broker_address, broker_port)
-            Subsclient.loop_start()
-            Subsclient.subscribe(mqtt_config['sub_topic_modbusRTU'])
-            print("MODBUS_RTU: Succes Connecting to broker for Subscriber")
-            break
-        except Exception as e:
-            print(e)
-            print("Failed to connect broker mqtt")
-            time.sleep(5)
-            mqtt_client = MyMQTT.Client("localhost", 1883, True, 1, "",
-                                    "")
-            mqtt_client.set_usr_pw("", "")
-            mqtt_client.connect()
-            mqtt_client.publish(
-                "subrack/error/log", {"data": "MODBUS RTU cannot connect to server broker mqtt", "type" : "critical"}
-                )
-            
-            errlog = open(os.getcwd() + "/errlog.txt", "a")
-            errlog.write("{0} {1} Error 5: {2}\n".format(
-                strftime("%Y-%m-%d %H:%M:%S", localtime()), "modbus rtu task", "Failed to connect broker mqtt"))
-            errlog.close()
+    control_plane.start_subscriber(Subsclient, broker_address, broker_port,
+                                   mqtt_config['sub_topic_modbusRTU'], router.on_message, "MODBUS RTU", "modbus rtu task")
 
-    while (not FINISH):
-        try:            
-            for i in range(dev_num):
-                topic = str(profile_list[i]["topic"])
-                try:
-                    data = dev_poller[i].poll()
-                    for item in data:
-                        if mqtt_enable:
-                            try:
-                                device_name = profile_list[i]["name"]
-                                modbus_address = protocol_setting_list[i]["address"]
-                                modbus_port = protocol_setting_list[i]["port"]  
-
-                                mqtt_client = MyMQTT.Client(broker_address, broker_port, retain, qos, username,
-                                                            password)
-                                mqtt_client.set_usr_pw(username, password)
-                                mqtt_client.connect()
-                                mqtt_client.publish(topic, {
-                                    'device_name': device_name,
-                                    'protocol_type': "MODBUS RTU",
-                                    'comport': modbus_port,
-                                    'modbus_address': modbus_address,
-                                    'value': json.dumps(item["data"])
-                                })
-
-                                #write data subscriber
-                                #check is a any subscriber?
-                                any_subs =  False
-                                with open(os.getcwd() + '/stat_subscribe_rtu.temp') as file:
-                                    any_subs = ast.literal_eval(file.read())
-                                print("MODBUS_RTU: any_subs: ", any_subs)
-                                if any_subs:
-                                    process_data_subscribe_in_loop()
-                                    with open(os.getcwd() + '/stat_subscribe_rtu.temp', 'w') as file:
-                                        file.write(str(False))
-                                
-                                mqtt_client = MyMQTT.Client("localhost", 1883, retain, qos, username,
-                                                        password)
-                                mqtt_client.set_usr_pw(username, password)
-                                mqtt_client.connect()
-                                mqtt_client.publish(
-                                    topic + "_status", profile_list[i]["name"] + " data acquisition success")
-                                mqtt_client.publish("modbus_snmp_summ", {
-                                'MODBUS SNMP STATUS': profile_list[i]["name"] + " data acquisition success"
-                                })
-
-                                #errlog = open(os.getcwd() + "/errlog.txt", "a")
-                                #errlog.write("{0} {1} publish check\n".format(
-                                #    strftime("%Y-%m-%d %H:%M:%S", localtime()), profile_list[i]["name"]))
-                                #errlog.close()
-                            except Exception as e:
-                                print("MODBUS_RTU: " + str(e))
-                                tb = traceback.format_exc()
-                                print(tb)
-                                errlog = open(os.getcwd() + "/errlog.txt", "a")
-                                errlog.write("{0} {1} Error: {2}\n".format(
-                                    strftime("%Y-%m-%d %H:%M:%S", localtime()), profile_list[i]["name"], str(e)))
-                                errlog.close()
-                                pass
-                except Exception as e:
-                    print("MODBUS_RTU: " + str(e))
-                    print("MODBUS_RTU: reading failed")
-                    if publish_failed_data:
+    # Deadline schedule: one job per device and register group, fixed-rate from the device interval
+    # (protocol_setting "interval", default pub_interval) or the group interval of the library
+    schedule = scheduler.Schedule("MODBUS_RTU " + comport)
+    for i in range(dev_num):
+        device_interval = float(protocol_setting_list[i].get('interval', interval))
+        for group in dev_poller[i].read_groups:
+            job_name = profile_list[i]["name"] if group is None else profile_list[i]["name"] + "/" + str(group)
+            schedule.add(job_name, device_interval if group is None else group, (i, group),
+                         offset=device_interval * i / dev_num)
+
+    def wait_for_commands(timeout):
+        commands.drain(process_command, timeout)
+
+    last_loop_check = time.time()
+    while not stopped():
+        try:
+            # control commands run as soon as they arrive while waiting for the next deadline
+            job = schedule.wait_next(stopped, wait_for_commands)
+            if job is None:
+                break
+            i, group = job.payload
+            failed = False
+            topic = str(profile_list[i]["topic"])
+            try:
+                data = dev_poller[i].poll([group])
+                # only what changed when report_by_exception is enabled
+                for suffix, frame in change_filter.frames(dev_poller[i].changes, data, mqtt_config):
+                    if mqtt_enable:
                         try:
-                            mqtt_client = MyMQTT.Client(broker_address, broker_port, retain, qos, username,
-                                                        password)
-                            mqtt_client.set_usr_pw(username, password)
-                            mqtt_client.connect()
-                            mqtt_client.publish(
-                                topic + "_status", profile_list[i]["name"] + " data acquisition failed")
-                            mqtt_client.publish("modbus_snmp_summ", {
-                            'System error': profile_list[i]["name"] + " data acquisition failed"
-                            })
-
-                            mqtt_client = MyMQTT.Client("localhost", 1883, retain, qos, username,
-                                                        password)
-                            mqtt_client.set_usr_pw(username, password)
-                            mqtt_client.connect()
-                            mqtt_client.publish("modbus_snmp_summ", {
-                            'MODBUS SNMP STATUS': profile_list[i]["name"] + " data acquisition failed"
-                            })
-
-                            mqtt_client.publish(
-                                "subrack/error/log", {"data": "MODBUS RTU reading error/failed on device " + profile_list[i]["name"], "type" : "major"}
-                                )
-                            
+                            device_name = profile_list[i]["name"]
+                            modbus_address = protocol_setting_list[i]["address"]
+                            modbus_port = protocol_setting_list[i]["port"]  
+
+                            message = {
+                                'device_name': device_name,
+                                'protocol_type': "MODBUS RTU",
+                                'comport': modbus_port,
+                                'modbus_address': modbus_address,
+                            }
+                            message.update(encoder.value(topic + suffix, frame))
+                            remote_publisher.publish(topic + suffix, message, qos, retain, encoder)
+
+                            local_publisher.publish(
+                                topic + "_status", profile_list[i]["name"] + " data acquisition success", qos, retain)
+                            local_publisher.publish("modbus_snmp_summ", {
+                            'MODBUS SNMP STATUS': profile_list[i]["name"] + " data acquisition success"
+                            }, qos, retain)
                         except Exception as e:
-                            print("MODBUS_RTU: "+ str(e))
+                            print("MODBUS_RTU: " + str(e))
+                            tb = traceback.format_exc()
+                            print(tb)
+                            errlog = open(os.getcwd() + "/errlog.txt", "a")
+                            errlog.write("{0} {1} Error: {2}\n".format(
+                                strftime("%Y-%m-%d %H:%M:%S", localtime()), profile_list[i]["name"], str(e)))
+                            errlog.close()
                             pass
+            except Exception as e:
+                failed = True
+                print("MODBUS_RTU: " + str(e))
+                print("MODBUS_RTU: reading failed")
+                if publish_failed_data:
+                    try:
+                        remote_publisher.publish(
+                            topic + "_status", profile_list[i]["name"] + " data acquisition failed", qos, retain)
+                        remote_publisher.publish("modbus_snmp_summ", {
+                        'System error': profile_list[i]["name"] + " data acquisition failed"
+                        }, qos, retain)
+
+                        local_publisher.publish("modbus_snmp_summ", {
+                        'MODBUS SNMP STATUS': profile_list[i]["name"] + " data acquisition failed"
+                        }, qos, retain)
+
+                        local_publisher.publish(
+                            "subrack/error/log", {"data": "MODBUS RTU reading error/failed on device " + profile_list[i]["name"], "type" : "major"}, qos, retain
+                            )
                         
-                    errlog = open(os.getcwd() + "/errlog.txt", "a")
-                    errlog.write("{0} {1} Error: {2}\n".format(
-                        strftime("%Y-%m-%d %H:%M:%S", localtime()), profile_list[i]["name"], str(e)))
-                    errlog.close()
-                    pass
-            #errlog = open(os.getcwd() + "/errlog.txt", "a")
-            #errlog.write("{0} {1} data acquisition check\n".format(
-            #    strftime("%Y-%m-%d %H:%M:%S", localtime()), profile_list[i]["name"]))
-            #errlog.close()
-            # Read Polling Service Status
-            with open(os.getcwd() + '/stat.temp') as file:
-                FINISH = ast.literal_eval(file.read())
-
-            for i in range(interval):
-                time.sleep(1)
-           
+                    except Exception as e:
+                        print("MODBUS_RTU: "+ str(e))
+                        pass
+                    
+                errlog = open(os.getcwd() + "/errlog.txt", "a")
+                errlog.write("{0} {1} Error: {2}\n".format(
+                    strftime("%Y-%m-%d %H:%M:%S", localtime()), profile_list[i]["name"], str(e)))
+                errlog.close()
+                pass
+            schedule.done(job, failed)
+
+            # control commands received during the poll
+            commands.drain(process_command)
 
         except KeyboardInterrupt:
             print('MODBUS_RTU: Interrupted')
             break
 
         except:
+            errlog = open(os.getcwd() + "/errlog.txt", "a")
             errlog.write("{0} {1} Error: your program sucks it goes out of the loop\n".format(
-                strftime("%Y-%m-%d %H:%M:%S", localtime()), profile_list[i]["name"]))
+                strftime("%Y-%m-%d %H:%M:%S", localtime()), comport))
+            errlog.close()
             pass
-        errlog = open(os.getcwd() + "/errlog.txt", "a")
-        errlog.write("{0} loop check\n".format(strftime("%Y-%m-%d %H:%M:%S")))
-        errlog.close()
+        if time.time() - last_loop_check >= interval:
+            last_loop_check = time.time()
+            errlog = open(os.getcwd() + "/errlog.txt", "a")
+            errlog.write("{0} loop check\n".format(strftime("%Y-%m-%d %H:%M:%S")))
+            errlog.close()
+    schedule.close()
+    router.unregister(comport, commands)
+    print("MODBUS_RTU: polling task of " + comport + " stopped")
@@ -1,214 +1,182 @@
 import json
-import getmac
 import Poller.poller_task as poller
+import Poller.scheduler as scheduler
+import Poller.change_filter as change_filter
 import pprint
 import traceback
 import time
 import psutil
 import os
-import ast
-import Protocols.mqtt as MyMQTT
+import Protocols.publisher as MyPublisher
+import payload_codec as MyPayload
 import paho.mqtt.client as mqtt
 import Poller.poller_control as control
+import Tasks.control_plane as control_plane
 from time import strftime, localtime
 
 pp = pprint.PrettyPrinter(indent=2)
 ParentFolder = os.path.abspath('..')
 
-device = "" 
 Subsclient = mqtt.Client()
-sub_data = []
-sub_topic = ""
+
+def process_unknown_command(sub_topic, sub_data):
+    print("SNMP: failed control SNMP with IP not same with data recorded")
+    sub_data["status"] = "failed control SNMP with IP not same with data recorded"
+    Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
+
+# Control commands are routed by their "ip_address" to the polling thread of that device
+router = control_plane.CommandRouter("ip_address", process_unknown_command)
 
 # Function to get current memory usage (only for development stage)
 def get_process_memory():
     process = psutil.Process(os.getpid())
     return [process.memory_info().rss, process.memory_full_info().rss]
 
-def process_data_subscribe_in_loop():
-    global Subsclient, sub_data, sub_topic, device
+def process_command(sub_topic, sub_data):
+    # Runs in the polling thread of sub_data["ip_address"], never during a poll of the device
     try:
-        if sub_data["ip_address"] == device:
-            print("SNMP: Get Subscribe data with topic: "+ sub_topic + " in device ip: " + device)
-            if control.SNMP(sub_data):
-                print("SNMP: succes control SNMP")
-                sub_data["status"] = "succes control SNMP"
-                Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
-            else:
-                print("SNMP: failed control SNMP with data cannot poll")
-                sub_data["status"] = "failed control SNMP with data cannot poll"
-                Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
+        print("SNMP: Get Subscribe data with topic: "+ sub_topic + " in device ip: " + sub_data["ip_address"])
+        if control.SNMP(sub_data):
+            print("SNMP: succes control SNMP")
+            sub_data["status"] = "succes control SNMP"
+            Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
         else:
-            print("SNMP: failed control SNMP with IP not same with data recorded")
-            sub_data["status"] = "failed control SNMP with IP not same with data recorded"
+            print("SNMP: failed control SNMP with data cannot poll")
+            sub_data["status"] = "failed control SNMP with data cannot poll"
             Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
     except Exception as e:
         print("SNMP: " + str(e))
-        mqtt_client = MyMQTT.Client("localhost", 1883, True, 1, "",
-                                "")
-        mqtt_client.set_usr_pw("", "")
-        mqtt_client.connect()
-        mqtt_client.publish(
-            "subrack/error/log", {"data": "SNMP failed to control", "type" : "minor"}
+        MyPublisher.get_local_publisher().publish(
+            "subrack/error/log", {"data": "SNMP failed to control", "type" : "minor"}, 1, True
             )
         pass
 
-def process_data_subscribe(client, userdata, message):
-    global sub_data, sub_topic
-    sub_data = json.loads(message.payload)
-    sub_topic = message.topic
-    with open(os.getcwd() + '/stat_subscribe_snmp.temp', 'w') as file:
-            file.write(str(True))
-
+def publish_result(profile, protocol_setting, data, mqtt_config, changes=None):
+    # Arguments:
+    # profile           :   device profile
+    # protocol_setting  :   device protocol setting
+    # data              :   result of poller.SNMP.poll(), -1 when the poll failed
+    # mqtt_config       :   MQTT service config
+    # changes           :   ChangeFilter of the poller, only what changed is published when
+    #                       report_by_exception is enabled
 
-def snmp_polling_task(profile, protocol_setting, interval, mqtt_config):
-    global Subsclient, device
+    if not mqtt_config['enable']:
+        return
 
-    device = protocol_setting["ip_address"]
-    dev_poller = poller.SNMP(profile, protocol_setting)
-
-    # MQTT config
-    mqtt_enable = mqtt_config['enable']
-    broker_address = mqtt_config['broker_address']
-    broker_port = mqtt_config['broker_port']
     retain = mqtt_config['retain']
     qos = mqtt_config['qos']
     topic = profile["topic"]
-    #topic = mqtt_config['pub_topic'][0]
-    username = mqtt_config['username']
-    password = mqtt_config['password']
+    device_name = profile["name"]
+    ip_address = protocol_setting["ip_address"]
     protocol_verison = protocol_setting["protocol"] + " V" + str(protocol_setting["snmp_version"])
+    remote_publisher = MyPublisher.get_publisher(mqtt_config['broker_address'], mqtt_config['broker_port'],
+                                                 mqtt_config['username'], mqtt_config['password'])
+    local_publisher = MyPublisher.get_local_publisher()
+
+    if data == -1:
+        try:
+            remote_publisher.publish(
+                topic + "status", profile["name"] + " data acquisition failed", qos, retain)
+
+            local_publisher.publish(
+                topic + "_status", device_name + " data acquisition failed", qos, retain)
+            local_publisher.publish("modbus_snmp_summ", {
+            'MODBUS SNMP STATUS': device_name + " data acquisition failed"
+            }, qos, retain)
+
+            local_publisher.publish(
+                "subrack/error/log", {"data": "SNMP reading error/failed on device " + device_name, "type" : "major"}, qos, retain
+            )
+
+            print("SNMP: published")
+        except:
+            tb = traceback.format_exc()
+            print(tb)
+            pass
+        errlog = open(os.getcwd() + "/errlog.txt", "a")
+        errlog.write("{0} {1} Error: data acquisition failed\n".format(
+            strftime("%Y-%m-%d %H:%M:%S", localtime()), profile["name"]))
+        errlog.close()
+
+    # Publish data to MQTT Broker IF MQTT SERVICE ENABLED
+    else:
+        encoder = MyPayload.get_encoder(mqtt_config)
+        for suffix, frame in change_filter.frames(changes, data, mqtt_config):
+            try:
+                # DYNAMIC: ADDITIONAL DATA SNMP
+                message = {
+                    'device_name': device_name,
+                    'protocol_type': protocol_verison,
+                    'ip_address': ip_address,
+                }
+                message.update(encoder.value(topic + suffix, frame))
+                remote_publisher.publish(topic + suffix, message, qos, retain, encoder)
+                print("SNMP: published")
+            except:
+                tb = traceback.format_exc()
+                print(tb)
+                pass
+
+        try:
+            local_publisher.publish(
+                topic + "_status", device_name + " data acquisition success", qos, retain)
+            local_publisher.publish("modbus_snmp_summ", {
+            'MODBUS SNMP STATUS': device_name + " data acquisition success"
+            }, qos, retain)
+        except:
+            tb = traceback.format_exc()
+            print(tb)
+            pass
+
+def snmp_polling_task(profile, protocol_setting, interval, mqtt_config, stop_event=None):
+    global Subsclient
+    # stop_event        :   set by the supervisor when the device is removed or changed in installed_devices.json
+    stopped = control_plane.stop_requested(stop_event)
+
+    commands = router.register(protocol_setting["ip_address"])
+    dev_poller = poller.SNMP(profile, protocol_setting)
+
     device_name = profile["name"] 
     print("SNMP: " + device_name +  " is running")
 
-    while True:
-        try:
-            #config to Subscribe data
-            Subsclient.on_message=process_data_subscribe 
-            Subsclient.connect(mqtt_config['broker_address'])
-            Subsclient.loop_start()
-            Subsclient.subscribe(mqtt_config['sub_topic_snmp'])
-            print("SNMP: Succes Connecting to broker for Subscriber")
-            #print("Connecting to broker for Subscriber")
-            break
-        except Exception as e:
-            print(e)
-            print("Failed to connect broker mqtt")
-            time.sleep(5)
-            mqtt_client = MyMQTT.Client("localhost", 1883, True, 1, "",
-                                    "")
-            mqtt_client.set_usr_pw("", "")
-            mqtt_client.connect()
-            mqtt_client.publish(
-                "subrack/error/log", {"data": "SNMP cannot connect to server broker mqtt", "type" : "critical"}
-                )
-
-            errlog = open(os.getcwd() + "/errlog.txt", "a")
-            errlog.write("{0} {1} Error 5: {2}\n".format(
-                strftime("%Y-%m-%d %H:%M:%S", localtime()), "snmp task", "Failed to connect broker mqtt"))
-            errlog.close()
-
-    # Read Polling Service Status
-    with open(os.getcwd() + '/stat.temp') as file:
-        FINISH = ast.literal_eval(file.read())
-
-    while (not FINISH):
+    # One subscriber for every SNMP thread, the router hands each command to its device
+    control_plane.start_subscriber(Subsclient, mqtt_config['broker_address'], 1883,
+                                   mqtt_config['sub_topic_snmp'], router.on_message, "SNMP", "snmp task")
+
+    # Deadline schedule: one job per register group, fixed-rate from the device interval
+    # (protocol_setting "interval", default pub_interval) or the group interval of the library
+    schedule = scheduler.Schedule("SNMP " + device_name)
+    device_interval = float(protocol_setting.get('interval', interval))
+    for group in dev_poller.read_groups:
+        job_name = device_name if group is None else device_name + "/" + str(group)
+        schedule.add(job_name, device_interval if group is None else group, group)
+
+    def wait_for_commands(timeout):
+        commands.drain(process_command, timeout)
+
+    while not stopped():
         try:
-            data = dev_poller.poll()
-            if data == -1:
-                if mqtt_enable:
-                    try:
-                        mqtt_client = MyMQTT.Client(broker_address, broker_port, retain, qos, username,
-                                                    password)
-                        mqtt_client.set_usr_pw(username, password)
-                        mqtt_client.connect()
-                        mqtt_client.publish(
-                            topic + "status", profile["name"] + " data acquisition failed")
-                        
-
-                        mqtt_client = MyMQTT.Client("localhost", 1883, retain, qos, username,
-                                                    password)
-                        mqtt_client.set_usr_pw(username, password)
-                        mqtt_client.connect()
-                        mqtt_client.publish(
-                            topic + "_status", device_name + " data acquisition failed")
-                        mqtt_client.publish("modbus_snmp_summ", {
-                        'MODBUS SNMP STATUS': device_name + " data acquisition failed"
-                        })
-                        
-                        mqtt_client.publish(
-                            "subrack/error/log", {"data": "SNMP reading error/failed on device " + device_name, "type" : "major"}
-                        )
-
-                        print("SNMP: published")
-                        # mqtt_client.disconnect()
-                    except:
-                        tb = traceback.format_exc()
-                        print(tb)
-                        pass
-                    errlog = open(os.getcwd() + "/errlog.txt", "a")
-                    errlog.write("{0} {1} Error: data acquisition failed\n".format(
-                        strftime("%Y-%m-%d %H:%M:%S", localtime()), profile["name"]))
-                    errlog.close()
-
-            # Publish data to MQTT Broker IF MQTT SERVICE ENABLED
-            else:
-                for item in data:
-                    #username = item["username"]
-                    #password = item["password"]
-                    if mqtt_enable:
-                        try:
-                            mqtt_client = MyMQTT.Client(broker_address, broker_port, retain, qos, username,
-                                                        password)
-                            mqtt_client.set_usr_pw(username, password)
-                            mqtt_client.connect()
-                            # mqtt_client.publish(topic, item["data"])
-                            # DYNAMIC: ADDITIONAL DATA SNMP
-                            mqtt_client.publish(topic, {
-                                'device_name': device_name,
-                                'protocol_type': protocol_verison,
-                                'ip_address': device,
-                                'value': json.dumps(item["data"])
-                            })
-
-                            mqtt_client = MyMQTT.Client("localhost", 1883, retain, qos, username,
-                                                        password)
-                            mqtt_client.set_usr_pw(username, password)
-                            mqtt_client.connect()
-                            mqtt_client.publish(
-                                topic + "_status", device_name + " data acquisition success")
-                            mqtt_client.publish("modbus_snmp_summ", {
-                            'MODBUS SNMP STATUS': device_name + " data acquisition success"
-                            })
-
-                            print("SNMP: published")
-                        except:
-                            tb = traceback.format_exc()
-                            print(tb)
-                            pass
-            any_subs =  False
-            with open(os.getcwd() + '/stat_subscribe_snmp.temp') as file:
-                any_subs = ast.literal_eval(file.read())
-            print("SNMP: any_subs: ", any_subs)
-            if any_subs:
-                process_data_subscribe_in_loop()
-                with open(os.getcwd() + '/stat_subscribe_snmp.temp', 'w') as file:
-                    file.write(str(False))
-
-            # Read Polling Service Status
-            with open(os.getcwd() + '/stat.temp') as file:
-                FINISH = ast.literal_eval(file.read())
-
-            # Wait for next data polling
-            for i in range(interval):
-                time.sleep(1)
+            # Wait for next data polling, control commands run as soon as they arrive
+            job = schedule.wait_next(stopped, wait_for_commands)
+            if job is None:
+                break
+            data = -1
+            try:
+                data = dev_poller.poll([job.payload])
+                publish_result(profile, protocol_setting, data, mqtt_config, dev_poller.changes)
+            finally:
+                schedule.done(job, data == -1)
+
+            # control commands received during the poll
+            commands.drain(process_command)
 
         except KeyboardInterrupt:
             print('SNMP: Interrupted')
             break
         except:
-            # Wait for next data polling
-            time.sleep(interval)
             tb = traceback.format_exc()
             print(tb)
             pass
+    schedule.close()
+    router.unregister(protocol_setting["ip_address"], commands)
+    print("SNMP: " + device_name + " stopped")
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import traceback
+from time import strftime, localtime
+
+from Poller.libs import SNMP, MODBUS_RTU, MODBUS_TCP
+from Tasks.snmp import snmp_polling_task
+from Tasks.modbus_tcp import modbustcp_polling_task
+from Tasks.modbus_rtu import modbusrtu_polling_task
+from Tasks.ip_engine import ip_polling_task, device_key, Engine
+import Tasks.control_plane as control_plane
+import Protocols.rtu_bus as MyRTUBus
+
+# Hot reload of installed_devices.json: the file is checked every CHECKINTERVAL seconds and a change
+# only starts, stops or restarts the workers of the devices that changed
+# - Modbus RTU: one worker per comport, restarted when a device of the comport changed
+# - SNMP / Modbus TCP: devices of the asyncio engine, or one worker per device without async_ip_polling
+CHECKINTERVAL = 2.0
+# Longest wait for a stopped worker to finish its poll before its replacement starts
+JOINTIMEOUT = 30
+
+
+def load_devices(path):
+    with open(path) as json_data:
+        return json.load(json_data)
+
+
+def sort_devices(devices):
+    # Return            :   installed devices clustered by protocol, Modbus RTU devices by comport
+    devices_sorted = {
+        SNMP: [],
+        MODBUS_TCP: [],
+        MODBUS_RTU: {},
+    }
+    for item in devices:
+        protocol_type = item['protocol_setting']['protocol']
+        # FOR MODBUS RTU
+        if protocol_type == MODBUS_RTU:
+            comm_port = item['protocol_setting']['port']
+            if comm_port not in devices_sorted[protocol_type]:
+                devices_sorted[protocol_type][comm_port] = {
+                    "profile_list": [],
+                    "protocol_setting_list": []
+                }
+            devices_sorted[protocol_type][comm_port]['profile_list'].append(item['profile'])
+            devices_sorted[protocol_type][comm_port]['protocol_setting_list'].append(item['protocol_setting'])
+        # FOR MODBUS TCP and SNMP
+        else:
+            devices_sorted[protocol_type].append(item)
+    return devices_sorted
+
+
+class Unit(object):
+    # One polling thread and the config it was started with
+    def __init__(self, name, target, args):
+        self.name = name
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=target, args=list(args) + [self.stop_event], name=name)
+        self.thread.setDaemon(True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self, timeout=JOINTIMEOUT):
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            print("SUPERVISOR: " + self.name + " still running after %d s" % timeout)
+
+
+class Supervisor(object):
+    def __init__(self, path, interval, mqtt_config, async_ip_polling=True):
+        # Arguments:
+        # path              :   installed_devices.json
+        # interval          :   default polling interval in seconds
+        # mqtt_config       :   MQTT service config
+        # async_ip_polling  :   True to poll SNMP and Modbus TCP devices with the asyncio engine
+
+        self.path = path
+        self.interval = interval
+        self.mqtt_config = mqtt_config
+        self.async_ip_polling = async_ip_polling
+        # unit key >> Unit, the key holds the config of the unit so a changed config is a new key
+        self.units = {}
+        self.engine = None
+        self.engine_thread = None
+        self.signature = None
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WATCH ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def file_signature(self):
+        try:
+            stat = os.stat(self.path)
+            return (stat.st_mtime, stat.st_size)
+        except OSError:
+            return None
+
+    def check(self):
+        # Reload installed_devices.json if it changed since the last load
+        # Return            :   True if the file was reloaded
+        signature = self.file_signature()
+        if signature is None or signature == self.signature:
+            return False
+        return self.reload()
+
+    def reload(self):
+        # Apply installed_devices.json to the running workers
+        # Return            :   False if the file cannot be read, the running workers are then kept
+        signature = self.file_signature()
+        try:
+            devices = load_devices(self.path)
+        except (OSError, ValueError) as e:
+            # a file being written is read again on the next check
+            print("SUPERVISOR: cannot read " + self.path + ": " + str(e))
+            return False
+        self.signature = signature
+        try:
+            self.apply(sort_devices(devices))
+        except Exception:
+            tb = traceback.format_exc()
+            print(tb)
+            errlog = open(os.getcwd() + "/errlog.txt", "a")
+            errlog.write("{0} {1} Error: {2}\n".format(strftime("%Y-%m-%d %H:%M:%S", localtime()), "supervisor", tb))
+            errlog.close()
+            return False
+        return True
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WORKERS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def wanted_units(self, devices_sorted):
+        # Return            :   dictionary of unit key and (name, thread target, arguments without the stop event)
+        units = {}
+        for comm_port, port_devices in devices_sorted[MODBUS_RTU].items():
+            key = (MODBUS_RTU, comm_port, json.dumps(port_devices, sort_keys=True))
+            units[key] = ("MODBUS_RTU " + comm_port, modbusrtu_polling_task,
+                          [port_devices['profile_list'], port_devices['protocol_setting_list'],
+                           self.interval, self.mqtt_config, comm_port])
+        if self.async_ip_polling:
+            return units
+        for protocol, task in [(SNMP, snmp_polling_task), (MODBUS_TCP, modbustcp_polling_task)]:
+            for each_device in devices_sorted[protocol]:
+                key = (protocol, each_device['profile']['name'], device_key(each_device))
+                units[key] = (protocol + " " + each_device['profile']['name'], task,
+                              [each_device['profile'], each_device['protocol_setting'], self.interval, self.mqtt_config])
+        return units
+
+    def apply(self, devices_sorted):
+        wanted = self.wanted_units(devices_sorted)
+        removed = [key for key in self.units if key not in wanted]
+        added = [key for key in wanted if key not in self.units]
+
+        # every removed worker is told to stop first, then joined: a comport is free before its new worker starts
+        for key in removed:
+            self.units[key].stop()
+        for key in removed:
+            print("SUPERVISOR: stopping " + self.units[key].name)
+            self.units.pop(key).join()
+            # the serial settings of the comport may have changed, its bus is opened again by the new worker
+            if key[0] == MODBUS_RTU:
+                MyRTUBus.close_bus(key[1])
+        for key in added:
+            name, target, args = wanted[key]
+            print("SUPERVISOR: starting " + name)
+            unit = Unit(name, target, args)
+            unit.start()
+            self.units[key] = unit
+
+        if self.async_ip_polling:
+            ip_devices = devices_sorted[SNMP] + devices_sorted[MODBUS_TCP]
+            if self.engine is not None:
+                self.engine.update(ip_devices)
+            elif len(ip_devices) != 0:
+                self.engine = Engine(ip_devices, self.interval, self.mqtt_config, control_plane.SHUTDOWN)
+                self.engine_thread = threading.Thread(target=ip_polling_task, args=[self.engine], name="ip_engine")
+                self.engine_thread.setDaemon(True)
+                self.engine_thread.start()
+
+        print("SUPERVISOR: %d worker(s) started, %d stopped, %d running" % (len(added), len(removed), len(self.units)))
+
+    def join(self):
+        # Wait for every worker after control_plane.SHUTDOWN was set
+        for unit in self.units.values():
+            unit.join()
+        if self.engine_thread is not None:
+            self.engine_thread.join()
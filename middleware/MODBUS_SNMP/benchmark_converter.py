@@ -0,0 +1,118 @@
+#!/usr/bin/python
+# Benchmark of Converter.decode_batch against the per-element Converter functions
+# Run from this folder: python benchmark_converter.py [number of 125 register blocks]
+import sys
+import time
+import random
+from Converter import *
+
+# (data type, registers) of the variables repeated over every block
+PATTERN = [("INT16", 1), ("UINT16", 1), ("UINT32", 2), ("INT32", 2), ("FLOAT32", 2), ("FLOAT64", 4), ("INT64", 4),
+           ("UINT64", 4), ("FLOAT16", 1)]
+# integer multipliers keep an integer value an int, the others make it a float
+MULTIPLIERS = [1, 0.1, 0.01, 10, 1000]
+BLOCKSIZE = 125
+
+
+def make_fields():
+    fields = []
+    offset = 0
+    i = 0
+    while True:
+        data_type, width = PATTERN[i % len(PATTERN)]
+        if offset + width > BLOCKSIZE:
+            return fields
+        fields.append(("var_" + str(i), offset, data_type, MULTIPLIERS[i % len(MULTIPLIERS)]))
+        offset += width
+        i += 1
+
+
+def decode_loop(registers, fields, big_endian, roundto=3):
+    # Same calls as the read_<DATATYPE> methods of Protocols.modbus_rtu
+    values = {}
+    for name, offset, data_type, multiplier in fields:
+        if data_type == "INT16":
+            value = UINT16toINT16(registers[offset:offset + 1])[0]
+        elif data_type == "UINT16":
+            value = registers[offset]
+        elif data_type == "UINT32":
+            value = UINT16toINT32(registers[offset:offset + 2], big_endian, False)[0]
+        elif data_type == "INT32":
+            value = UINT16toINT32(registers[offset:offset + 2], big_endian, True)[0]
+        elif data_type == "FLOAT32":
+            value = UINT16toFLOAT32(registers[offset:offset + 2], big_endian)[0]
+        elif data_type == "FLOAT64":
+            value = UINT16toFLOAT64(registers[offset:offset + 4], big_endian)[0]
+        elif data_type == "INT64":
+            value = UINT16toINT64(registers[offset:offset + 4], big_endian, True)[0]
+        elif data_type == "UINT64":
+            value = UINT16toINT64(registers[offset:offset + 4], big_endian, False)[0]
+        elif data_type == "FLOAT16":
+            value = UINT16toFLOAT16(registers[offset:offset + 1])[0]
+        values[name] = round(value * multiplier, roundto)
+    return values
+
+
+def encode(fields, big_endian):
+    # One block of realistic device values, encoded with the Converter *toUINT16 functions
+    registers = [0] * BLOCKSIZE
+    for name, offset, data_type, multiplier in fields:
+        value = random.uniform(-100000, 100000)
+        if data_type == "INT16":
+            words = INT16toUINT16([int(value) % 32768])
+        elif data_type == "UINT16":
+            words = [int(abs(value)) % 65536]
+        elif data_type == "UINT32":
+            words = INT32toUINT16(int(abs(value)), big_endian, False)
+        elif data_type == "INT32":
+            words = INT32toUINT16(int(value), big_endian, True)
+        elif data_type == "FLOAT32":
+            words = FLOAT32toUINT16(value, big_endian)
+        elif data_type == "FLOAT64":
+            words = FLOAT64toUINT16(value, big_endian)
+        elif data_type == "INT64":
+            words = INT64toUINT16(int(value), big_endian, True)
+        elif data_type == "UINT64":
+            words = INT64toUINT16(int(abs(value)), big_endian, False)
+        elif data_type == "FLOAT16":
+            # within the float16 range
+            words = FLOAT16toUINT16([value / 10])
+        registers[offset:offset + len(words)] = words
+    return registers
+
+
+def best_of(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    fields = make_fields()
+
+    for big_endian in [True, False]:
+        layout = BatchLayout(fields, big_endian)
+        buffers = [encode(fields, big_endian) for _ in range(blocks)]
+        noise = [[random.randrange(65536) for _ in range(BLOCKSIZE)] for _ in range(blocks)]
+
+        # both decoders must agree, value and type, on device values and on random registers (nan, inf, huge values)
+        for registers in buffers + noise:
+            expected = decode_loop(registers, fields, big_endian)
+            result = decode_batch(registers, layout)
+            for name in expected:
+                a, b = expected[name], result[name]
+                if type(a) != type(b) or (a != b and not (a != a and b != b)):
+                    print("mismatch", name, a, b)
+                    sys.exit(1)
+
+        loop_time = best_of(lambda: [decode_loop(registers, fields, big_endian) for registers in buffers])
+        batch_time = best_of(lambda: [decode_batch(registers, layout) for registers in buffers])
+        print("%s: %d blocks x %d variables" % ("Big Endian" if big_endian else "Little Endian", blocks, len(fields)))
+        print("  per-element : %8.2f ms (%6.1f us/block)" % (loop_time * 1000, loop_time * 1e6 / blocks))
+        print("  batch       : %8.2f ms (%6.1f us/block)" % (batch_time * 1000, batch_time * 1e6 / blocks))
+        print("  speedup     : %8.1fx" % (loop_time / batch_time))
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# Benchmark of the payload formats of payload_codec: message size, encode and parse time
+# Run from this folder: python benchmark_payload.py [number of messages]
+# MessagePack and CBOR are only measured when the msgpack / cbor2 packages are installed
+import os
+import sys
+import time
+import random
+# modules shared by the services, see middleware/common/README.md
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+import payload_codec as MyPayload
+
+# (name, number of variables) of representative devices
+DEVICES = [("power meter", 60), ("UPS SNMP", 120), ("generator controller", 1200)]
+# variable names and value types of a meter, repeated with a phase / channel number
+NAMES = ["voltage", "current", "active_power", "reactive_power", "apparent_power", "power_factor",
+         "frequency", "energy_import", "energy_export", "thd_voltage", "thd_current", "status"]
+
+
+def make_frame(size):
+    frame = {}
+    for i in range(size):
+        name = NAMES[i % len(NAMES)] + "_" + str(i // len(NAMES) + 1)
+        if name.startswith("status"):
+            frame[name] = random.choice(["Normal", "Alarm", "Bypass"])
+        elif name.startswith("energy"):
+            frame[name] = random.randrange(10 ** 6, 10 ** 8)
+        else:
+            frame[name] = round(random.uniform(0, 500), 3)
+    frame["PollingDuration"] = 0.532
+    frame["Timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return frame
+
+
+def message(encoder, topic, frame):
+    # Same message as Tasks/snmp.publish_result
+    result = {
+        'device_name': "bench",
+        'protocol_type': "SNMP V2c",
+        'ip_address': "192.168.0.10",
+        "Timestamp": frame["Timestamp"],
+    }
+    result.update(encoder.value(topic, frame))
+    return encoder.dumps(result)
+
+
+def parse(payload):
+    # What a consumer does: the message, then the device values
+    return MyPayload.values(MyPayload.loads(payload))
+
+
+def best_of(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    formats = [fmt for fmt in MyPayload.FORMATS
+               if not (fmt == MyPayload.MSGPACK and MyPayload.msgpack is None)
+               and not (fmt == MyPayload.CBOR and MyPayload.cbor2 is None)]
+
+    for device, size in DEVICES:
+        frames = [make_frame(size) for _ in range(count)]
+        print("%s: %d messages x %d variables" % (device, count, size))
+        print("  %-8s %10s %14s %14s" % ("format", "bytes", "encode us/msg", "parse us/msg"))
+        for fmt in formats:
+            # schema_repeat above count: the field names of "array" are sent once, like in steady state
+            encoder = MyPayload.Encoder(fmt, schema_repeat=count * 10)
+            payloads = [message(encoder, "bench", frame) for frame in frames]
+
+            # every format must give back the frame of the device
+            for frame, payload in zip(frames, payloads):
+                if parse(payload) != frame:
+                    print("mismatch", fmt)
+                    sys.exit(1)
+
+            payloads = [payload.encode() if isinstance(payload, str) else payload for payload in payloads]
+            size_avg = sum(len(payload) for payload in payloads[1:]) / float(len(payloads) - 1)
+            encode_time = best_of(lambda: [message(encoder, "bench", frame) for frame in frames])
+            parse_time = best_of(lambda: [parse(payload) for payload in payloads])
+            print("  %-8s %10d %14.1f %14.1f" % (fmt, size_avg, encode_time * 1e6 / count, parse_time * 1e6 / count))
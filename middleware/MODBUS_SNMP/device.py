@@ -1,6 +1,6 @@
 import paho.mqtt.client as mqtt
 import json
-import subprocess
+import os
 
 CONFIG_FILE_PATH = 'JSON/Config/installed_devices.json'
 
@@ -9,15 +9,11 @@ def load_installed_devices():
         return json.load(file)
 
 def save_installed_devices(devices):
-    with open(CONFIG_FILE_PATH, 'w') as file:
+    # Written to a temporary file then renamed: the poller reloads the file as soon as it changes
+    # and must never read it half written
+    with open(CONFIG_FILE_PATH + '.tmp', 'w') as file:
         json.dump(devices, file, indent=4)
-
-def restart_service():
-    try:
-        subprocess.run(['sudo', 'systemctl', 'restart', 'device_config_snmp.service'], check=True)
-        print("Service restarted successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to restart service: {e}")
+    os.replace(CONFIG_FILE_PATH + '.tmp', CONFIG_FILE_PATH)
 
 def on_message(client, userdata, message):
     print(f"Received message: {message.payload.decode('utf-8')} on topic {message.topic}")
@@ -34,21 +30,18 @@ def on_message(client, userdata, message):
         elif command.get('command') == 'addDevice':
             devices.append(command.get('device'))
             save_installed_devices(devices)
-            restart_service()
             response = json.dumps({"status": "success", "message": "Device added successfully"})
         elif command.get('command') == 'updateDevice':
             device_index = next((index for (index, d) in enumerate(devices) if d['profile']['name'] == command.get('deviceName')), None)
             if device_index is not None:
                 devices[device_index] = command.get('device')
                 save_installed_devices(devices)
-                restart_service()
                 response = json.dumps({"status": "success", "message": "Device updated successfully"})
             else:
                 response = json.dumps({"status": "error", "message": "Device not found"})
         elif command.get('command') == 'deleteDevice':
             devices = [d for d in devices if d['profile']['name'] != command.get('deviceName')]
             save_installed_devices(devices)
-            restart_service()
             response = json.dumps({"status": "success", "message": "Device deleted successfully"})
         else:
             response = json.dumps({"status": "error", "message": "Unknown command"})
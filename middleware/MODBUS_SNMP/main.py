@@ -11,20 +11,28 @@ import os
 import time
 import signal
 import json
-from Poller.libs import PROTOCOLS, SNMP, MODBUS_RTU, MODBUS_TCP
-from Tasks.snmp import snmp_polling_task
-from Tasks.modbus_tcp import modbustcp_polling_task
-from Tasks.modbus_rtu import modbusrtu_polling_task
+import Tasks.supervisor as supervisor
+import Tasks.control_plane as control_plane
+import Poller.scheduler as scheduler
 import os
 import requests
-from time import strftime, localtime
 import paho.mqtt.client as mqtt
-import Protocols.mqtt as MyMQTT
+import Protocols.publisher as MyPublisher
+import Protocols.rtu_bus as MyRTUBus
+import Protocols.snmp_session as MySNMPSession
 
 
 pp = pprint.PrettyPrinter(indent=2)
 ParentFolder = os.path.abspath('..')
 
+PUBLISHER_STATS_TOPIC = "modbus_snmp_publisher_stats"
+PUBLISHER_STATS_INTERVAL = 60
+
+INSTALLED_DEVICES_PATH = os.getcwd() + '/JSON/Config/installed_devices.json'
+MQTT_CONFIG_PATH = os.getcwd() + '/JSON/Config/mqtt_config.json'
+# Set when a "reload" (or "restart") control message asks for installed_devices.json to be applied now
+RELOAD = threading.Event()
+
 def get_process_memory():
     process = psutil.Process(os.getpid())
     return [process.memory_info().rss, process.memory_full_info().rss]
@@ -49,20 +57,23 @@ def service_shutdown(signum, frame):
     print('Caught signal %d' % signum)
     raise ServiceExit
 
+def load_mqtt_config():
+    with open(MQTT_CONFIG_PATH) as json_data:
+        return json.load(json_data)
+
 def process_data_subscribe(client, userdata, message):
     print("Get Subscribe data system control with topic: "+ message.topic)
     sub_data = json.loads(message.payload)
-    if sub_data["control"] == "restart":
+    if sub_data["control"] == "restart" and load_mqtt_config() != MQTT_CONFIG:
+        # broker settings changed, only a new process picks them up
         print("Restart")
         os.execl(sys.executable, sys.executable, *sys.argv)
+    elif sub_data["control"] in ["restart", "reload"]:
+        # device changes are applied in place by the supervisor
+        print("Reload")
+        RELOAD.set()
 
 if __name__ == '__main__':
-    # Set polling task status
-    
-    FINISH = False
-    with open(os.getcwd() + '/stat.temp', 'w') as file:
-        file.write(str(FINISH))
-
     # Register the signal handlers
     signal.signal(signal.SIGTERM, service_shutdown)
     signal.signal(signal.SIGINT, service_shutdown)
@@ -71,129 +82,68 @@ if __name__ == '__main__':
     print("...")
 
     # Get all device profile and protocol setting via API
-    INSTALLED_DEVICES = []
-    with open(os.getcwd() + '/JSON/Config/installed_devices.json') as json_data:
-        INSTALLED_DEVICES = json.load(json_data)
+    INSTALLED_DEVICES = supervisor.load_devices(INSTALLED_DEVICES_PATH)
 
     # Clustering equipments (profile and protocol setting) based on their communication protocol
-    INSTALLED_DEVICES_SORTED = {
-        "SNMP": [],
-        "Modbus TCP": [],
-        "Modbus RTU": {},
-    }
-
-    for i, item in enumerate(INSTALLED_DEVICES):
-        protocol_type = item['protocol_setting']['protocol']
-        # FOR MODBUS RTU
-        if protocol_type == MODBUS_RTU:
-            comm_port = item['protocol_setting']['port']
-            if comm_port in INSTALLED_DEVICES_SORTED[protocol_type]:
-                INSTALLED_DEVICES_SORTED[protocol_type][comm_port]['profile_list'].append(
-                    item['profile'])
-                INSTALLED_DEVICES_SORTED[protocol_type][comm_port]['protocol_setting_list'].append(
-                    item['protocol_setting'])
-            else:
-                INSTALLED_DEVICES_SORTED[protocol_type][comm_port] = {
-                    "profile_list": [],
-                    "protocol_setting_list": []
-                }
-                INSTALLED_DEVICES_SORTED[protocol_type][comm_port]['profile_list'].append(
-                    item['profile'])
-                INSTALLED_DEVICES_SORTED[protocol_type][comm_port]['protocol_setting_list'].append(
-                    item['protocol_setting'])
-        # FOR MODBUS TCP and SNMP
-        else:
-            INSTALLED_DEVICES_SORTED[protocol_type].append(item)
+    INSTALLED_DEVICES_SORTED = supervisor.sort_devices(INSTALLED_DEVICES)
 
     print("\n====================================== INSTALLED DEVICES SORTED =========================================")
     pp.pprint(INSTALLED_DEVICES_SORTED)
 
     # Get MQTT service config
-    MQTT_CONFIG = {}
-    with open(os.getcwd() + '/JSON/Config/mqtt_config.json') as json_data:
-        MQTT_CONFIG = json.load(json_data)
+    MQTT_CONFIG = load_mqtt_config()
 
     print("\n====================================== MQTT CONFIG =========================================")
     pp.pprint(MQTT_CONFIG)
 
-    while True:
-        try:
-            # Subscribe for control system
-            Subsclient = mqtt.Client()
-            Subsclient.on_message=process_data_subscribe 
-            Subsclient.connect(MQTT_CONFIG["broker_address"], MQTT_CONFIG["broker_port"])
-            Subsclient.loop_start()
-            Subsclient.subscribe(MQTT_CONFIG['sub_topic_system'])
-            print("MAIN: Succes Connecting to broker for Subscriber")
-            break
-        except Exception as e:
-            print(e)
-            print("Failed to connect broker mqtt")
-            time.sleep(5)
-            mqtt_client = MyMQTT.Client("localhost", 1883, True, 1, "",
-                                    "")
-            mqtt_client.set_usr_pw("", "")
-            mqtt_client.connect()
-            mqtt_client.publish(
-                "subrack/error/log", {"data": "MODBUS/SNMP cannot connect to server broker mqtt", "type" : "critical"}
-                )
-            
-            errlog = open(os.getcwd() + "/errlog.txt", "a")
-            errlog.write("{0} {1} Error 5: {2}\n".format(
-                strftime("%Y-%m-%d %H:%M:%S", localtime()), "modbus snmp task", "Failed to connect broker mqtt"))
-            errlog.close()
+    # Subscribe for control system, paho keeps connecting in the background
+    Subsclient = mqtt.Client()
+    control_plane.start_subscriber(Subsclient, MQTT_CONFIG["broker_address"], MQTT_CONFIG["broker_port"],
+                                   MQTT_CONFIG['sub_topic_system'], process_data_subscribe, "MODBUS/SNMP", "modbus snmp task")
 
     print("\n============================ MQTT Subrcribe System Control ===============================")
 
     # GET POLLING INTERVAL
     INTERVAL = MQTT_CONFIG["pub_interval"]
 
+    # SNMP and Modbus TCP devices are polled by one asyncio engine thread unless disabled in mqtt_config.json
+    ASYNC_IP_POLLING = MQTT_CONFIG.get("async_ip_polling", True)
+
     print("\n====================================== Threads =========================================")
     try:
-        threads = {protocol: [] for protocol in PROTOCOLS}
-
-        for protocol in PROTOCOLS:
-            if protocol == SNMP:
-                for i, each_device in enumerate(INSTALLED_DEVICES_SORTED[protocol]):
-                    profile = each_device['profile']
-                    protocol_setting = each_device['protocol_setting']
-                    threads[protocol].append(threading.Thread(target=snmp_polling_task, args=[
-                                             profile, protocol_setting, INTERVAL, MQTT_CONFIG]))
-                    threads[protocol][i].setDaemon(True)
-                    threads[protocol][i].start()
-            elif protocol == MODBUS_TCP:
-                for i, each_device in enumerate(INSTALLED_DEVICES_SORTED[protocol]):
-                    profile = each_device['profile']
-                    protocol_setting = each_device['protocol_setting']
-                    threads[protocol].append(threading.Thread(target=modbustcp_polling_task, args=[
-                                             profile, protocol_setting, INTERVAL, MQTT_CONFIG]))
-                    threads[protocol][i].setDaemon(True)
-                    threads[protocol][i].start()
-            elif protocol == MODBUS_RTU:
-                for i, comm_port in enumerate(INSTALLED_DEVICES_SORTED[protocol].keys()):
-                    profile_list = INSTALLED_DEVICES_SORTED[protocol][comm_port]['profile_list']
-                    protocol_setting_list = INSTALLED_DEVICES_SORTED[
-                        protocol][comm_port]['protocol_setting_list']
-                    threads[protocol].append(threading.Thread(target=modbusrtu_polling_task, args=[
-                                             profile_list, protocol_setting_list, INTERVAL, MQTT_CONFIG, comm_port]))
-                    threads[protocol][i].setDaemon(True)
-                    threads[protocol][i].start()
+        # The supervisor starts the workers, then applies every change of installed_devices.json in place
+        workers = supervisor.Supervisor(INSTALLED_DEVICES_PATH, INTERVAL, MQTT_CONFIG, ASYNC_IP_POLLING)
+        workers.reload()
 
         print("All Threads started")
+        last_report = time.time()
+        last_check = time.time()
         while (True):
             time.sleep(0.5)
+            if RELOAD.is_set():
+                RELOAD.clear()
+                workers.reload()
+            elif time.time() - last_check >= supervisor.CHECKINTERVAL:
+                last_check = time.time()
+                workers.check()
+            # Report publish latency and queue depth of every broker connection
+            if time.time() - last_report >= PUBLISHER_STATS_INTERVAL:
+                last_report = time.time()
+                MyPublisher.get_local_publisher().publish(
+                    PUBLISHER_STATS_TOPIC, {"publishers": MyPublisher.all_stats(), "rtu_buses": MyRTUBus.all_stats(),
+                                            "snmp_sessions": MySNMPSession.all_stats(),
+                                            "schedules": scheduler.all_stats()})
 
     except ServiceExit:
         # Set polling task status
         print("Finished")
-        FINISH = True
-        with open(os.getcwd() + '/stat.temp', 'w') as file:
-            file.write(str(FINISH))
+        control_plane.SHUTDOWN.set()
 
-        for protocol in PROTOCOLS:
-            for thread in threads[protocol]:
-                thread.join()
+        workers.join()
         print('All Thread Stopped')
+        MyRTUBus.close_all()
+        MySNMPSession.close_all()
+        MyPublisher.stop_all()
     except:
         tb = traceback.format_exc()
         # print(tb)
@@ -1 +1 @@
-from Tasks import i2c_out, i2c_modular
\ No newline at end of file
+from Tasks import i2c_out, i2c_modular, control_plane
@@ -0,0 +1,12 @@
+import os
+import sys
+import threading
+
+# modules shared by the services, see middleware/common/README.md
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common"))
+
+# queue and router of the control commands, shared with MODBUS_SNMP
+from command_queue import MAXCOMMANDS, CommandQueue, CommandRouter
+
+# Set by main.py on SIGTERM/SIGINT, replaces the FINISH flag of stat.temp
+SHUTDOWN = threading.Event()
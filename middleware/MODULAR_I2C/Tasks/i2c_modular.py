@@ -2,13 +2,11 @@ import imp
 import paho.mqtt.client as mqtt
 from time import strftime, localtime
 import json
-import getmac
 import pprint
 import traceback
 import time
 import psutil
 import os
-import ast
 import sys
 
 import Poller.poller_task as poller
@@ -20,10 +18,11 @@ import Modular.relay as relay
 import Modular.relay_mini as relay_mini
 
 import Protocols.mqtt as MyMQTT
+import node_identity as MyNode
+import snapshot as MySnapshot
+import Tasks.control_plane as control_plane
 
 
-wait_delay = False
-
 topic_state = "stateinfo"
 function_read = "read"
 function_write = "write"
@@ -36,39 +35,27 @@ DRYCONTACT ="DRYCONTACT"
 RELAYMINI = "RELAYMINI"
 
 Subsclient = mqtt.Client("")
-sub_data = []
-sub_topic = ""
+# Control commands are queued by the MQTT callback and run by the polling thread between two
+# devices, so the I2C bus is never used by two threads at once
+commands = control_plane.CommandQueue()
+# last_data_<part number>.json, written at most MySnapshot.MAXRATE times per second per file
+snapshots = MySnapshot.get_writer()
 
 
 def get_process_memory():
     process = psutil.Process(os.getpid())
     return [process.memory_info().rss, process.memory_full_info().rss]
 
-def wait_until(somepredicate, timeout, period=0.25):
-  mustend = time.time() + timeout
-  while time.time() < mustend:
-    if somepredicate: 
-        return True
-    time.sleep(period)
-  return False
-
 
 def process_data_subscribe(client, userdata, message):
-    global sub_data, sub_topic
-    print("hello")
     print(message.payload)
     try: 
-        sub_data = json.loads(message.payload)
-        sub_topic = message.topic
-        process_data_subscribe_in_loop()
-        with open(os.getcwd() + '/stat_subscribe_modular.temp', 'w') as file:
-            file.write(str(True))
+        commands.put(message.topic, json.loads(message.payload))
     except Exception as e:
         print(e)
         pass
 
-def process_data_subscribe_in_loop():
-    global Subsclient, sub_data, sub_topic
+def process_command(sub_topic, sub_data):
     try: 
         #Parshing data
         mac = sub_data["mac"]
@@ -80,7 +67,7 @@ def process_data_subscribe_in_loop():
 
         errlog = open(os.getcwd() + "/errlog.txt", "a")
 
-        if mac == getmac.get_mac_address():
+        if MyNode.is_local_mac(mac):
             print("Get Subscribe data with topic =", sub_topic)
             
             if device == AIO:
@@ -170,7 +157,7 @@ def process_data_subscribe_in_loop():
 
 
 def i2c_modular_polling_task(devices_list, interval, mqtt_config):
-    global Subsclient, wait_delay
+    global Subsclient
 
     print("starting i2c modular polling task ....")
 
@@ -187,9 +174,6 @@ def i2c_modular_polling_task(devices_list, interval, mqtt_config):
         dev_poller.append(poller.Modular(
             devices_list[i]["profile"], devices_list[i]["protocol_setting"]))
 
-    with open(os.getcwd() + '/stat.temp') as file:
-        FINISH = ast.literal_eval(file.read())
-
     # MQTT Config Data
     mqtt_enable = mqtt_config['enable']
     broker_address = mqtt_config['broker_address']
@@ -232,7 +216,7 @@ def i2c_modular_polling_task(devices_list, interval, mqtt_config):
     print("Connecting to broker for Subscriber")
 
     pub_data =  {
-                    'mac': getmac.get_mac_address(),
+                    'mac': MyNode.mac(),
                     'protocol_type': 'I2C Modular',
                     'device' : "",
                     'adrress': "",
@@ -285,9 +269,13 @@ def i2c_modular_polling_task(devices_list, interval, mqtt_config):
             pass
             
 
-    while (not FINISH):
+    while not control_plane.SHUTDOWN.is_set():
         try:            
+            cycle_start = time.time()
             for i in range(dev_num):
+                # control commands received since the previous device
+                commands.drain(process_command)
+
                 #topic = mqtt_config['pub_topic'][0]
                 topic = devices_list[i]["profile"]["topic"]
                 try:
@@ -300,26 +288,14 @@ def i2c_modular_polling_task(devices_list, interval, mqtt_config):
 
                             i2c_addres = devices_list[i]["protocol_setting"]["address"]
                             mqtt_client.publish(topic, {
-                                'mac': getmac.get_mac_address(),
+                                'mac': MyNode.mac(),
                                 'protocol_type': 'I2C MODULAR',
                                 'number_address': i2c_addres,
                                 'value': json.dumps(data)
                             })
 
-                            #write data subscriber
-                            #check is a any subscriber?
-                            any_subs =  False
-                            with open(os.getcwd() + '/stat_subscribe_modular.temp') as file:
-                                any_subs = ast.literal_eval(file.read())
-                            #print("any_subs: ", any_subs)
-                            if any_subs:
-                                #process_data_subscribe_in_loop()
-                                with open(os.getcwd() + '/stat_subscribe_modular.temp', 'w') as file:
-                                    file.write(str(False))
-                                
                             type_device = devices_list[i]["profile"]["part_number"]    
-                            with open(os.getcwd() + '/last_data_'+ type_device +'.json', "w") as outfile:
-                                outfile.write(json.dumps(data)) 
+                            snapshots.write(os.getcwd() + '/last_data_'+ type_device +'.json', data)
 
                             #errlog = open(os.getcwd() + "/errlog.txt", "a")
                             #errlog.write("{0} {1} publish check\n".format(
@@ -363,16 +339,10 @@ def i2c_modular_polling_task(devices_list, interval, mqtt_config):
             #errlog.write("{0} {1} data acquisition check\n".format(
             #    strftime("%Y-%m-%d %H:%M:%S", localtime()), devices_list[i]["profile"]["name"]))
             #.close()
-            # Read Polling Service Status
-            with open(os.getcwd() + '/stat.temp') as file:
-                FINISH = ast.literal_eval(file.read())
-
-            # Wait for next data polling
-            wait_delay = True
-            for i in range(interval):
-                if i == interval -2:
-                    wait_delay = False
-                time.sleep(1)
+            # Wait for next data polling, control commands run as soon as they arrive
+            deadline = cycle_start + interval
+            while not control_plane.SHUTDOWN.is_set() and time.time() < deadline:
+                commands.drain(process_command, min(deadline - time.time(), 1))
            
 
         except KeyboardInterrupt:
@@ -4,17 +4,17 @@ import I2Cout
 import paho.mqtt.client as mqtt
 from time import strftime, localtime
 import json
-import getmac
 import pprint
 import traceback
 import time
 import psutil
 import os
-import ast
 import sys
 
 import Poller.poller_task as poller
 import Protocols.mqtt as MyMQTT
+import node_identity as MyNode
+import Tasks.control_plane as control_plane
 
 topic_state = "stateinfo"
 function_read = "read"
@@ -22,24 +22,23 @@ function_write = "write"
 
 Subsclient = mqtt.Client("")
 
-wait_delay = False
+# Control commands are queued by the MQTT callback and run by the polling thread between two
+# devices, so the I2C bus is never used by two threads at once
+commands = control_plane.CommandQueue()
 
 def get_process_memory():
     process = psutil.Process(os.getpid())
     return [process.memory_info().rss, process.memory_full_info().rss]
 
-def wait_until(somepredicate, timeout, period=0.25):
-  mustend = time.time() + timeout
-  while time.time() < mustend:
-    if somepredicate: 
-        return True
-    time.sleep(period)
-  return False
-
 def process_data_subscribe(client, userdata, message):
+    try:
+        commands.put(message.topic, json.loads(message.payload))
+    except Exception as e:
+        print(e)
+
+def process_command(sub_topic, sub_data):
     global Subsclient
     try:
-        sub_data = json.loads(message.payload)
         #Parshing data
         mac = sub_data["mac"]
         device = sub_data["part_number"]
@@ -50,33 +49,32 @@ def process_data_subscribe(client, userdata, message):
 
         errlog = open(os.getcwd() + "/errlog.txt", "a")
 
-        if mac == getmac.get_mac_address():
-            print("Get Subscribe data with topic =",message.topic)
-            if wait_until(wait_delay, 10, 0.1):
-                try:
-                    errlog.write("{0} {1} data acquisition check\n".format(
-                    strftime("%Y-%m-%d %H:%M:%S", localtime()), "Control: " + device))
-                    errlog.close()
+        if MyNode.is_local_mac(mac):
+            print("Get Subscribe data with topic =",sub_topic)
+            try:
+                errlog.write("{0} {1} data acquisition check\n".format(
+                strftime("%Y-%m-%d %H:%M:%S", localtime()), "Control: " + device))
+                errlog.close()
 
-                    if function == function_read:
-                        command = """
+                if function == function_read:
+                    command = """
 data, status = I2Cout.%s.get_data(%d, %d)
 sub_data["data"] = data
 sub_data["status"] = status
-                """ % (device , address, device_bus)
-                        exec(command)
-                        Subsclient.publish( message.topic + "_status", json.dumps(sub_data))
-                    elif function == function_write:
-                        command = """
+            """ % (device , address, device_bus)
+                    exec(command)
+                    Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
+                elif function == function_write:
+                    command = """
 status = I2Cout.%s.set_data(%d, %d, %d)
 sub_data["status"] = status
-                """ % (device , value, address, device_bus)
-                        exec(command)
-                        Subsclient.publish( message.topic + "_status", json.dumps(sub_data))
-                except Exception as e:
-                    print(e)
-                    sub_data["status"] = "Failed"
-                    Subsclient.publish( message.topic + "_status", json.dumps(sub_data))
+            """ % (device , value, address, device_bus)
+                    exec(command)
+                    Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
+            except Exception as e:
+                print(e)
+                sub_data["status"] = "Failed"
+                Subsclient.publish( sub_topic + "_status", json.dumps(sub_data))
 
 
     except Exception as e:
@@ -84,7 +82,7 @@ sub_data["status"] = status
 
         
 def i2c_out_polling_task(devices_list, interval, mqtt_config, ):
-    global Subsclient, wait_delay
+    global Subsclient
 
     print("starting i2c out polling task ....")
 
@@ -101,9 +99,6 @@ def i2c_out_polling_task(devices_list, interval, mqtt_config, ):
         dev_poller.append(poller.I2C_OUT(
             devices_list[i]["profile"], devices_list[i]["protocol_setting"]))
 
-    with open(os.getcwd() + '/stat.temp') as file:
-        FINISH = ast.literal_eval(file.read())
-
     # MQTT Config Data
     mqtt_enable = mqtt_config['enable']
     broker_address = mqtt_config['broker_address']
@@ -124,7 +119,7 @@ def i2c_out_polling_task(devices_list, interval, mqtt_config, ):
     print("Connecting to broker for Subscriber")
 
     data_pub = {
-                'mac': getmac.get_mac_address(),
+                'mac': MyNode.mac(),
                 'protocol_type': 'I2C Modular',
                 'device' : "",
                 'adrress': "",
@@ -134,9 +129,13 @@ def i2c_out_polling_task(devices_list, interval, mqtt_config, ):
                 }
     # Publish State
     Subsclient.publish(topic_state, json.dumps(data_pub))
-    while (not FINISH):
+    while not control_plane.SHUTDOWN.is_set():
         try:            
+            cycle_start = time.time()
             for i in range(dev_num):
+                # control commands received since the previous device
+                commands.drain(process_command)
+
                 topic = mqtt_config['pub_topic'][0]
                 try:
                     data = dev_poller[i].poll()
@@ -156,7 +155,7 @@ def i2c_out_polling_task(devices_list, interval, mqtt_config, ):
 
                             i2c_addres = devices_list[i]["protocol_setting"]["address"]
                             mqtt_client.publish(topic, {
-                                'mac': getmac.get_mac_address(),
+                                'mac': MyNode.mac(),
                                 'protocol_type': 'I2C OUT',
                                 'number_address': i2c_addres,
                                 'value': json.dumps(data)
@@ -193,16 +192,10 @@ def i2c_out_polling_task(devices_list, interval, mqtt_config, ):
             errlog.write("{0} {1} data acquisition check\n".format(
                 strftime("%Y-%m-%d %H:%M:%S", localtime()), devices_list[i]["profile"]["name"]))
             errlog.close()
-            # Read Polling Service Status
-            with open(os.getcwd() + '/stat.temp') as file:
-                FINISH = ast.literal_eval(file.read())
-
-            # Wait for next data polling
-            wait_delay = True
-            for i in range(interval):
-                if i == interval -2:
-                    wait_delay = False
-                time.sleep(1)
+            # Wait for next data polling, control commands run as soon as they arrive
+            deadline = cycle_start + interval
+            while not control_plane.SHUTDOWN.is_set() and time.time() < deadline:
+                commands.drain(process_command, min(deadline - time.time(), 1))
            
 
         except KeyboardInterrupt:
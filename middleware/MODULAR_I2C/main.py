@@ -13,6 +13,7 @@ import json
 from datetime import datetime
 from Tasks.i2c_modular import i2c_modular_polling_task
 from Tasks.i2c_out import i2c_out_polling_task
+import Tasks.control_plane as control_plane
 import os
 import requests
 
@@ -66,12 +67,6 @@ def process_data_subscribe(client, userdata, message):
         os.execl(sys.executable, sys.executable, *sys.argv)
 
 if __name__ == '__main__':
-    # Set polling task status
-    
-    FINISH = False
-    with open(os.getcwd() + '/stat.temp', 'w') as file:
-        file.write(str(FINISH))
-
     # Register the signal handlers
     signal.signal(signal.SIGTERM, service_shutdown)
     signal.signal(signal.SIGINT, service_shutdown)
@@ -162,13 +157,11 @@ if __name__ == '__main__':
     except ServiceExit:
         # Set polling task status
         print("Finished")
-        FINISH = True
-        with open(os.getcwd() + '/stat.temp', 'w') as file:
-            file.write(str(FINISH))
+        control_plane.SHUTDOWN.set()
 
         for protocol in PROTOCOLS:
-            for thread in threads[protocol]:
-                thread.join()
+            if isinstance(threads[protocol], threading.Thread):
+                threads[protocol].join()
         print('All Thread Stopped')
     except:
         tb = traceback.format_exc()
@@ -0,0 +1,156 @@
+import json
+import os
+import point_table
+
+# Persisted allocation of the Modbus registers of the point table: a point keeps its register for good,
+# a new device or a new point only takes free registers so the addresses known by the SCADA never shift.
+# The file holds {"version": <incremented on every change>, "registers": {<register>: [device, key, pin]}}
+# with register numbers from 1 like Lib/modbus_list.json, pin is the position of the point in its device from 1.
+#
+# Register ranges of the groups, first and last register number
+RANGES = {
+    point_table.MODULAR: (1, 1000),
+    point_table.EQUIPMENT: (1001, 0x10000),
+}
+
+
+def label(device, key, pin, group):
+    # Return            :   name of the register in Lib/modbus_list.json
+    if group == point_table.MODULAR:
+        return device + "_pin_" + str(pin)
+    return key + "-" + device
+
+
+class AddressMap(object):
+    def __init__(self, path, legacy_path=None):
+        # Arguments:
+        # path              :   JSON file of the allocation, created on the first allocation
+        # legacy_path       :   modbus_list.json written before the allocation was persisted, its addresses
+        #                       are kept for the points it lists when path does not exist yet
+
+        self.path = path
+        self.version = 0
+        # register >> (device, key, pin)
+        self.registers = {}
+        # (device, key) >> register
+        self.points = {}
+        # label >> register of the legacy modbus_list.json
+        self.legacy = {}
+        self.load(legacy_path)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ FILE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def load(self, legacy_path=None):
+        try:
+            with open(self.path) as json_data:
+                data = json.load(json_data)
+            self.version = data["version"]
+            for register, (device, key, pin) in data["registers"].items():
+                self.registers[int(register)] = (device, key, pin)
+                self.points[(device, key)] = int(register)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            if os.path.exists(self.path):
+                print("MODBUS TCP: cannot read " + self.path + ": " + str(e))
+        else:
+            self.drop_envelope()
+            return
+        if legacy_path is not None:
+            try:
+                with open(legacy_path) as json_data:
+                    self.legacy = {name: int(register) for register, name in json.load(json_data).items()}
+            except (OSError, ValueError, AttributeError):
+                pass
+
+    def drop_envelope(self):
+        # Free the registers given to the envelope fields of the device messages (point_table.ENVELOPE), which
+        # were points when the equipment data files held the whole message. The other points keep their register
+        dropped = [register for register, (device, key, pin) in self.registers.items() if key in point_table.ENVELOPE]
+        if len(dropped) == 0:
+            return
+        for register in dropped:
+            device, key, pin = self.registers.pop(register)
+            self.points.pop((device, key), None)
+        self.version += 1
+        self.save()
+        print("MODBUS TCP: %d register(s) of message fields freed, address map version %d" % (len(dropped), self.version))
+
+    def save(self):
+        data = {
+            "version": self.version,
+            "registers": {str(register): list(point) for register, point in sorted(self.registers.items())},
+        }
+        with open(self.path + ".tmp", "w") as outfile:
+            json.dump(data, outfile)
+        os.replace(self.path + ".tmp", self.path)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ALLOCATION ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def allocate(self, table):
+        # Give a register to every point of the table that has none yet
+        # Return            :   True if registers were allocated, the map is then saved with a new version
+        missing = []
+        for group in RANGES:
+            for name in table.names(group):
+                for position, key in enumerate(table.keys(name)):
+                    if (name, key) not in self.points and key not in point_table.ENVELOPE:
+                        missing.append((group, name, key, position + 1))
+
+        # the points of the legacy modbus_list.json first, so no new point takes their register
+        added = 0
+        for group, name, key, pin in missing:
+            register = self.legacy.get(label(name, key, pin, group))
+            first, last = RANGES[group]
+            if register is not None and register not in self.registers and first <= register <= last:
+                self._add(register, name, key, pin)
+                added += 1
+        next_free = {group: first for group, (first, last) in RANGES.items()}
+        for group, name, key, pin in missing:
+            if (name, key) in self.points:
+                continue
+            while next_free[group] in self.registers:
+                next_free[group] += 1
+            if next_free[group] > RANGES[group][1]:
+                print("MODBUS TCP: no free register for " + label(name, key, pin, group))
+                continue
+            self._add(next_free[group], name, key, pin)
+            added += 1
+        if added == 0:
+            return False
+        self.version += 1
+        self.save()
+        print("MODBUS TCP: %d register(s) allocated, address map version %d" % (added, self.version))
+        return True
+
+    def _add(self, register, device, key, pin):
+        self.registers[register] = (device, key, pin)
+        self.points[(device, key)] = register
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ INDEXES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def register(self, device, key):
+        # Return            :   register number of a point, None if it has none
+        return self.points.get((device, key))
+
+    def point(self, register):
+        # Return            :   (device, key, pin) of a register number, None for a free register
+        return self.registers.get(register)
+
+    def modbus_list(self):
+        # Return            :   dictionary of register number and name, content of Lib/modbus_list.json
+        result = {}
+        for register, (device, key, pin) in sorted(self.registers.items()):
+            group = point_table.MODULAR if register <= RANGES[point_table.MODULAR][1] else point_table.EQUIPMENT
+            result[register] = label(device, key, pin, group)
+        return result
+
+    def export(self, path):
+        # Write the modbus_list of the map to path when its content changed
+        # Return            :   True if the file was written
+        content = json.dumps(self.modbus_list())
+        try:
+            with open(path) as infile:
+                if infile.read() == content:
+                    return False
+        except OSError:
+            pass
+        with open(path + ".tmp", "w") as outfile:
+            outfile.write(content)
+        os.replace(path + ".tmp", path)
+        return True
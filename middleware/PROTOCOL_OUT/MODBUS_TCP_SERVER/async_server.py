@@ -0,0 +1,256 @@
+import array
+import asyncio
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# asyncio Modbus TCP server of the register image of the point table.
+# Every client connection is served by its own coroutine: requests sent back to back (pipelined) are
+# answered in order without waiting for the previous answer to be read, and no client waits for another one.
+#
+# FC3 / FC4    :   read holding / input registers, both read the same register image (like pyModbusTCP)
+# FC6 / FC16   :   write single / multiple registers, a write is handed to on_write as one batch
+# Other function codes are answered with the exception "illegal function".
+READ_HOLDING_REGISTERS = 0x03
+READ_INPUT_REGISTERS = 0x04
+WRITE_SINGLE_REGISTER = 0x06
+WRITE_MULTIPLE_REGISTERS = 0x10
+
+EXP_ILLEGAL_FUNCTION = 0x01
+EXP_DATA_ADDRESS = 0x02
+EXP_DATA_VALUE = 0x03
+
+# Limits of the Modbus specification for one request
+MAXREADCOUNT = 125
+MAXWRITECOUNT = 123
+
+MBAP = struct.Struct(">HHHB")
+# A connection stops reading requests while more than WRITEBUFFERHIGH bytes of answers are not sent yet
+WRITEBUFFERHIGH = 64 * 1024
+# Seconds of the window of the request rate of a client
+RATEWINDOW = 10.0
+
+
+class RegisterBank(object):
+    # Register image, 16 bit words of address 0 to 0xFFFF.
+    # A write or a read is one slice of the array, atomic for the threads of the process
+    def __init__(self, size=0x10000):
+        self.size = size
+        self.words = array.array("H", bytes(2 * size))
+
+    def set_words(self, address, words):
+        # Return            :   True if success, None if the range is outside the image (like pyModbusTCP DataBank)
+        if address < 0 or address + len(words) > self.size:
+            return None
+        self.words[address:address + len(words)] = array.array("H", [int(word) & 0xffff for word in words])
+        return True
+
+    def get_words(self, address, count=1):
+        if address < 0 or address + count > self.size:
+            return None
+        return self.words[address:address + count].tolist()
+
+    def read_bytes(self, address, count):
+        # Return            :   registers as big endian bytes, the data of a read response
+        words = self.words[address:address + count]
+        if sys.byteorder == "little":
+            words.byteswap()
+        return words.tobytes()
+
+
+class ClientStats(object):
+    def __init__(self, peer):
+        self.peer = peer
+        self.connected = time.time()
+        self.requests = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        # requests per second of the last complete RATEWINDOW
+        self.rate = 0.0
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+
+    def record(self, latency, error):
+        # Arguments:
+        # latency           :   seconds from the request read to its answer queued
+        # error             :   True when the answer is an exception
+        self.requests += 1
+        self.errors += 1 if error else 0
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self._window_requests += 1
+        now = time.monotonic()
+        if now - self._window_start >= RATEWINDOW:
+            self.rate = self._window_requests / (now - self._window_start)
+            self._window_start = now
+            self._window_requests = 0
+
+    def current_rate(self):
+        # Return            :   requests per second of the running window, of the last one when it just started
+        elapsed = time.monotonic() - self._window_start
+        if elapsed < 1.0:
+            return self.rate
+        return self._window_requests / elapsed
+
+    def as_dict(self):
+        return {
+            "peer": self.peer,
+            "connected": self.connected,
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate": round(self.current_rate(), 1),
+            "latency_avg_us": round(self.latency_total * 1e6 / self.requests, 1) if self.requests else 0.0,
+            "latency_max_us": round(self.latency_max * 1e6, 1),
+        }
+
+
+class AsyncModbusServer(object):
+    def __init__(self, host, port, bank, on_write=None):
+        # Arguments:
+        # host              :   ip address to listen on
+        # port              :   tcp port
+        # bank              :   RegisterBank served to the clients
+        # on_write          :   function(address, words) called with the registers of each client write,
+        #                       in a worker thread so the clients are not held by the routing
+
+        self.host = host
+        self.port = int(port)
+        self.bank = bank
+        self.on_write = on_write
+        self.loop = None
+        self.thread = None
+        self._server = None
+        self._started = threading.Event()
+        self._error = None
+        # one worker: the writes are routed in the order of the requests
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ SERVER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def start(self):
+        # Start the server in its own thread, raise the error of the listening socket (address in use, ...)
+        self.thread = threading.Thread(target=self._run, name="modbus_tcp_server")
+        self.thread.setDaemon(True)
+        self.thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._serve_client, self.host, self.port))
+        except Exception as e:
+            self._error = e
+            self._started.set()
+            self.loop.close()
+            return
+        self._started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self._server.close()
+            self.loop.run_until_complete(self._server.wait_closed())
+            self.loop.close()
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join(5)
+
+    def is_run(self):
+        return self.thread is not None and self.thread.is_alive() and self._error is None
+
+    def stats(self):
+        # Return            :   list of the counters of the connected clients
+        with self._clients_lock:
+            return [client.as_dict() for client in self._clients.values()]
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ CLIENT ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    async def _serve_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        peer = "%s:%d" % (peer[0], peer[1]) if peer else "unknown"
+        client = ClientStats(peer)
+        with self._clients_lock:
+            self._clients[id(client)] = client
+        try:
+            while True:
+                header = await reader.readexactly(MBAP.size)
+                transaction_id, protocol_id, length, unit_id = MBAP.unpack(header)
+                if protocol_id != 0 or not 2 <= length <= 254:
+                    # not Modbus TCP, the stream cannot be resynchronised
+                    break
+                pdu = await reader.readexactly(length - 1)
+
+                start = time.perf_counter()
+                response = self.process(pdu)
+                writer.write(MBAP.pack(transaction_id, 0, len(response) + 1, unit_id) + response)
+                client.record(time.perf_counter() - start, response[0] & 0x80 != 0)
+
+                # pipelined requests are answered without a drain each, unless the client stops reading
+                if writer.transport.get_write_buffer_size() > WRITEBUFFERHIGH:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            with self._clients_lock:
+                self._clients.pop(id(client), None)
+            writer.close()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ REQUESTS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def process(self, pdu):
+        # Arguments:
+        # pdu               :   request PDU, function code and data
+        # Return            :   response PDU
+        function_code = pdu[0]
+        try:
+            if function_code in (READ_HOLDING_REGISTERS, READ_INPUT_REGISTERS):
+                address, count = struct.unpack(">HH", pdu[1:5])
+                if not 1 <= count <= MAXREADCOUNT:
+                    return exception(function_code, EXP_DATA_VALUE)
+                if address + count > self.bank.size:
+                    return exception(function_code, EXP_DATA_ADDRESS)
+                return struct.pack("BB", function_code, count * 2) + self.bank.read_bytes(address, count)
+
+            if function_code == WRITE_SINGLE_REGISTER:
+                address, value = struct.unpack(">HH", pdu[1:5])
+                if not self.write(address, [value]):
+                    return exception(function_code, EXP_DATA_ADDRESS)
+                return pdu[:5]
+
+            if function_code == WRITE_MULTIPLE_REGISTERS:
+                address, count, byte_count = struct.unpack(">HHB", pdu[1:6])
+                if not 1 <= count <= MAXWRITECOUNT or byte_count != count * 2 or len(pdu) < 6 + byte_count:
+                    return exception(function_code, EXP_DATA_VALUE)
+                if not self.write(address, list(struct.unpack(">%dH" % count, pdu[6:6 + byte_count]))):
+                    return exception(function_code, EXP_DATA_ADDRESS)
+                return pdu[:5]
+        except struct.error:
+            return exception(function_code, EXP_DATA_VALUE)
+        return exception(function_code, EXP_ILLEGAL_FUNCTION)
+
+    def write(self, address, words):
+        # Store a client write and hand it to on_write as one batch
+        if not self.bank.set_words(address, words):
+            return False
+        if self.on_write is not None:
+            self._executor.submit(self._route, address, words)
+        return True
+
+    def _route(self, address, words):
+        try:
+            self.on_write(address, words)
+        except Exception as e:
+            print("MODBUS TCP: write hook error " + str(e))
+
+
+def exception(function_code, code):
+    # Return            :   exception response PDU
+    return struct.pack("BB", function_code | 0x80, code)
@@ -0,0 +1,158 @@
+from bisect import bisect_right, insort
+import point_table
+from SNMP_SERVER.RegOID import SNMPSetting_oids, mod_analog_io, mod_optocoupler, mod_gpio, mod_drycontact, \
+    mod_relay, mod_relay_mini
+
+# OIDs of the SNMP agent, indexed from the shared point table. Under the sysOID of Comm.json:
+#   5.<setting>.0                       :   SNMP settings of Comm.json (SNMPSetting_oids)
+#   <category>.<x>.<number>.<pin>.0     :   point of the modular "modular_<type>_<number>" (RegOID mod_* tables)
+#   12.<equipment>.<point>.0            :   point of the equipment at this position of the sorted names, from 0,
+#                                           point from 1 in the order of the point table
+SETTING = "setting"
+POINT = "point"
+
+SETTINGCATEGORY = 5
+EQUIPMENTCATEGORY = 12
+# modular type >> (category, second sub identifier, RegOID table of "[pin oid]" >> point key)
+MODULARCATEGORIES = {
+    "analog_io": (6, 2, mod_analog_io),
+    "optocoupler": (7, 8, mod_optocoupler),
+    "gpio": (8, 8, mod_gpio),
+    "drycontact": (9, 8, mod_drycontact),
+    "relay": (10, 8, mod_relay),
+    "relay_mini": (11, 8, mod_relay_mini),
+}
+
+
+class Node(object):
+    __slots__ = ("children", "keys", "entry")
+
+    def __init__(self):
+        # sub identifier >> Node, and the sub identifiers in order
+        self.children = {}
+        self.keys = []
+        self.entry = None
+
+
+class OidTrie(object):
+    # OIDs in a trie of sub identifiers: an exact lookup follows one path, the next OID of a walk
+    # (GETNEXT / GETBULK) is found from the path without scanning the OIDs before it
+    def __init__(self):
+        self.root = Node()
+        self.count = 0
+
+    def insert(self, oid, entry):
+        node = self.root
+        for sub_id in oid:
+            child = node.children.get(sub_id)
+            if child is None:
+                child = Node()
+                node.children[sub_id] = child
+                insort(node.keys, sub_id)
+            node = child
+        if node.entry is None:
+            self.count += 1
+        node.entry = entry
+
+    def get(self, oid):
+        # Return            :   entry of the OID, None if the OID is not in the trie
+        node = self.root
+        for sub_id in oid:
+            node = node.children.get(sub_id)
+            if node is None:
+                return None
+        return node.entry
+
+    def next(self, oid):
+        # Return            :   (oid, entry) of the first OID after oid in lexicographic order, None at the end
+        return self._next(self.root, tuple(oid), 0)
+
+    def _next(self, node, oid, depth):
+        if depth < len(oid):
+            child = node.children.get(oid[depth])
+            if child is not None:
+                found = self._next(child, oid, depth + 1)
+                if found is not None:
+                    return found
+            start = bisect_right(node.keys, oid[depth])
+            prefix = oid[:depth]
+        else:
+            # every OID below oid comes after it
+            start = 0
+            prefix = oid
+        for sub_id in node.keys[start:]:
+            found = self._first(node.children[sub_id], prefix + (sub_id,))
+            if found is not None:
+                return found
+        return None
+
+    def _first(self, node, prefix):
+        if node.entry is not None:
+            return prefix, node.entry
+        for sub_id in node.keys:
+            found = self._first(node.children[sub_id], prefix + (sub_id,))
+            if found is not None:
+                return found
+        return None
+
+
+class PointIndex(object):
+    def __init__(self, sys_oid, table):
+        # Arguments:
+        # sys_oid           :   tuple of the sysOID of Comm.json
+        # table             :   PointTable of the process
+        self.sys_oid = tuple(sys_oid)
+        self.table = table
+        self.trie = None
+        self.layout_version = None
+        self.refresh()
+
+    def refresh(self):
+        # Index the table again when a device or a point was added
+        if self.table.layout_version != self.layout_version:
+            self.layout_version = self.table.layout_version
+            self.trie = self.build()
+
+    def build(self):
+        # Return            :   OidTrie of the instance OIDs (".0"), entries (SETTING, None, name, None)
+        #                       or (POINT, device, key, pin)
+        trie = OidTrie()
+        for specific, name in SNMPSetting_oids.items():
+            trie.insert(self.sys_oid + (SETTINGCATEGORY,) + parse(specific) + (0,), (SETTING, None, name, None))
+
+        for device in self.table.names(point_table.MODULAR):
+            modular = modular_of_device(device)
+            if modular is None:
+                continue
+            (category, sub_id, pins), number = MODULARCATEGORIES[modular[0]], modular[1]
+            keys = set(self.table.keys(device))
+            for specific, key in pins.items():
+                if key in keys:
+                    pin_oid = parse(specific)[0]
+                    trie.insert(self.sys_oid + (category, sub_id, number, pin_oid, 0), (POINT, device, key, pin_oid // 10))
+
+        for position, device in enumerate(self.table.names(point_table.EQUIPMENT)):
+            for point, key in enumerate(self.table.keys(device)):
+                trie.insert(self.sys_oid + (EQUIPMENTCATEGORY, position, point + 1, 0), (POINT, device, key, point + 1))
+        return trie
+
+    def get(self, oid):
+        self.refresh()
+        return self.trie.get(tuple(oid))
+
+    def next(self, oid):
+        self.refresh()
+        return self.trie.next(tuple(oid))
+
+
+def parse(specific):
+    # Return            :   tuple of the sub identifiers of a RegOID key like "[10]" or "[10, 20]"
+    return tuple(int(sub_id) for sub_id in specific.strip("[]").split(","))
+
+
+def modular_of_device(device):
+    # Return            :   (type, number) of a modular device name "modular_<type>_<number>", None if unknown
+    name, _, number = device[len("modular_"):].rpartition("_")
+    if name not in MODULARCATEGORIES or not number.isdigit():
+        return None
+    return name, int(number)
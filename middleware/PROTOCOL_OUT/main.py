@@ -1,5 +1,8 @@
 import threading
 import time
+import os, sys
+# modules shared by the services, see middleware/common/README.md
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
 import pull_data_to_json
 import MODBUS_TCP_SERVER.modbus_tcp_server as modbus_tcp_server
 import SNMP_SERVER.A as snmp_server
@@ -24,6 +27,8 @@ def _process_data_subscribe(client, userdata, message):
     #protocolout_config["MODBUS_TCP"] = data["MODBUS_TCP"]
     #protocolout_config["SNMP"] = data["SNMP"]
     if data["restart"]:
+        # execl replaces the process without running atexit, the pending snapshots are written first
+        pull_data_to_json.writer.flush()
         os.execl(sys.executable, sys.executable, *sys.argv)
 
 
@@ -0,0 +1,175 @@
+import json
+import os
+import threading
+import payload_codec
+
+# Points of every device seen by PROTOCOL_OUT, shared in memory by the MQTT subscriber
+# (pull_data_to_json), the Modbus TCP server and the SNMP agent of the process.
+# A device is a group and a name:
+#   Modular     :   "modular_<type>_<number>", points in the order of the MODULAR_I2C message
+#   Equipment   :   "<type>_<number>", points in the order of the MODBUS_SNMP message
+# A point keeps its position once created, a message with new keys (split publish) appends them.
+MODULAR = "Modular"
+EQUIPMENT = "Equipment"
+GROUPS = [MODULAR, EQUIPMENT]
+# fields of a frame that are not points
+METADATA = ("PollingDuration", "Timestamp")
+# fields of the device message around its frame: the data files of the equipments held the whole
+# message before the point table, those fields are not points either
+ENVELOPE = ("device_name", "protocol_type", "comport", "modbus_address", "ip_address", "mac",
+            "value", "schema", "fields")
+
+
+class Device(object):
+    def __init__(self, group, name):
+        self.group = group
+        self.name = name
+        # point keys and values, same positions
+        self.keys = []
+        self.values = []
+        # key >> position
+        self.index = {}
+        # table version of the last change of a value of the device
+        self.version = 0
+        self.timestamp = None
+
+
+class PointTable(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        # name >> Device
+        self._devices = {}
+        # incremented when a value changes, and when a device or a point is added (layout)
+        self.version = 0
+        self.layout_version = 0
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WRITE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def update(self, group, name, frame):
+        # Arguments:
+        # group             :   MODULAR or EQUIPMENT
+        # name              :   name of the device
+        # frame             :   dictionary of the device values, METADATA and ENVELOPE fields are not points
+        # Return            :   positions of the points whose value changed
+        changed = []
+        with self._lock:
+            device = self._devices.get(name)
+            if device is None or device.group != group:
+                device = Device(group, name)
+                self._devices[name] = device
+                self.layout_version += 1
+            for key, value in frame.items():
+                if key in METADATA or key in ENVELOPE:
+                    continue
+                position = device.index.get(key)
+                if position is None:
+                    position = len(device.keys)
+                    device.index[key] = position
+                    device.keys.append(key)
+                    device.values.append(value)
+                    self.layout_version += 1
+                    changed.append(position)
+                elif device.values[position] != value or type(device.values[position]) is not type(value):
+                    device.values[position] = value
+                    changed.append(position)
+            device.timestamp = frame.get("Timestamp", device.timestamp)
+            if len(changed) != 0:
+                self.version += 1
+                device.version = self.version
+                self._changed.notify_all()
+        return changed
+
+    def load(self, group, folder, prefix=""):
+        # Seed the table with the data files of a folder (last known values at boot)
+        # Arguments:
+        # folder            :   folder of "<name>.json" files holding a dictionary of values, searched recursively.
+        #                       A file holding a whole device message (legacy) is loaded with the frame of its "value"
+        # prefix            :   only the files whose name starts with prefix
+        # Return            :   number of devices loaded
+        count = 0
+        for root, _, files in os.walk(folder):
+            for file_name in sorted(files):
+                if not file_name.endswith(".json") or not file_name.startswith(prefix):
+                    continue
+                try:
+                    with open(os.path.join(root, file_name)) as json_data:
+                        frame = json.load(json_data)
+                    if isinstance(frame, dict) and "value" in frame:
+                        frame = payload_codec.values(frame)
+                except (OSError, ValueError, TypeError) as e:
+                    print("POINT TABLE: cannot load " + file_name + ": " + str(e))
+                    continue
+                if isinstance(frame, dict):
+                    self.update(group, file_name[:-len(".json")], frame)
+                    count += 1
+        return count
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ READ ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def names(self, group):
+        # Return            :   sorted names of the devices of a group
+        with self._lock:
+            return sorted(name for name, device in self._devices.items() if device.group == group)
+
+    def keys(self, name):
+        # Return            :   point keys of a device in position order, [] for an unknown device
+        with self._lock:
+            device = self._devices.get(name)
+            return list(device.keys) if device is not None else []
+
+    def values(self, name):
+        # Return            :   point values of a device in position order, [] for an unknown device
+        with self._lock:
+            device = self._devices.get(name)
+            return list(device.values) if device is not None else []
+
+    def get(self, name):
+        # Return            :   dictionary of the points of a device, None for an unknown device
+        with self._lock:
+            device = self._devices.get(name)
+            if device is None:
+                return None
+            return dict(zip(device.keys, device.values))
+
+    def value(self, name, key, default=None):
+        with self._lock:
+            device = self._devices.get(name)
+            if device is None or key not in device.index:
+                return default
+            return device.values[device.index[key]]
+
+    def changed_since(self, version):
+        # Return            :   names of the devices with a value changed after the table version
+        with self._lock:
+            return [name for name, device in self._devices.items() if device.version > version]
+
+    def wait(self, version, timeout):
+        # Block until the table version differs from version or until timeout seconds passed
+        # Return            :   the current table version
+        with self._lock:
+            if self.version == version:
+                self._changed.wait(timeout)
+            return self.version
+
+
+_table = PointTable()
+
+
+def get_table():
+    # Return            :   the PointTable of the process
+    return _table
+
+
+def device_of_topic(topic):
+    # Arguments:
+    # topic             :   topic of a device message
+    # Return            :   (group, name) of the device, None for a topic that is not a device
+    parts = topic.split("/")
+    if len(parts) < 4:
+        return None
+    if parts[1] == "Modular":
+        return MODULAR, "modular_" + parts[2] + "_" + parts[3]
+    if parts[1] == "Smartrack":
+        return EQUIPMENT, parts[2] + "_" + parts[3]
+    if parts[1] == "2U" and len(parts) >= 5:
+        return EQUIPMENT, parts[2] + "_" + parts[4]
+    return None
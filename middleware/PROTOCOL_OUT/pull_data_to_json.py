@@ -1,47 +1,54 @@
+import atexit
 import json
 import os
 import paho.mqtt.client as mqtt
 import time
+import payload_codec
+import point_table
+import snapshot
 
 ParentFolder = os.path.abspath('..')
+# writes per second of one data file, the files are snapshots of the point table for the next boot
+# and for the other tools, not the live data
+SNAPSHOTRATE = 0.2
+
+# Last known values at boot, then every message updates the shared point table directly
+table = point_table.get_table()
+table.load(point_table.MODULAR, os.getcwd() + '/SNMP_SERVER/json/Modular', "modular_")
+table.load(point_table.EQUIPMENT, os.getcwd() + '/SNMP_SERVER/json/Equipment')
+writer = snapshot.SnapshotWriter(max_rate=SNAPSHOTRATE)
+# the snapshots still coalesced are written when the process exits
+atexit.register(writer.flush)
 
-def process_data_subscribe(client, userdata, message):
-    print("Pull data to JSON : Get Subscribe data for Modular and Equipment with topic: "+ message.topic)
-    sub_data = json.loads(message.payload)
-    #print("Pull data to JSON :" + str(sub_data))
-    type_device = message.topic.split("/")[1]
-    
-    if type_device == "Modular":
-        type_modular = message.topic.split("/")[2]
-        number_modular = message.topic.split("/")[3]
-        sub_data_value = json.loads(sub_data["value"])
-        data_modular =  list(sub_data_value.values())
-        data_modular_string =  json.dumps(data_modular)
-        with open(os.getcwd() + '/MODBUS_TCP_SERVER/JSON/Data/Modular/modular_' + str(type_modular)+ "_" + str(number_modular) + '.json' , "w") as outfile:
-            outfile.write(data_modular_string)
 
-        data_modular_string =  json.dumps(sub_data_value)
-        with open(os.getcwd() + '/SNMP_SERVER/json/Modular/' + str(type_modular)+ "/modular_" + str(type_modular) +"_" + str(number_modular) + '.json' , "w") as outfile:
-            outfile.write(data_modular_string)
-    elif type_device == "Smartrack":
-        type_equipment = message.topic.split("/")[2]
-        number_equipment = message.topic.split("/")[3]    
-        data_equipment_string =  json.dumps(sub_data)
-        with open(os.getcwd() + '/MODBUS_TCP_SERVER/JSON/Data/Equipment/' + str(type_equipment)+ "_" + str(number_equipment) + '.json' , "w") as outfile:
-            outfile.write(data_equipment_string)
-        
-        with open(os.getcwd() + '/SNMP_SERVER/json/Equipment/' + str(type_equipment)+ "_" + str(number_equipment) + '.json' , "w") as outfile:
-            outfile.write(data_equipment_string)
+def save_device(group, name):
+    # Snapshot of a device in the data files (same layout as the files read at boot)
+    data = table.get(name)
+    if group == point_table.MODULAR:
+        type_modular = name[len("modular_"):].rpartition("_")[0]
+        writer.write(os.getcwd() + '/MODBUS_TCP_SERVER/JSON/Data/Modular/' + name + '.json', list(data.values()))
+        writer.write(os.getcwd() + '/SNMP_SERVER/json/Modular/' + type_modular + '/' + name + '.json', data)
+    else:
+        writer.write(os.getcwd() + '/MODBUS_TCP_SERVER/JSON/Data/Equipment/' + name + '.json', data)
+        writer.write(os.getcwd() + '/SNMP_SERVER/json/Equipment/' + name + '.json', data)
 
-    elif type_device == "2U":
-        type_equipment = message.topic.split("/")[2]
-        number_equipment = message.topic.split("/")[4]    
-        data_equipment_string =  json.dumps(sub_data)
-        with open(os.getcwd() + '/MODBUS_TCP_SERVER/JSON/Data/Equipment/' + str(type_equipment)+ "_" + str(number_equipment) + '.json' , "w") as outfile:
-            outfile.write(data_equipment_string)
-        
-        with open(os.getcwd() + '/SNMP_SERVER/json/Equipment/' + str(type_equipment)+ "_" + str(number_equipment) + '.json' , "w") as outfile:
-            outfile.write(data_equipment_string)
+def process_data_subscribe(client, userdata, message):
+    print("Pull data to JSON : Get Subscribe data for Modular and Equipment with topic: "+ message.topic)
+    device = point_table.device_of_topic(message.topic)
+    if device is None:
+        return
+    try:
+        sub_data = payload_codec.loads(message.payload)
+        sub_data_value = payload_codec.values(sub_data)
+    except (ValueError, KeyError, TypeError) as e:
+        print("Pull data to JSON : cannot decode " + message.topic + ": " + str(e))
+        return
+    if not isinstance(sub_data_value, dict):
+        # array frame of a schema not announced yet
+        return
+    group, name = device
+    if len(table.update(group, name, sub_data_value)) != 0:
+        save_device(group, name)
 
 
 Subsclient = mqtt.Client("pull_data_to_json")
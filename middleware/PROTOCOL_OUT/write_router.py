@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+from time import strftime, localtime
+import node_identity
+import point_table
+
+# Routing of a value written by a Modbus or SNMP client to the control topic of the device that owns the point.
+# The installed devices of MODULAR_I2C and MODBUS_SNMP and the device library are indexed once by device name
+# (the names of point_table), and indexed again only when one of the files changed.
+
+
+class WriteRouter(object):
+    def __init__(self, parent_folder):
+        # Arguments:
+        # parent_folder     :   folder of the services (MODULAR_I2C, MODBUS_SNMP, ...)
+        self.modular_devices = parent_folder + '/MODULAR_I2C/JSON/Config/installed_devices.json'
+        self.modular_mqtt = parent_folder + '/MODULAR_I2C/JSON/Config/mqtt_config.json'
+        self.equipment_devices = parent_folder + '/MODBUS_SNMP/JSON/Config/installed_devices.json'
+        self.equipment_mqtt = parent_folder + '/MODBUS_SNMP/JSON/Config/mqtt_config.json'
+        self.library = parent_folder + '/MODBUS_SNMP/JSON/Config/Library/devices.json'
+        self._lock = threading.Lock()
+        self._signature = None
+        # device name >> route
+        self.routes = {}
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ INDEX ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def signature(self):
+        result = []
+        for path in [self.modular_devices, self.modular_mqtt, self.equipment_devices, self.equipment_mqtt, self.library]:
+            try:
+                stat = os.stat(path)
+                result.append((stat.st_mtime, stat.st_size))
+            except OSError:
+                result.append(None)
+        return tuple(result)
+
+    def refresh(self):
+        # Index the config files again if one of them changed
+        signature = self.signature()
+        if signature == self._signature:
+            return
+        try:
+            routes = self.build()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # a file being written is read again on the next write
+            print("ROUTER: cannot index the installed devices: " + str(e))
+            return
+        self.routes = routes
+        self._signature = signature
+
+    def build(self):
+        # Return            :   dictionary of device name and route
+        routes = {}
+        with open(self.modular_devices) as json_data:
+            list_modular = json.load(json_data)
+        with open(self.modular_mqtt) as json_data:
+            topic_modular = json.load(json_data)["sub_topic_modular"]
+        for item in list_modular:
+            device = point_table.device_of_topic(item["profile"]["topic"])
+            if device is None:
+                continue
+            routes[device[1]] = {
+                "group": point_table.MODULAR,
+                "topic": topic_modular,
+                "device": item["profile"]["part_number"],
+                "address": item["protocol_setting"]["address"],
+                "device_bus": item["protocol_setting"]["device_bus"],
+            }
+
+        with open(self.equipment_devices) as json_data:
+            list_equipment = json.load(json_data)
+        with open(self.equipment_mqtt) as json_data:
+            topic_equipment = json.load(json_data)["sub_topic_modbusRTU"]
+        with open(self.library) as json_data:
+            list_device_equipment = json.load(json_data)
+        for item in list_equipment:
+            device = point_table.device_of_topic(item["profile"]["topic"])
+            if device is None:
+                continue
+            protocol_setting = item["protocol_setting"]
+            # var_name >> (relative_address, data_type) of the part number
+            variables = {}
+            for library_item in list_device_equipment.get(item["profile"]["device_type"], []):
+                if library_item["part_number"] == item["profile"]["part_number"]:
+                    for data_item in library_item["data"]:
+                        variables[data_item["var_name"]] = (data_item["relative_address"], data_item["data_type"])
+            routes[device[1]] = {
+                "group": point_table.EQUIPMENT,
+                "topic": topic_equipment,
+                "protocol_type": protocol_setting["protocol"],
+                "port": protocol_setting.get("port"),
+                "baudrate": protocol_setting.get("baudrate"),
+                "parity": protocol_setting.get("parity"),
+                "bytesize": protocol_setting.get("bytesize"),
+                "stop_bit": protocol_setting.get("stop_bit"),
+                "timeout": protocol_setting.get("timeout"),
+                "endianness": protocol_setting.get("endianness"),
+                "number_address": protocol_setting.get("address"),
+                "variables": variables,
+            }
+        return routes
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ROUTE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def message(self, device, key, pin, value):
+        # Arguments:
+        # device            :   device name of the point table
+        # key               :   point key
+        # pin               :   position of the point in the device from 1, the pin of a modular
+        # value             :   value written by the client
+        # Return            :   (topic, control message) of the write, None for a device that is not installed
+        with self._lock:
+            self.refresh()
+            route = self.routes.get(device)
+        if route is None:
+            return None
+        if route["group"] == point_table.MODULAR:
+            send_msg = {
+                "mac": node_identity.mac(),
+                "protocol_type": "Modular",
+                "device": route["device"],
+                "function": "write",
+                "value": {"pin": int(pin), "data": value},
+                "address": route["address"],
+                "device_bus": route["device_bus"],
+                "Timestamp": strftime("%Y-%m-%d %H:%M:%S", localtime())
+            }
+        else:
+            register, data_type = route["variables"].get(key, (0, ""))
+            send_msg = {
+                "mac": node_identity.mac(),
+                "protocol_type": route["protocol_type"],
+                "port": route["port"],
+                "baudrate": route["baudrate"],
+                "parity": route["parity"],
+                "bytesize": route["bytesize"],
+                "stop_bit": route["stop_bit"],
+                "timeout": route["timeout"],
+                "endianness": route["endianness"],
+                "number_address": route["number_address"],
+                "value": {"address": register, "value": value},
+                "data_type": data_type,
+                "Timestamp": strftime("%Y-%m-%d %H:%M:%S", localtime())
+            }
+        return route["topic"], send_msg
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router(parent_folder):
+    # Return            :   the WriteRouter of the process, created on first use
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = WriteRouter(parent_folder)
+    return _router
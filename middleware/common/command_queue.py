@@ -0,0 +1,84 @@
+import json
+import queue
+import threading
+import traceback
+
+# Control commands of the pollers: the MQTT callback of a service routes every command to the queue
+# of the poller owning it, the polling thread runs them between its polls.
+
+# Maximum number of control commands waiting for one poller
+MAXCOMMANDS = 100
+
+
+class CommandQueue(object):
+    # Thread-safe queue of MQTT control commands, filled by paho's network thread
+    # and drained by the polling thread between two scheduled polls (device, register group)
+    def __init__(self, maxsize=MAXCOMMANDS):
+        self.queue = queue.Queue(maxsize)
+
+    def put(self, topic, data):
+        try:
+            self.queue.put_nowait((topic, data))
+            return True
+        except queue.Full:
+            print("CONTROL: command queue full, command on " + topic + " dropped")
+            return False
+
+    def drain(self, handler, timeout=0):
+        # Arguments:
+        # handler           :   callable(topic, data) running one command
+        # timeout           :   seconds to wait for a first command, 0 to only run what is already queued
+        # Return            :   number of commands handled
+
+        handled = 0
+        while True:
+            try:
+                if handled == 0 and timeout > 0:
+                    topic, data = self.queue.get(timeout=timeout)
+                else:
+                    topic, data = self.queue.get_nowait()
+            except queue.Empty:
+                return handled
+            try:
+                handler(topic, data)
+            except Exception:
+                print(traceback.format_exc())
+            handled += 1
+
+
+class CommandRouter(object):
+    # MQTT on_message callback dispatching every control command to the queue of its poller
+    def __init__(self, key, on_unknown=None):
+        # Arguments:
+        # key               :   field of the command payload naming the poller, e.g. "port" or "ip_address"
+        # on_unknown        :   callable(topic, data) for commands no poller of this process owns
+        self.key = key
+        self.on_unknown = on_unknown
+        self.queues = {}
+        self._lock = threading.Lock()
+
+    def register(self, owner):
+        # Return            :   CommandQueue of owner (comport, ip address, ...)
+        with self._lock:
+            if owner not in self.queues:
+                self.queues[owner] = CommandQueue()
+            return self.queues[owner]
+
+    def unregister(self, owner, commands):
+        # Remove the queue of a stopped poller, unless a new poller of the same owner registered it again
+        with self._lock:
+            if self.queues.get(owner) is commands:
+                del self.queues[owner]
+
+    def on_message(self, client, userdata, message):
+        try:
+            data = json.loads(message.payload)
+        except Exception as e:
+            print("CONTROL: invalid command on " + message.topic + ": " + str(e))
+            return
+        with self._lock:
+            commands = self.queues.get(data.get(self.key)) if isinstance(data, dict) else None
+        if commands is not None:
+            commands.put(message.topic, data)
+        elif self.on_unknown is not None:
+            self.on_unknown(message.topic, data)
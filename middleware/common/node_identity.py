@@ -0,0 +1,132 @@
+import fcntl
+import getmac
+import socket
+import struct
+import threading
+import time
+
+# Identity of this node (MAC address, hostname, interface IPs), resolved once and shared by every
+# publisher and control-command matcher of the process instead of calling getmac on every message.
+#
+# A netlink socket (Linux) marks the cache stale when a link or an address changes, the next
+# read resolves it again. Without netlink the cache is refreshed every REFRESHINTERVAL seconds.
+REFRESHINTERVAL = 300
+
+# rtnetlink multicast groups: RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR
+NETLINK_GROUPS = 0x1 | 0x10 | 0x100
+# ioctl reading the IPv4 address of an interface
+SIOCGIFADDR = 0x8915
+
+
+def interface_ips():
+    # Return            :   dictionary of interface name and IPv4 address, interfaces without address are left out
+    ips = {}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        for _, name in socket.if_nameindex():
+            try:
+                request = struct.pack("256s", name[:15].encode())
+                ips[name] = socket.inet_ntoa(fcntl.ioctl(sock.fileno(), SIOCGIFADDR, request)[20:24])
+            except OSError:
+                pass
+    finally:
+        sock.close()
+    return ips
+
+
+class NodeIdentity(object):
+    def __init__(self, refresh_interval=REFRESHINTERVAL):
+        # Arguments:
+        # refresh_interval  :   seconds before the cache is resolved again when netlink is not available
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._identity = None
+        self._resolved = 0.0
+        self._stale = True
+        self._netlink = self._watch()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ NETLINK ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def _watch(self):
+        # Return            :   True if interface changes are watched with netlink
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, NETLINK_GROUPS))
+        except (AttributeError, OSError):
+            return False
+        thread = threading.Thread(target=self._netlink_loop, args=[sock], name="node-identity")
+        thread.setDaemon(True)
+        thread.start()
+        return True
+
+    def _netlink_loop(self, sock):
+        while True:
+            try:
+                sock.recv(65536)
+            except OSError:
+                # netlink lost (buffer overrun, closed): fall back to the refresh interval
+                self._netlink = False
+                self._stale = True
+                return
+            self._stale = True
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ IDENTITY ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def resolve(self):
+        # Return            :   {"mac", "hostname", "ips"} read from the system now
+        return {
+            "mac": getmac.get_mac_address(),
+            "hostname": socket.gethostname(),
+            "ips": interface_ips(),
+        }
+
+    def get(self):
+        # Return            :   cached {"mac", "hostname", "ips"}, resolved again after an interface change
+        with self._lock:
+            expired = not self._netlink and time.monotonic() - self._resolved >= self.refresh_interval
+            if self._identity is None or self._stale or expired:
+                # cleared before resolving: a change during resolve() marks the cache stale again
+                self._stale = False
+                try:
+                    self._identity = self.resolve()
+                except Exception as e:
+                    print("NODE: cannot resolve the node identity: " + str(e))
+                    if self._identity is None:
+                        self._identity = {"mac": None, "hostname": socket.gethostname(), "ips": {}}
+                self._resolved = time.monotonic()
+            return self._identity
+
+    def mac(self):
+        return self.get()["mac"]
+
+    def is_local_mac(self, mac):
+        # Return            :   True when mac (any case) is the MAC address of this node
+        local = self.mac()
+        return local is not None and isinstance(mac, str) and mac.lower() == local.lower()
+
+
+_identity = None
+_identity_lock = threading.Lock()
+
+
+def get_identity():
+    # Return            :   the NodeIdentity of the process, created on first use
+    global _identity
+    with _identity_lock:
+        if _identity is None:
+            _identity = NodeIdentity()
+    return _identity
+
+
+def mac():
+    return get_identity().mac()
+
+
+def hostname():
+    return get_identity().get()["hostname"]
+
+
+def ips():
+    return get_identity().get()["ips"]
+
+
+def is_local_mac(mac):
+    return get_identity().is_local_mac(mac)
@@ -0,0 +1,164 @@
+import json
+import threading
+import zlib
+
+# Encoding of the "value" of a device message, selected with "payload_format" in mqtt_config.json.
+# Decoding needs no configuration: the format is recognised from the payload itself.
+#
+# "json"        :   legacy, "value" is the frame as a JSON string (JSON inside JSON)
+# "flat"        :   "value" is the frame as a JSON object, one json.loads for the whole message
+# "array"       :   "value" is the list of the frame values, "schema" is the id of the field order.
+#                   The field names are sent in "fields" with the first message of a schema and
+#                   then every SCHEMAREPEAT messages, a decoder skips frames of a schema it has not seen yet
+# "msgpack"     :   the whole message is MessagePack, "value" is a map (needs the msgpack package)
+# "cbor"        :   the whole message is CBOR, "value" is a map (needs the cbor2 package)
+JSON = "json"
+FLAT = "flat"
+ARRAY = "array"
+MSGPACK = "msgpack"
+CBOR = "cbor"
+FORMATS = [JSON, FLAT, ARRAY, MSGPACK, CBOR]
+SCHEMAREPEAT = 10
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+
+def schema_id(fields):
+    # Return            :   id of a field order, crc32 of the field names in hexadecimal
+    return "%08x" % zlib.crc32("\n".join(fields).encode())
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ ENCODER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+class Encoder(object):
+    def __init__(self, fmt=JSON, schema_repeat=SCHEMAREPEAT):
+        # Arguments:
+        # fmt               :   one of FORMATS
+        # schema_repeat     :   messages of the "array" format between two messages carrying the field names
+        if fmt not in FORMATS:
+            print("PAYLOAD: unknown payload_format %s, using %s" % (fmt, JSON))
+            fmt = JSON
+        if (fmt == MSGPACK and msgpack is None) or (fmt == CBOR and cbor2 is None):
+            print("PAYLOAD: %s is not installed, using %s" % (fmt, FLAT))
+            fmt = FLAT
+        self.format = fmt
+        self.schema_repeat = schema_repeat
+        # topic >> (schema id, messages sent since the field names)
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def value(self, topic, frame):
+        # Arguments:
+        # topic             :   topic of the message, the field names of "array" are repeated per topic
+        # frame             :   dictionary of the device values
+        # Return            :   dictionary of the fields to add to the message
+        if self.format == JSON:
+            return {"value": json.dumps(frame)}
+        if self.format != ARRAY:
+            return {"value": frame}
+
+        fields = list(frame)
+        schema = schema_id(fields)
+        with self._lock:
+            last, count = self._schemas.get(topic, (None, 0))
+            announce = last != schema or count >= self.schema_repeat
+            self._schemas[topic] = (schema, 1 if announce else count + 1)
+        result = {"schema": schema, "value": [frame[field] for field in fields]}
+        if announce:
+            result["fields"] = fields
+        return result
+
+    def dumps(self, message):
+        # Return            :   payload of the message, str for the JSON formats, bytes for the binary ones
+        if self.format == MSGPACK:
+            return msgpack.packb(message, use_bin_type=True)
+        if self.format == CBOR:
+            return cbor2.dumps(message)
+        return json.dumps(message)
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(mqtt_config):
+    # Return            :   the shared Encoder of the "payload_format" of the MQTT config
+    fmt = mqtt_config.get("payload_format", JSON)
+    with _encoders_lock:
+        encoder = _encoders.get(fmt)
+        if encoder is None:
+            encoder = Encoder(fmt)
+            _encoders[fmt] = encoder
+    return encoder
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ DECODER ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+def loads(payload):
+    # Arguments:
+    # payload           :   bytes or str of an MQTT message
+    # Return            :   the decoded message, ValueError when it is not a message of a known format
+    if isinstance(payload, (bytes, bytearray)) and len(payload) != 0:
+        first = payload[0]
+        # maps: MessagePack fixmap / map16 / map32, CBOR major type 5. A JSON text never starts with these bytes
+        if 0x80 <= first <= 0x8f or first in (0xde, 0xdf):
+            if msgpack is None:
+                raise ValueError("MessagePack payload but msgpack is not installed")
+            return msgpack.unpackb(payload, raw=False)
+        if 0xa0 <= first <= 0xbf:
+            if cbor2 is None:
+                raise ValueError("CBOR payload but cbor2 is not installed")
+            return cbor2.loads(payload)
+        payload = payload.decode()
+    return json.loads(payload)
+
+
+class Decoder(object):
+    def __init__(self):
+        # schema id >> field names, learnt from the messages of the "array" format
+        self.schemas = {}
+
+    def values(self, message):
+        # Arguments:
+        # message           :   message returned by loads()
+        # Return            :   dictionary of the device values, None for an "array" frame of an unknown schema.
+        #                       ValueError when "value" is a text that is not JSON (status messages)
+        value = message["value"]
+        if isinstance(value, str):
+            return json.loads(value)
+        if isinstance(value, list) and "schema" in message:
+            fields = message.get("fields")
+            if fields is not None:
+                self.schemas[message["schema"]] = fields
+            else:
+                fields = self.schemas.get(message["schema"])
+                if fields is None:
+                    return None
+            return dict(zip(fields, value))
+        return value
+
+
+_decoder = Decoder()
+
+
+def values(message):
+    # values() of the shared Decoder of the process
+    return _decoder.values(message)
+
+
+def legacy(message):
+    # Return            :   the message in the "json" format, for the consumers that store it as it is
+    if isinstance(message["value"], str):
+        return message
+    data = values(message)
+    if data is None:
+        return None
+    result = {key: value for key, value in message.items() if key not in ("schema", "fields")}
+    result["value"] = json.dumps(data)
+    return result
@@ -0,0 +1,218 @@
+import atexit
+import json
+import os
+import threading
+import time
+
+# Snapshots of files still read by other tools (last data, data files of the protocols, settings).
+# A snapshot is written to "<path>.tmp" and renamed over the file, so a reader opens either the
+# previous or the new content, never a truncated one. Bursts of writes to one file are coalesced:
+# a file is written at most max_rate times per second with its latest content, and not written at
+# all when its content did not change.
+#
+# fsync policy of a snapshot before its rename:
+#   FSYNC_ALWAYS    :   file and folder, the snapshot survives a power cut (settings)
+#   FSYNC_INTERVAL  :   file at most every fsync_interval seconds, less flash wear for frequent data
+#   FSYNC_NEVER     :   rename only, atomic for readers, written back by the kernel
+FSYNC_ALWAYS = "always"
+FSYNC_INTERVAL = "interval"
+FSYNC_NEVER = "never"
+
+# writes per second of one file
+MAXRATE = 1.0
+FSYNCINTERVAL = 60.0
+
+
+def serialize(data):
+    # Return            :   bytes of a snapshot, data that is not str or bytes is written as JSON
+    if isinstance(data, bytes):
+        return data
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    return data.encode()
+
+
+def atomic_write(path, data, fsync=FSYNC_ALWAYS):
+    # Arguments:
+    # path              :   file to replace
+    # data              :   str, bytes or JSON serialisable content
+    # fsync             :   FSYNC_ALWAYS or FSYNC_NEVER (FSYNC_INTERVAL is decided by the SnapshotWriter)
+    with open(path + ".tmp", "wb") as outfile:
+        outfile.write(serialize(data))
+        if fsync != FSYNC_NEVER:
+            outfile.flush()
+            os.fsync(outfile.fileno())
+    os.replace(path + ".tmp", path)
+    if fsync == FSYNC_ALWAYS:
+        folder = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(folder)
+        finally:
+            os.close(folder)
+
+
+class SnapshotWriter(object):
+    def __init__(self, max_rate=MAXRATE, fsync=FSYNC_INTERVAL, fsync_interval=FSYNCINTERVAL):
+        # Arguments:
+        # max_rate          :   writes per second of one file, the content of the writes in between is coalesced
+        # fsync             :   fsync policy FSYNC_ALWAYS, FSYNC_INTERVAL or FSYNC_NEVER
+        # fsync_interval    :   seconds between two fsync of a file with FSYNC_INTERVAL
+        self.period = 1.0 / max_rate
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._pending = threading.Condition(self._lock)
+        # held from taking pending content to its write: flush() and the writer thread never share a ".tmp",
+        # and an older content taken by one is never written after a newer one taken by the other
+        self._write_lock = threading.Lock()
+        # path >> content waiting for its write
+        self.pending = {}
+        # path >> (time of the last write, time of the last fsync, content written)
+        self.written = {}
+        self.thread = None
+        self.stats = {"requested": 0, "written": 0, "unchanged": 0, "errors": 0}
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ WRITE ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
+    def write(self, path, data):
+        # Queue the content of a file, returns at once
+        # Arguments:
+        # path              :   file to replace
+        # data              :   str, bytes or JSON serialisable content, serialised now
+        content = serialize(data)
+        with self._lock:
+            self.stats["requested"] += 1
+            self.pending[path] = content
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="snapshot_writer")
+                self.thread.setDaemon(True)
+                self.thread.start()
+            self._pending.notify()
+
+    def flush(self):
+        # Write every pending content now, whatever its rate, after the write in progress
+        with self._write_lock:
+            with self._lock:
+                pending, self.pending = self.pending, {}
+            for path, content in pending.items():
+                self._write_file(path, content)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                due, wait = self._due(time.monotonic(), pop=False)
+                if len(due) == 0:
+                    self._pending.wait(wait)
+                    continue
+            with self._write_lock:
+                # taken again: a flush() may have written them meanwhile
+                with self._lock:
+                    due, wait = self._due(time.monotonic())
+                for path, content in due:
+                    self._write_file(path, content)
+
+    def _due(self, now, pop=True):
+        # Arguments:
+        # pop               :   False to leave the due content pending
+        # Return            :   (path, content) to write now, seconds until the next one is due (None: nothing pending)
+        due = []
+        wait = None
+        for path in list(self.pending):
+            written = self.written.get(path)
+            next_time = written[0] + self.period if written is not None else now
+            if next_time <= now:
+                due.append((path, self.pending.pop(path) if pop else self.pending[path]))
+            elif wait is None or next_time - now < wait:
+                wait = next_time - now
+        return due, wait
+
+    def _write_file(self, path, content):
+        now = time.monotonic()
+        last_write, last_fsync, last_content = self.written.get(path, (None, None, None))
+        if content == last_content:
+            with self._lock:
+                self.stats["unchanged"] += 1
+            return
+        if self.fsync == FSYNC_INTERVAL:
+            fsync = FSYNC_NEVER
+            if last_fsync is None or now - last_fsync >= self.fsync_interval:
+                fsync, last_fsync = FSYNC_INTERVAL, now
+        else:
+            fsync = self.fsync
+        try:
+            atomic_write(path, content, fsync)
+        except OSError as e:
+            print("SNAPSHOT: cannot write " + path + ": " + str(e))
+            with self._lock:
+                self.stats["errors"] += 1
+            return
+        with self._lock:
+            self.written[path] = (now, last_fsync, content)
+            self.stats["written"] += 1
+
+
+class CachedLoader(object):
+    # Reader of the snapshots: a file is parsed again only when its mtime, size or inode changed,
+    # a read that cannot be parsed keeps the last content parsed
+    def __init__(self, parse=json.loads):
+        # Arguments:
+        # parse             :   function parsing the text of a file
+        self.parse = parse
+        self._lock = threading.Lock()
+        # path >> (signature, content)
+        self.cache = {}
+
+    def load(self, path, default=None):
+        # Return            :   parsed content of path, default if it was never read successfully
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return self._cached(path, default)
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            cached = self.cache.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        try:
+            with open(path) as infile:
+                content = self.parse(infile.read())
+        except (OSError, ValueError) as e:
+            print("SNAPSHOT: cannot read " + path + ": " + str(e))
+            with self._lock:
+                if cached is None:
+                    return default
+                # not parsed again before the file changes
+                self.cache[path] = (signature, cached[1])
+            return cached[1]
+        with self._lock:
+            self.cache[path] = (signature, content)
+        return content
+
+    def _cached(self, path, default):
+        with self._lock:
+            cached = self.cache.get(path)
+        return cached[1] if cached is not None else default
+
+
+_writer = None
+_loader = None
+_lock = threading.Lock()
+
+
+def get_writer():
+    # Return            :   the SnapshotWriter of the process (MAXRATE, FSYNC_INTERVAL), created on first use
+    #                       and flushed when the process exits
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = SnapshotWriter()
+            atexit.register(_writer.flush)
+    return _writer
+
+
+def get_loader():
+    # Return            :   the CachedLoader of the process
+    global _loader
+    with _lock:
+        if _loader is None:
+            _loader = CachedLoader()
+    return _loader